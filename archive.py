@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+from bisect import insort
+
+# Metrics of evaluate_plan.calculate_metrics, named like their entries of the weight in teams.json
+METRIC_NAMES = ('amount_consecutive_matches', 'distribution_home_away_matches', 'amount_please_dont_play_dates',
+                'distribution_game_days')
+
+
+def encode_fixtures(fixtures):
+    """
+    Packs fixtures into two bytes per number, sorted so that the same plan always has the same encoding
+    :param fixtures: list of (date index, home team index, away team index)
+    :return: bytes
+    """
+    return array('H', [number for fixture in sorted(fixtures) for number in fixture]).tobytes()
+
+
+def decode_fixtures(encoded):
+    """
+    Reverse of encode_fixtures
+    :return: list of (date index, home team index, away team index) sorted by date
+    """
+    numbers = array('H')
+    numbers.frombytes(encoded)
+    return [tuple(numbers[index:index + 3]) for index in range(0, len(numbers), 3)]
+
+
+def get_plan_hash(encoded):
+    """
+    :param encoded: fixtures of encode_fixtures
+    :return: hex digest which identifies the plan
+    """
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def fixtures_to_names(problem, fixtures):
+    """
+    Fixtures as written to files, independent of the order of the teams and match dates of a problem
+    :param fixtures: list of (date index, home team index, away team index)
+    :return: list of [date as string, home team name, away team name]
+    """
+    return [[problem.match_dates[date_index].strftime('%Y-%m-%d'), problem.team_names[home], problem.team_names[away]]
+            for date_index, home, away in fixtures]
+
+
+def fixtures_from_names(problem, named_fixtures):
+    """
+    Reverse of fixtures_to_names
+    :raises KeyError: if a date is no match date or a team is unknown
+    """
+    date_index = {match_date.strftime('%Y-%m-%d'): index for index, match_date in enumerate(problem.match_dates)}
+    team_index = {name: index for index, name in enumerate(problem.team_names)}
+    return [(date_index[match_date], team_index[home], team_index[away]) for match_date, home, away in named_fixtures]
+
+
+class PlanArchive:
+    """
+    Bounded archive of the best distinct match plans of a search. Plans are kept as encoded fixtures instead of team
+    instances and are identified by a hash of the encoding, so a plan found by several attempts is kept only once.
+    Archives of different batches or worker processes are combined with merge, the plans kept do not depend on the
+    order of the merges.
+    """
+
+    def __init__(self, capacity, filename=None):
+        """
+        :param capacity: maximum number of plans
+        :param filename: file written by write, None for an archive which is only kept in memory
+        """
+        self.capacity = capacity
+        self.filename = filename
+        self.entries = []  # sorted [score, hash, encoded fixtures, iteration, attempt seed]
+        self.hashes = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def accepts(self, score):
+        """
+        :return: False if a plan with this score would not be archived, to skip its encoding
+        """
+        return len(self.entries) < self.capacity or score <= self.entries[-1][0]
+
+    def add(self, score, fixtures, iteration=None, seed=None):
+        """
+        :param fixtures: list of (date index, home team index, away team index)
+        :return: True if the archive changed
+        """
+        if not self.accepts(score):
+            return False
+        encoded = encode_fixtures(fixtures)
+        return self._add_entry([score, get_plan_hash(encoded), encoded, iteration, seed])
+
+    def merge(self, other):
+        """
+        Adds the plans of another archive
+        :return: True if the archive changed
+        """
+        changed = False
+        for entry in other.entries:
+            if self.accepts(entry[0]):
+                changed = self._add_entry(list(entry)) or changed
+        return changed
+
+    def _add_entry(self, entry):
+        if entry[1] in self.hashes:
+            return False
+        insort(self.entries, entry, key=lambda item: (item[0], item[1]))
+        self.hashes.add(entry[1])
+        if len(self.entries) > self.capacity:
+            self.hashes.discard(self.entries.pop()[1])
+            return entry[1] in self.hashes
+        return True
+
+    def plans(self):
+        """
+        :return: list of (score, fixtures, iteration, attempt seed) with the best plan first
+        """
+        return [(score, decode_fixtures(encoded), iteration, seed)
+                for score, _, encoded, iteration, seed in self.entries]
+
+    def write(self, problem):
+        """
+        Writes the archive to its file as newline-delimited JSON, one plan per line with the best plan first
+        :param problem: league of the plans, see problem.Problem
+        """
+        if self.filename is None:
+            return
+        _write_ndjson(self.filename, [{'rank': rank, 'score': score, 'hash': plan_hash, 'iteration': iteration,
+                                       'seed': seed, 'fixtures': fixtures_to_names(problem, decode_fixtures(encoded))}
+                                      for rank, (score, plan_hash, encoded, iteration, seed)
+                                      in enumerate(self.entries, 1)])
+
+
+def dominates(first, second):
+    """
+    :return: True if the metrics first are nowhere worse and at least once better than the metrics second
+    """
+    return all(a <= b for a, b in zip(first, second)) and first != second
+
+
+def get_weighted_score(weight, metrics):
+    return sum(value * weight[name] for name, value in zip(METRIC_NAMES, metrics))
+
+
+class ParetoFront:
+    """
+    Match plans which are not dominated by another plan of the search in the four metrics of calculate_score, so that
+    the best plan for any weight can be chosen after the search. Plans are kept as encoded fixtures like in
+    PlanArchive, of several plans with the same metrics only the one with the lowest hash is kept, so the plans kept
+    do not depend on the order in which fronts of different batches or worker processes are merged.
+    """
+
+    def __init__(self, filename=None):
+        """
+        :param filename: file written by write, None for a front which is only kept in memory
+        """
+        self.filename = filename
+        self.entries = []  # [metrics, hash, encoded fixtures, iteration, attempt seed] sorted by metrics
+
+    def __len__(self):
+        return len(self.entries)
+
+    def accepts(self, metrics):
+        """
+        :return: False if a plan with these metrics would not be added, to skip its encoding
+        """
+        return not any(dominates(entry[0], metrics) for entry in self.entries)
+
+    def add(self, metrics, fixtures, iteration=None, seed=None):
+        """
+        :param metrics: metrics of evaluate_plan.calculate_metrics
+        :param fixtures: list of (date index, home team index, away team index)
+        :return: True if the front changed
+        """
+        metrics = tuple(metrics)
+        if not self.accepts(metrics):
+            return False
+        encoded = encode_fixtures(fixtures)
+        return self._add_entry([metrics, get_plan_hash(encoded), encoded, iteration, seed])
+
+    def merge(self, other):
+        """
+        Adds the plans of another front
+        :return: True if the front changed
+        """
+        changed = False
+        for entry in other.entries:
+            changed = self._add_entry(list(entry)) or changed
+        return changed
+
+    def _add_entry(self, entry):
+        for other in self.entries:
+            if dominates(other[0], entry[0]) or (other[0] == entry[0] and other[1] <= entry[1]):
+                return False
+        self.entries = [other for other in self.entries
+                        if other[0] != entry[0] and not dominates(entry[0], other[0])]
+        self.entries.append(entry)
+        self.entries.sort(key=lambda item: (item[0], item[1]))
+        return True
+
+    def plans(self):
+        """
+        :return: list of (metrics, fixtures, iteration, attempt seed)
+        """
+        return [(metrics, decode_fixtures(encoded), iteration, seed)
+                for metrics, _, encoded, iteration, seed in self.entries]
+
+    def write(self, problem):
+        """
+        Writes the front to its file as newline-delimited JSON, one plan per line, see PlanArchive.write
+        :param problem: league of the plans, see problem.Problem
+        """
+        if self.filename is None:
+            return
+        _write_ndjson(self.filename, [{'metrics': dict(zip(METRIC_NAMES, metrics)), 'hash': plan_hash,
+                                       'iteration': iteration, 'seed': seed,
+                                       'fixtures': fixtures_to_names(problem, decode_fixtures(encoded))}
+                                      for metrics, plan_hash, encoded, iteration, seed in self.entries])
+
+
+def read_front(filename):
+    """
+    :param filename: front written by ParetoFront.write
+    :return: list of plans as dict with metrics, hash, iteration, seed and fixtures
+    """
+    with open(filename, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _write_ndjson(filename, lines):
+    """
+    Replaces a file at once with one JSON object per line, so a reader never sees a partly written file
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+        for line in lines:
+            file.write(json.dumps(line, ensure_ascii=False) + "\n")
+    os.replace(temp_filename, filename)
@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from main import read_settings, schedule_league_with_cache
+from evaluate_plan import match_plan_to_rows, write_report_csv
+from problem import Problem
+from archive import PlanArchive, ParetoFront
+from utils import format_table
+
+SUMMARY_HEADERS = ["Liga", "Vereine", "Status", "Score", "Seed", "Sekunden"]
+
+
+def read_league_files(source):
+    """
+    :param source: directory with one teams.json per league or manifest file with a JSON list of league files,
+                   relative paths are relative to the manifest
+    :return: list of paths of the league files
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith('.json'))
+    with open(source) as file:
+        manifest = json.load(file)
+    folder = os.path.dirname(os.path.abspath(source))
+    return [path if os.path.isabs(path) else os.path.join(folder, path) for path in manifest]
+
+
+def get_league_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_venues(parsed_json):
+    """
+    Venue of every team, given by the optional 'venue' entry of a team. Teams without venue use their name, so
+    that teams with the same name in different leagues share their venue.
+    :return: dict of team name to venue
+    """
+    return {team_name: team.get('venue', team_name) for team_name, team in parsed_json['teams'].items()}
+
+
+def group_leagues_by_venue(league_files):
+    """
+    Groups leagues which are connected by shared venues. The leagues of a group have to be scheduled one after the
+    other, different groups are independent. A league file which can not be read forms its own group, its error is
+    reported by schedule_league_file.
+    :return: list of groups, each a list of league files in the given order
+    """
+    venues = []
+    for path in league_files:
+        try:
+            with open(path) as file:
+                venues.append(set(get_venues(json.load(file)).values()))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            venues.append(set())
+
+    group_of_league = list(range(len(league_files)))
+
+    def _find(league):
+        while group_of_league[league] != league:
+            group_of_league[league] = group_of_league[group_of_league[league]]
+            league = group_of_league[league]
+        return league
+
+    league_of_venue = {}
+    for league, league_venues in enumerate(venues):
+        for venue in league_venues:
+            if venue in league_of_venue:
+                group_of_league[_find(league)] = _find(league_of_venue[venue])
+            else:
+                league_of_venue[venue] = league
+
+    groups = {}
+    for league, path in enumerate(league_files):
+        groups.setdefault(_find(league), []).append(path)
+    return list(groups.values())
+
+
+def remove_booked_venue_dates(parsed_json, booked_dates):
+    """
+    Removes the dates on which a venue is already booked by another league from the home dates of its teams
+    :param booked_dates: dict of venue to set of dates as string
+    """
+    for team_name, venue in get_venues(parsed_json).items():
+        if venue in booked_dates:
+            team = parsed_json['teams'][team_name]
+            team['available_dates_home_matches'] = [date for date in team['available_dates_home_matches']
+                                                    if date not in booked_dates[venue]]
+
+
+def schedule_league_file(path, output_folder, booked_dates):
+    """
+    Schedules a single league and writes spielplan.csv, bericht.txt, log.txt and the optional archive of the best plans
+    and Pareto front into its own folder
+    :param booked_dates: dict of venue to set of dates already booked by other leagues, extended by this league
+    :return: summary row of the league
+    """
+    league_name = get_league_name(path)
+    league_folder = os.path.join(output_folder, league_name)
+    os.makedirs(league_folder, exist_ok=True)
+    start = time.monotonic()
+    with open(os.path.join(league_folder, "log.txt"), 'w', encoding='utf-8') as log_file, \
+            contextlib.redirect_stdout(log_file):
+        try:
+            with open(path) as file:
+                parsed_json = json.load(file)
+            remove_booked_venue_dates(parsed_json, booked_dates)
+            settings = read_settings(parsed_json)
+            problem = Problem(parsed_json['teams'], settings['start_date_first_round'],
+                              settings['general_blocked_dates'], settings['end_date_first_round'])
+        except Exception as e:
+            print(f"Fehler beim Verarbeiten der Datei {path}: {e}", flush=True)
+            logging.error(f"Fehler beim Verarbeiten der Datei {path}: {e}")
+            return [league_name, 0, "Fehler", "", "", round(time.monotonic() - start, 1)]
+
+        settings['workers'] = 1  # The leagues are already spread over the worker processes
+        if settings['seed'] is None:
+            settings['seed'] = random.SystemRandom().getrandbits(63)
+        print(f"Seed: {settings['seed']}", flush=True)
+        archive = None
+        if settings['archive'][0] == 1:
+            archive = PlanArchive(settings['archive'][1], os.path.join(league_folder, "spielplaene_top.ndjson"))
+        front = None
+        if settings['pareto'] == 1:
+            front = ParetoFront(os.path.join(league_folder, "pareto_front.ndjson"))
+        try:
+            best_result = schedule_league_with_cache(parsed_json, problem, settings, archive=archive, front=front)
+        except Exception as e:
+            print(f"Fehler beim Erstellen des Spielplans: {e}", flush=True)
+            logging.error(f"Fehler beim Erstellen des Spielplans von {path}: {e}")
+            return [league_name, len(problem.team_names), "Fehler", "", settings['seed'],
+                    round(time.monotonic() - start, 1)]
+
+    if best_result is None:
+        return [league_name, len(problem.team_names), "Kein Spielplan", "", settings['seed'],
+                round(time.monotonic() - start, 1)]
+
+    score, report, match_plan, all_teams, _, _ = best_result
+    write_report_csv(os.path.join(league_folder, "spielplan.csv"), match_plan_to_rows(match_plan, all_teams))
+    with open(os.path.join(league_folder, "bericht.txt"), 'w', encoding='utf-8') as file:
+        file.write(report)
+
+    venues = get_venues(parsed_json)
+    for match_day in match_plan:
+        for home_team, away_team in match_day['matches']:
+            booked_dates.setdefault(venues[home_team.team_name], set()).add(
+                match_day['datetime'].strftime('%Y-%m-%d'))
+    return [league_name, len(problem.team_names), "OK", score, settings['seed'], round(time.monotonic() - start, 1)]
+
+
+def schedule_league_group(league_files, output_folder):
+    """
+    Schedules leagues which share venues one after the other, every league only uses the venue dates left by the
+    leagues before
+    :return: summary rows of the leagues
+    """
+    booked_dates = {}
+    return [schedule_league_file(path, output_folder, booked_dates) for path in league_files]
+
+
+def schedule_leagues(league_files, output_folder, workers):
+    """
+    Schedules all leagues, the groups of leagues which share venues are spread over a pool of worker processes
+    :return: summary rows in the order of league_files
+    """
+    groups = group_leagues_by_venue(league_files)
+    rows = {}
+    if workers <= 1 or len(groups) == 1:
+        for group in groups:
+            for row in schedule_league_group(group, output_folder):
+                rows[row[0]] = row
+                print(f"{row[0]}: {row[2]} {row[3]}", flush=True)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(schedule_league_group, group, output_folder) for group in groups]
+            for future in as_completed(futures):
+                for row in future.result():
+                    rows[row[0]] = row
+                    print(f"{row[0]}: {row[2]} {row[3]}", flush=True)
+    return [rows[get_league_name(path)] for path in league_files]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Erstellt die Spielplaene mehrerer Ligen")
+    parser.add_argument('source', help="Ordner mit einer JSON Datei pro Liga oder Manifest mit einer Liste der Dateien")
+    parser.add_argument('--output', default="spielplaene", help="Ordner fuer die Ergebnisse")
+    parser.add_argument('--workers', type=int, default=0, help="Anzahl der Prozesse, 0 fuer alle Prozessoren")
+    args = parser.parse_args()
+
+    league_files = read_league_files(args.source)
+    names = [get_league_name(path) for path in league_files]
+    if len(set(names)) != len(names):
+        parser.error("Die Namen der Liga-Dateien muessen eindeutig sein")
+    workers = args.workers or os.cpu_count() or 1
+    os.makedirs(args.output, exist_ok=True)
+    print(f"{len(league_files)} Ligen gefunden", flush=True)
+
+    rows = schedule_leagues(league_files, args.output, workers)
+
+    print("=======================================", flush=True)
+    print(format_table(rows, SUMMARY_HEADERS), flush=True)
+    write_report_csv(os.path.join(args.output, "zusammenfassung.csv"), rows, SUMMARY_HEADERS)
+    if any(row[2] != "OK" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
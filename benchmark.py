@@ -0,0 +1,207 @@
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+from main import get_all_match_dates, map_general_match_dates_to_teams, create_match_plan, get_attempt_seed, \
+    MatchPlanError
+from evaluate_plan import calculate_score, match_plan_to_rows
+from problem import Problem
+
+# name, number of teams, weeks of the season, density of home dates, blocked dates and please don't play dates
+SCENARIOS = [
+    {'name': 'small', 'teams': 6, 'weeks': 20, 'home_density': 0.5, 'blocked_density': 0.05,
+     'please_dont_play_density': 0.05},
+    {'name': 'medium', 'teams': 12, 'weeks': 30, 'home_density': 0.5, 'blocked_density': 0.05,
+     'please_dont_play_density': 0.05},
+    {'name': 'large', 'teams': 24, 'weeks': 40, 'home_density': 0.6, 'blocked_density': 0.03,
+     'please_dont_play_density': 0.03},
+    {'name': 'huge', 'teams': 60, 'weeks': 100, 'home_density': 0.8, 'blocked_density': 0.02,
+     'please_dont_play_density': 0.02},
+]
+
+PHASES = ('get_all_match_dates', 'map_general_match_dates_to_teams', 'create_match_plan', 'calculate_score',
+          'match_plan_to_report')
+
+WEIGHT = {'amount_consecutive_matches': 1, 'distribution_home_away_matches': 1,
+          'amount_please_dont_play_dates': 10, 'distribution_game_days': 100}
+
+
+def generate_league(num_teams, weeks, home_density, blocked_density, please_dont_play_density, seed,
+                    first_day=date(2023, 9, 2)):
+    """
+    Creates a synthetic league in the format of the teams section of teams.json. Every week of the season has a match
+    day on saturday and sunday.
+    :param num_teams: number of teams
+    :param weeks: length of the season in weeks
+    :param home_density: probability that a team is able to host a match on a match day
+    :param blocked_density: probability that a team is not able to play on a match day
+    :param please_dont_play_density: probability that a team prefers not to play on a match day
+    :param seed: seed of the generator, the same seed gives the same league
+    :param first_day: first match day of the season
+    :return: dict of teams
+    """
+    rng = random.Random(seed)
+    match_days = [(first_day + timedelta(days=7 * week + offset)).isoformat()
+                  for week in range(weeks) for offset in (0, 1)]
+    teams = {}
+    for index in range(num_teams):
+        teams[f"Team {index + 1}"] = {
+            'available_dates_home_matches': [day for day in match_days if rng.random() < home_density],
+            'blocked_dates_matches': [day for day in match_days if rng.random() < blocked_density],
+            'please_dont_play_dates': [day for day in match_days if rng.random() < please_dont_play_density],
+        }
+    return teams
+
+
+def run_scenario(scenario, attempts, time_budget, seed, pairing="greedy"):
+    """
+    Runs randomized match plan attempts on a synthetic league and times every phase separately
+    :param scenario: entry of SCENARIOS
+    :param attempts: maximum number of attempts
+    :param time_budget: maximum seconds for all attempts
+    :param seed: seed of the league and the attempts
+    :param pairing: pairing mode of create_match_plan
+    :return: dict with attempts, success rate, failures per cause, phase times and the best score over time
+    """
+    teams_json = generate_league(scenario['teams'], scenario['weeks'], scenario['home_density'],
+                                 scenario['blocked_density'], scenario['please_dont_play_density'], seed)
+    problem = Problem(teams_json, "")
+    start_date_second_round = ""
+    phase_times = {phase: 0.0 for phase in PHASES}
+    phase_calls = {phase: 0 for phase in PHASES}
+    failures = {}
+    successes = 0
+    best_score = None
+    best_score_over_time = []  # [seconds, score] for every improvement
+
+    start = time.perf_counter()
+    attempts_done = 0
+    while attempts_done < attempts and time.perf_counter() - start < time_budget:
+        rng = random.Random(get_attempt_seed(seed, attempts_done))
+        attempts_done += 1
+        all_teams = problem.create_teams()
+
+        phase_start = time.perf_counter()
+        all_match_dates = get_all_match_dates(all_teams, "")
+        phase_end = time.perf_counter()
+        phase_times['get_all_match_dates'] += phase_end - phase_start
+        phase_calls['get_all_match_dates'] += 1
+
+        phase_start = phase_end
+        general_map = map_general_match_dates_to_teams(all_teams, all_match_dates)
+        phase_end = time.perf_counter()
+        phase_times['map_general_match_dates_to_teams'] += phase_end - phase_start
+        phase_calls['map_general_match_dates_to_teams'] += 1
+
+        phase_start = phase_end
+        try:
+            match_plan = create_match_plan(general_map, "", start_date_second_round, [1, 50], [1, 0.4], all_teams,
+                                           pairing, rng)
+        except MatchPlanError as e:
+            failures[e.cause] = failures.get(e.cause, 0) + 1
+            match_plan = None
+        phase_end = time.perf_counter()
+        phase_times['create_match_plan'] += phase_end - phase_start
+        phase_calls['create_match_plan'] += 1
+        if match_plan is None:
+            continue
+        successes += 1
+
+        phase_start = phase_end
+        score, _ = calculate_score(WEIGHT, all_teams, match_plan)
+        phase_end = time.perf_counter()
+        phase_times['calculate_score'] += phase_end - phase_start
+        phase_calls['calculate_score'] += 1
+
+        phase_start = phase_end
+        match_plan_to_rows(match_plan, all_teams)  # report as written to spielplan.csv by main.py
+        phase_end = time.perf_counter()
+        phase_times['match_plan_to_report'] += phase_end - phase_start
+        phase_calls['match_plan_to_report'] += 1
+
+        if best_score is None or score < best_score:
+            best_score = score
+            best_score_over_time.append([round(phase_end - start, 4), score])
+
+    wall_time = time.perf_counter() - start
+    return {
+        'scenario': scenario,
+        'seed': seed,
+        'pairing': pairing,
+        'attempts': attempts_done,
+        'successes': successes,
+        'success_rate': successes / attempts_done if attempts_done else 0.0,
+        'failures': failures,
+        'wall_time': wall_time,
+        'attempts_per_second': attempts_done / wall_time if wall_time else 0.0,
+        'best_score': best_score,
+        'best_score_over_time': best_score_over_time,
+        'phases': {phase: {'total': phase_times[phase], 'calls': phase_calls[phase],
+                           'mean': phase_times[phase] / phase_calls[phase] if phase_calls[phase] else None}
+                   for phase in PHASES},
+    }
+
+
+def print_result(result, baseline=None):
+    """
+    Prints the result of a scenario and the change compared to the same scenario of a baseline run
+    """
+    def _compare(value, old_value):
+        if old_value in (None, 0) or value is None:
+            return ""
+        return f" ({value / old_value:.2f}x baseline)"
+
+    scenario = result['scenario']
+    print(f"{scenario['name']}: {scenario['teams']} teams, {scenario['weeks']} weeks", flush=True)
+    print(f"  attempts: {result['attempts']}, success rate: {result['success_rate']:.1%}, "
+          f"attempts/s: {result['attempts_per_second']:.1f}"
+          f"{_compare(result['attempts_per_second'], baseline and baseline['attempts_per_second'])}", flush=True)
+    print(f"  best score: {result['best_score']}"
+          f"{'' if baseline is None else ' (baseline ' + str(baseline['best_score']) + ')'}", flush=True)
+    if result['failures']:
+        print(f"  failures: {result['failures']}", flush=True)
+    for phase, times in result['phases'].items():
+        if times['mean'] is None:
+            continue
+        old_mean = baseline['phases'].get(phase, {}).get('mean') if baseline else None
+        print(f"  {phase:<34} {times['mean'] * 1000:10.3f} ms{_compare(times['mean'], old_mean)}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the match plan creation on synthetic leagues")
+    parser.add_argument('--scenarios', nargs='*', default=[scenario['name'] for scenario in SCENARIOS],
+                        help="names of the scenarios to run")
+    parser.add_argument('--attempts', type=int, default=200, help="maximum attempts per scenario")
+    parser.add_argument('--time-budget', type=float, default=30.0, help="maximum seconds per scenario")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the leagues and the attempts")
+    parser.add_argument('--pairing', default="greedy", choices=["greedy", "matching"])
+    parser.add_argument('--output', help="file to save the results as JSON")
+    parser.add_argument('--baseline', help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = {result['scenario']['name']: result for result in json.load(file)['results']}
+
+    unknown = set(args.scenarios) - {scenario['name'] for scenario in SCENARIOS}
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    for scenario in SCENARIOS:
+        if scenario['name'] not in args.scenarios:
+            continue
+        result = run_scenario(scenario, args.attempts, args.time_budget, args.seed, args.pairing)
+        print_result(result, baseline.get(scenario['name']))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': sys.version, 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
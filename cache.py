@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+from evaluate_plan import calculate_score
+from archive import fixtures_from_names, fixtures_to_names
+
+# Entries of teams.json which do not change the match plan, the weight is applied to the stored plans instead
+IGNORED_KEYS = ('weight', 'workers', 'instrumentation', 'cache')
+DATE_LIST_KEYS = ('available_dates_home_matches', 'blocked_dates_matches', 'please_dont_play_dates')
+# Version of the generated plans and of the cache files, increase it with every change of the plan generation
+CACHE_VERSION = 1
+
+
+def get_cache_key(parsed_json):
+    """
+    Canonical hash of a league: teams, dates and search settings of teams.json without the weight, together with the
+    CACHE_VERSION of the plan generation. The order of the entries and of the dates of a team does not matter.
+    :param parsed_json: content of teams.json
+    :return: hex digest
+    """
+    league = {key: value for key, value in parsed_json.items() if key not in IGNORED_KEYS}
+    league['teams'] = {team_name: {key: sorted(set(value)) if key in DATE_LIST_KEYS else value
+                                   for key, value in team.items()}
+                       for team_name, team in parsed_json['teams'].items()}
+    if 'general_blocked_dates' in league:
+        league['general_blocked_dates'] = sorted(set(league['general_blocked_dates']))
+    league['cache_version'] = CACHE_VERSION
+    text = json.dumps(league, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Content addressed cache of finished match plans on disk, one file per league named by get_cache_key. Every entry
+    holds candidate plans as fixtures with dates and team names, so that a hit is re-scored with the current weight and
+    a change of the weight alone needs no new search. The least recently used entries are removed if the cache grows
+    beyond max_bytes.
+    """
+
+    def __init__(self, folder, max_bytes):
+        """
+        :param folder: folder of the cache files, created if missing
+        :param max_bytes: maximum total size of the cache files
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def _filename(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, parsed_json, problem, weight):
+        """
+        :param parsed_json: content of teams.json
+        :param problem: league parsed from teams.json, see problem.Problem
+        :param weight: weights of the score from teams.json
+        :return: best stored plan for the weight as [score, report, match plan, all teams, iteration, attempt seed] or
+                 None if the league is not cached
+        """
+        return min(self.get_all(parsed_json, problem, weight), key=lambda result: result[0], default=None)
+
+    def get_all(self, parsed_json, problem, weight):
+        """
+        All stored plans of a league, e.g. to fill the archive and the Pareto front on a cache hit
+        :return: list of plans scored with the weight as [score, report, match plan, all teams, iteration, attempt seed]
+                 in the stored order, empty if the league is not cached
+        """
+        filename = self._filename(get_cache_key(parsed_json))
+        try:
+            with open(filename, encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(filename)  # most recently used
+        except (OSError, ValueError):
+            return []
+
+        results = []
+        for candidate in entry['candidates']:
+            try:
+                fixtures = fixtures_from_names(problem, candidate['fixtures'])
+            except KeyError:
+                continue  # written by another version with different match dates
+            match_plan, all_teams = problem.build_match_plan(fixtures)
+            score, report = calculate_score(weight, all_teams, match_plan)
+            results.append([score, report, match_plan, all_teams, candidate['iteration'], candidate['seed']])
+        return results
+
+    def put(self, parsed_json, problem, results):
+        """
+        Stores the plans of a league, replacing an older entry of the same league
+        :param parsed_json: content of teams.json
+        :param problem: league parsed from teams.json, see problem.Problem
+        :param results: candidate plans as [score, report, match plan, all teams, iteration, attempt seed]
+        """
+        candidates = []
+        for result in results:
+            fixtures = fixtures_to_names(problem, sorted(problem.encode_match_plan(result[2])))
+            if all(fixtures != candidate['fixtures'] for candidate in candidates):
+                candidates.append({'fixtures': fixtures, 'iteration': result[4], 'seed': result[5]})
+
+        file_descriptor, temp_filename = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            json.dump({'candidates': candidates}, file, separators=(',', ':'))
+        os.replace(temp_filename, self._filename(get_cache_key(parsed_json)))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+            total -= size
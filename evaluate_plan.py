@@ -1,5 +1,6 @@
+import csv
+import os
 from datetime import datetime
-import pandas
 
 def get_consecutive_matches_list(all_teams):
     consecutive_matches = []
@@ -103,6 +104,16 @@ def get_distribution_game_days(all_teams, match_plan):
     return total_distribution, max_distribution
 
 
+def calculate_metrics(all_teams, match_plan):
+    """
+    Metrics of calculate_score without weight and report
+    :return: total consecutive matches, most uneven distribution of home and away matches, total please don't play
+             dates and maximum distribution of game days
+    """
+    return (get_total_consecutive_matches(all_teams), get_team_with_most_uneven_distribution_matches(all_teams)[1],
+            get_total_amount_please_dont_play_dates(all_teams), get_distribution_game_days(all_teams, match_plan)[1][0])
+
+
 def calculate_score(weight, all_teams, match_plan):
     total_consec_matches = get_total_consecutive_matches(all_teams)
     most_consec_matches_team, most_consec_matches_team_amount = get_team_with_most_consecutive_matches(all_teams)
@@ -140,32 +151,128 @@ def calculate_score(weight, all_teams, match_plan):
     return score, report
 
 
-def match_plan_to_report(match_plan, all_teams):
-    headers_data_match_plan = ["Datum", "Heimmannschaft", "(H)", "(A)", "", "Gastmannschaft", "(H)", "(A)"]
+REPORT_HEADERS = ["Datum", "Heimmannschaft", "(H)", "(A)", "", "Gastmannschaft", "(H)", "(A)"]
+
+
+def match_plan_to_rows(match_plan, all_teams):
+    """
+    Creates the rows of the match plan report without pandas, see REPORT_HEADERS for the columns
+    :return: list of rows
+    """
     # print("=================== FINAL MATCH PLAN ===================")
     end_of_first_round = get_end_of_first_round(all_teams)
     match_plan_to_print = []
+    # Running number of home and away matches per team, the match plan is sorted by date and every team has at most
+    # one match per date, so the tallies equal get_amount_of_matches_until_date of the current date
+    tallies = {team: [0, 0] for team in all_teams}
     for match_day in match_plan:
         if match_day['matches']:
             match_date = match_day['datetime']
+            date_text = match_date.strftime('%d.%m.')
             # print(f"{match_date.strftime('%d.%m.%Y')}:")
-            for match in match_day['matches']:
-                match_plan_to_print.append([match_date.strftime('%d.%m.'),
-                                            match[0].team_name,
-                                            match[0].get_amount_of_matches_until_date(match_date)[0],
-                                            match[0].get_amount_of_matches_until_date(match_date)[1],
+            for home_team, away_team in match_day['matches']:
+                home_tally = tallies[home_team]
+                away_tally = tallies[away_team]
+                home_tally[0] += 1
+                away_tally[1] += 1
+                match_plan_to_print.append([date_text,
+                                            home_team.team_name,
+                                            home_tally[0],
+                                            home_tally[1],
                                             "-vs-",
-                                            match[1].team_name,
-                                            match[1].get_amount_of_matches_until_date(match_date)[0],
-                                            match[1].get_amount_of_matches_until_date(match_date)[1]])
+                                            away_team.team_name,
+                                            away_tally[0],
+                                            away_tally[1]])
             if match_day['datetime'] == end_of_first_round:
                 match_plan_to_print.append(["--", "--", "--", "--", "--", "--", "--", "--"])
+    # print(f"Ende der Hinrunde: {end_of_first_round.strftime('%d.%m.%Y')}")
+    return match_plan_to_print
+
+
+def match_plan_to_report(match_plan, all_teams):
+    """
+    Match plan report as pandas DataFrame, pandas is only imported by this function
+    """
+    import pandas
     pandas.set_option('display.max_colwidth', None)
     pandas.set_option('display.max_columns', None)
     pandas.set_option('display.width', None)
-    data_table = pandas.DataFrame(match_plan_to_print, columns=headers_data_match_plan)
+    data_table = pandas.DataFrame(match_plan_to_rows(match_plan, all_teams), columns=REPORT_HEADERS)
     #print(data_table)
-    # print("")
-    # print(f"Ende der Hinrunde: {end_of_first_round.strftime('%d.%m.%Y')}")
-    # print("")
     return data_table
+
+
+def write_report_csv(filename, rows, headers=REPORT_HEADERS):
+    """
+    Writes report rows in the same format as DataFrame.to_csv(filename, sep=';'), including the index column
+    """
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        write_report_rows(file, rows, headers)
+
+
+def write_report_rows(file, rows, headers=REPORT_HEADERS):
+    """
+    write_report_csv for an open file, e.g. io.StringIO
+    """
+    writer = csv.writer(file, delimiter=';', lineterminator=os.linesep)
+    writer.writerow([""] + list(headers))
+    for index, row in enumerate(rows):
+        writer.writerow([index] + list(row))
+
+
+def calculate_metrics_batch(problem, plans):
+    """
+    Vectorized metrics of calculate_score for many plans at once, requires numpy
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param plans: integer array of shape (plans, matches, 3) with date index, home team index and away team index of
+                  every match, e.g. built from Problem.encode_match_plan
+    :return: integer array of shape (plans, 4) with total consecutive matches, most uneven distribution of home and
+             away matches, total please don't play dates and maximum distribution of game days per plan
+    """
+    import numpy
+
+    plans = numpy.asarray(plans, dtype=numpy.int64)
+    num_plans = plans.shape[0]
+    num_teams = len(problem.team_names)
+    days = numpy.asarray(problem.match_date_ordinals, dtype=numpy.int64)
+    dates, home_teams, away_teams = plans[:, :, 0], plans[:, :, 1], plans[:, :, 2]
+
+    # +1 for a home match, -1 for an away match of a team on a date
+    team_matches = numpy.zeros((num_plans, num_teams, len(days)), dtype=numpy.int16)
+    plan_index = numpy.repeat(numpy.arange(num_plans), plans.shape[1])
+    team_matches[plan_index, home_teams.ravel(), dates.ravel()] = 1
+    team_matches[plan_index, away_teams.ravel(), dates.ravel()] = -1
+    played = team_matches != 0
+
+    next_day = numpy.diff(days) <= 1
+    consecutive_matches = (played[:, :, :-1] & played[:, :, 1:] & next_day).sum(axis=(1, 2))
+
+    uneven_home_away = numpy.abs(numpy.cumsum(team_matches, axis=2)).max(axis=(1, 2))
+
+    please_dont_play = numpy.zeros((num_teams, len(days)), dtype=bool)
+    date_index = {ordinal: index for index, ordinal in enumerate(problem.match_date_ordinals)}
+    for team, ordinals in enumerate(problem.please_dont_play_ordinals):
+        please_dont_play[team, [date_index[ordinal] for ordinal in ordinals if ordinal in date_index]] = True
+    please_dont_play_hits = (played & please_dont_play).sum(axis=(1, 2))
+
+    matches_until = numpy.cumsum(played, axis=2)
+    spread = matches_until.max(axis=1) - matches_until.min(axis=1)
+    spread[numpy.arange(len(days)) > dates.max(axis=1)[:, None]] = 0  # the plan ends with its last match
+    max_spread = spread.max(axis=1)
+
+    return numpy.stack([consecutive_matches, uneven_home_away, please_dont_play_hits, max_spread], axis=1)
+
+
+def calculate_scores_batch(weight, problem, plans):
+    """
+    Vectorized calculate_score for many plans at once, requires numpy
+    :param weight: weights of the score from teams.json
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param plans: integer array of shape (plans, matches, 3), see calculate_metrics_batch
+    :return: array with the score of every plan
+    """
+    import numpy
+
+    weights = numpy.array([weight['amount_consecutive_matches'], weight['distribution_home_away_matches'],
+                           weight['amount_please_dont_play_dates'], weight['distribution_game_days']])
+    return calculate_metrics_batch(problem, plans) @ weights
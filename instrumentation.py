@@ -0,0 +1,109 @@
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import tempfile
+import time
+
+
+class RunStats:
+    """
+    Opt-in counters and phase timers of a scheduling run. Functions of the hot path take stats=None and only record
+    anything if an instance is given, so a run without instrumentation only pays for a few None checks. Every batch of
+    attempts collects its own instance, which are merged by the main process.
+    """
+
+    def __init__(self, profile_attempts=0):
+        """
+        :param profile_attempts: number of attempts, counted from the first one, which are run with cProfile
+        """
+        self.profile_attempts = profile_attempts
+        self.phase_times = {}
+        self.counters = {}
+        self.failures = {}  # failed attempts per cause of MatchPlanError or type of another exception
+        self.rejections = {}  # rejected candidate pairs per rule of _match_two_opponents
+        self.profiles = []  # raw cProfile stats of every batch which profiled attempts
+        self.cache_hit = False  # the plan was taken from the plan cache without a search
+        self._profiler = None
+
+    @staticmethod
+    def start():
+        return time.perf_counter()
+
+    def stop(self, phase, start):
+        """
+        Adds the time since start to a phase
+        :return: current time to start the next phase
+        """
+        now = time.perf_counter()
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + now - start
+        return now
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reject(self, rule):
+        self.rejections[rule] = self.rejections.get(rule, 0) + 1
+
+    def fail(self, cause):
+        self.failures[cause] = self.failures.get(cause, 0) + 1
+
+    def profiler(self, iteration):
+        """
+        :param iteration: global number of the attempt
+        :return: profiler of this batch to run the attempt with or None if the attempt is not profiled
+        """
+        if iteration >= self.profile_attempts:
+            return None
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+        return self._profiler
+
+    def finish_profile(self):
+        """
+        Keeps the raw stats of the profiler of this batch, the profiler itself can not be sent between processes
+        """
+        if self._profiler is not None:
+            self._profiler.create_stats()
+            self.profiles.append(self._profiler.stats)
+            self._profiler = None
+
+    def merge(self, other):
+        for own, new in ((self.phase_times, other.phase_times), (self.counters, other.counters),
+                         (self.failures, other.failures), (self.rejections, other.rejections)):
+            for key, value in new.items():
+                own[key] = own.get(key, 0) + value
+        self.profiles.extend(other.profiles)
+
+    def to_dict(self):
+        attempts = self.counters.get('attempts', 0)
+        return {
+            'phase_times': self.phase_times,
+            'counters': self.counters,
+            'failures': self.failures,
+            'rejections': self.rejections,
+            'success_rate': self.counters.get('successes', 0) / attempts if attempts else 0.0,
+            'profiled_batches': len(self.profiles),
+            'cache_hit': self.cache_hit,
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_profile(self, filename):
+        """
+        Combines the profiles of all batches into one file which can be read with pstats or snakeviz
+        :return: False if no attempt was profiled
+        """
+        if not self.profiles:
+            return False
+        with tempfile.TemporaryDirectory() as folder:
+            filenames = []
+            for index, raw_stats in enumerate(self.profiles):
+                filenames.append(os.path.join(folder, f"{index}.prof"))
+                with open(filenames[-1], 'wb') as file:
+                    marshal.dump(raw_stats, file)
+            pstats.Stats(*filenames).dump_stats(filename)
+        return True
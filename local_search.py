@@ -0,0 +1,206 @@
+import math
+import random
+import time
+from datetime import datetime
+from scoring import ScoreEngine
+from utils import convert_date_string_to_datetime
+
+
+def improve_match_plan(problem, match_plan, weight, start_date_sec_round, consecutive_matches, time_budget,
+                       rng=random, max_steps=0):
+    """
+    Improves a valid match plan with simulated annealing. Every step applies one move which keeps the plan valid:
+    swapping the dates of two matches, flipping home and away of both matches of a pairing or moving a match to
+    another free date on which both teams are able to play.
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param match_plan: valid match plan to start with, e.g. the best plan of create_match_plan
+    :param weight: weights of the score from teams.json
+    :param start_date_sec_round: first date of the second round as string, empty or invalid for no restriction
+    :param consecutive_matches: [allow, probability] from teams.json, consecutive matches are forbidden if allow is 0
+    :param time_budget: seconds to search, 0 for no time limit
+    :param rng: random number generator
+    :param max_steps: number of moves to try, 0 for no limit. The cooling follows the steps instead of the time if
+                      given, so that the same seed gives the same plan as long as the time budget is not reached.
+                      Nothing is searched if neither a time budget nor a number of steps is given.
+    :return: best match plan found, its teams and its score
+    """
+    fixtures, score = improve_fixtures(problem, problem.encode_match_plan(match_plan), weight, start_date_sec_round,
+                                       consecutive_matches, time_budget, rng, max_steps=max_steps)
+    match_plan, all_teams = problem.build_match_plan(fixtures)
+    return match_plan, all_teams, score
+
+
+def improve_fixtures(problem, fixtures, weight, start_date_sec_round, consecutive_matches, time_budget, rng=random,
+                     movable=None, max_steps=0, first_date_index=0):
+    """
+    improve_match_plan for a plan given as fixtures
+    :param fixtures: valid plan as list of (date index, home team index, away team index)
+    :param movable: indices of the fixtures which may be changed, None to change all fixtures
+    :param first_date_index: first date which may be changed, matches on earlier dates are already played and no
+                             match is moved to them
+    :return: best fixtures found in the order of the given fixtures and their score
+    """
+    search = _LocalSearch(problem, fixtures, weight, start_date_sec_round, consecutive_matches, rng, movable,
+                          first_date_index)
+    return search.run(time_budget, max_steps)
+
+
+class _LocalSearch:
+
+    def __init__(self, problem, fixtures, weight, start_date_sec_round, consecutive_matches, rng, movable=None,
+                 first_date_index=0):
+        self.problem = problem
+        self.first_date_index = first_date_index
+        self.weight = weight
+        self.rng = rng
+        self.days = problem.match_date_ordinals
+        self.allow_consecutive = consecutive_matches[0] != 0
+        try:
+            self.sec_round_day = convert_date_string_to_datetime(start_date_sec_round).toordinal()
+        except ValueError:
+            self.sec_round_day = datetime(1970, 1, 1).toordinal()
+        self.home_ok = [frozenset(teams) for teams in problem.home_teams_per_date]
+        self.play_ok = [frozenset(teams) for teams in problem.away_teams_per_date]
+        # Dates on which a team is able to host a match
+        self.home_dates = [[k for k in range(len(self.days)) if team in self.home_ok[k]]
+                           for team in range(len(problem.team_names))]
+
+        self.fixtures = [list(fixture) for fixture in fixtures]  # [date index, home, away]
+        self.busy = [set() for _ in self.days]  # teams with a match per date
+        self.legs = {}  # both fixtures of every pairing
+        for index, (date_index, home, away) in enumerate(self.fixtures):
+            self.busy[date_index].update((home, away))
+            self.legs.setdefault(frozenset((home, away)), []).append(index)
+        self.pairings = list(self.legs.values())
+        self.movable = list(range(len(self.fixtures))) if movable is None else sorted(movable)
+        movable_set = set(self.movable)
+        # Home and away can only be flipped if both matches of a pairing may be changed
+        self.flippable = [pairing for pairing in self.pairings if all(index in movable_set for index in pairing)]
+        self.score_engine = ScoreEngine(problem, weight, self.fixtures)
+
+    def run(self, time_budget, max_steps=0):
+        current_score = self.score_engine.score()
+        best_score = current_score
+        best_fixtures = [tuple(fixture) for fixture in self.fixtures]
+        if not self.movable or not (time_budget or max_steps):
+            return best_fixtures, best_score
+        start_temperature = max(max(self.weight.values()), 1)
+        end_temperature = start_temperature / 1000
+        start = time.monotonic()
+        step = 0
+        while True:
+            elapsed = time.monotonic() - start
+            if (time_budget and elapsed >= time_budget) or (max_steps and step >= max_steps):
+                break
+            progress = step / max_steps if max_steps else elapsed / time_budget
+            step += 1
+            temperature = start_temperature * (end_temperature / start_temperature) ** progress
+            changes = self._random_move()
+            saved = self._apply(changes) if changes else None
+            if saved is None:
+                continue
+            delta = self.score_engine.replace([fixture for index, fixture in saved],
+                                              [self.fixtures[index] for index, fixture in saved])
+            score = current_score + delta
+            if delta <= 0 or self.rng.random() < math.exp(-delta / temperature):
+                current_score = score
+                if score < best_score:
+                    best_score = score
+                    best_fixtures = [tuple(fixture) for fixture in self.fixtures]
+            else:
+                self.score_engine.replace([self.fixtures[index] for index, fixture in saved],
+                                          [fixture for index, fixture in saved])
+                self._revert(saved)
+        return best_fixtures, best_score
+
+    def _random_move(self):
+        """
+        :return: list of [fixture index, [new date index, new home, new away]]
+        """
+        rng = self.rng
+        move = rng.random()
+        if move < 0.4 or (move >= 0.8 and not self.flippable):
+            index = rng.choice(self.movable)
+            date_index, home, away = self.fixtures[index]
+            new_date_index = rng.choice(self.home_dates[home])
+            if new_date_index == date_index:
+                return None
+            return [[index, [new_date_index, home, away]]]
+        if move < 0.8:
+            first, second = rng.choice(self.movable), rng.choice(self.movable)
+            first_fixture, second_fixture = self.fixtures[first], self.fixtures[second]
+            if first_fixture[0] == second_fixture[0]:
+                return None
+            return [[first, [second_fixture[0], first_fixture[1], first_fixture[2]]],
+                    [second, [first_fixture[0], second_fixture[1], second_fixture[2]]]]
+        first, second = rng.choice(self.flippable)
+        first_fixture, second_fixture = self.fixtures[first], self.fixtures[second]
+        return [[first, [first_fixture[0], first_fixture[2], first_fixture[1]]],
+                [second, [second_fixture[0], second_fixture[2], second_fixture[1]]]]
+
+    def _apply(self, changes):
+        """
+        Applies the changes if the resulting plan is valid
+        :return: previous fixtures of the changed indices to revert the changes, None if the plan would be invalid
+        """
+        saved = [[index, self.fixtures[index]] for index, fixture in changes]
+        if any(fixture[0] < self.first_date_index for _, fixture in saved + changes):
+            return None  # played dates are never changed
+        for index, (date_index, home, away) in saved:
+            self.busy[date_index].difference_update((home, away))
+        added = []
+        valid = True
+        for index, (date_index, home, away) in changes:
+            if home not in self.home_ok[date_index] or away not in self.play_ok[date_index] or \
+                    home in self.busy[date_index] or away in self.busy[date_index]:
+                valid = False
+                break
+            self.busy[date_index].update((home, away))
+            added.append((date_index, home, away))
+        if valid and not self.allow_consecutive:
+            valid = not any(self._has_consecutive_match(date_index, team)
+                            for date_index, home, away in added for team in (home, away))
+        if not valid:
+            for date_index, home, away in added:
+                self.busy[date_index].difference_update((home, away))
+            for index, (date_index, home, away) in saved:
+                self.busy[date_index].update((home, away))
+            return None
+
+        for index, fixture in changes:
+            self.fixtures[index] = list(fixture)
+        if not self._rounds_valid():
+            self._revert(saved)
+            return None
+        return saved
+
+    def _revert(self, saved):
+        for index, fixture in saved:
+            date_index, home, away = self.fixtures[index]
+            self.busy[date_index].difference_update((home, away))
+        for index, fixture in saved:
+            self.fixtures[index] = fixture
+            self.busy[fixture[0]].update(fixture[1:])
+
+    def _has_consecutive_match(self, date_index, team):
+        for neighbour in (date_index - 1, date_index + 1):
+            if 0 <= neighbour < len(self.days) and abs(self.days[neighbour] - self.days[date_index]) <= 1 and \
+                    team in self.busy[neighbour]:
+                return True
+        return False
+
+    def _rounds_valid(self):
+        """
+        All first matches of a pairing have to be played before the first second match and the deadline of the first
+        round, the second matches must not be earlier than the start date of the second round
+        """
+        end_first_round = 0
+        start_second_round = len(self.days)
+        for first, second in self.pairings:
+            first_date, second_date = self.fixtures[first][0], self.fixtures[second][0]
+            if first_date > second_date:
+                first_date, second_date = second_date, first_date
+            end_first_round = max(end_first_round, first_date)
+            start_second_round = min(start_second_round, second_date)
+        return end_first_round < start_second_round and end_first_round < self.problem.first_round_end and \
+            self.days[start_second_round] >= self.sec_round_day
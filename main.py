@@ -1,34 +1,45 @@
 import json
 import logging
+import multiprocessing
 import os.path
 import random
 import sys
-from time import sleep
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import sleep, monotonic
 # from art import *
-from utils import convert_date_string_to_datetime, convert_date_string_list_to_datetime, check_for_consecutive_dates, get_executable_location
+from utils import convert_date_string_to_datetime, convert_date_string_list_to_datetime, check_for_consecutive_dates, get_executable_location,\
+    format_table
 from evaluate_plan import get_total_consecutive_matches, get_end_of_first_round, get_team_with_most_consecutive_matches,\
     get_team_with_most_uneven_distribution_matches, get_team_with_most_scheduled_please_dont_play_dates,\
-    get_total_amount_please_dont_play_dates, calculate_score, match_plan_to_report
-from team import Team
+    get_total_amount_please_dont_play_dates, calculate_score, calculate_metrics, match_plan_to_rows,\
+    write_report_csv
+from problem import Problem
+from solver import solve_match_plan, SolverError, InfeasiblePlanError
+from local_search import improve_match_plan
+from template import solve_template_plan, TemplateError
+from matching import maximum_matching
+from instrumentation import RunStats
+from cache import PlanCache
+from archive import PlanArchive, ParetoFront
 from datetime import datetime
-import pandas
 # from tqdm import tqdm
 
 
-def get_all_match_dates(teams, start_date):
-    match_dates = []
+def get_all_match_dates(teams, start_date, general_blocked_dates=()):
+    match_dates = set()
     try:
         start_date = convert_date_string_to_datetime(start_date)
     except ValueError:
         # print(f"First Round start date not given or invalid ({start_date})")
         start_date = datetime(1970, 1, 1)
+    general_blocked_dates = frozenset(convert_date_string_list_to_datetime(general_blocked_dates))
     for team in teams:
         available_dates = team.available_dates_home_matches
         for date in available_dates:
-            if date not in match_dates and date >= start_date:
-                match_dates.append(date)
+            if date >= start_date and date not in general_blocked_dates:
+                match_dates.add(date)
     # print(f"Found {len(match_dates)} possible match dates")
-    return sorted(match_dates)  # TODO: Sorting redundant?
+    return sorted(match_dates)
 
 
 def map_general_match_dates_to_teams(teams, all_match_dates):
@@ -38,17 +49,27 @@ def map_general_match_dates_to_teams(teams, all_match_dates):
                     'home_match': [],
                     'away_match': []}
         for team in teams:
-            available_home_match_dates = team.available_dates_home_matches
-            blocked_dates = team.blocked_dates_matches
-            if match_date not in blocked_dates:
-                thisdict['away_match'].append(team)
-            if match_date in available_home_match_dates and match_date not in blocked_dates:
+            if team.is_blocked_date(match_date):
+                continue
+            thisdict['away_match'].append(team)
+            if team.is_home_match_date(match_date):
                 thisdict['home_match'].append(team)
         map_general.append(thisdict)
     return map_general
 
 
-def create_match_plan(general_map, end_date_first_round, start_date_sec_round, consecutive_matches, shuffle_matches):
+class MatchPlanError(Exception):
+    """
+    Raised if create_match_plan is not able to create a match plan, cause is a short key of the reason
+    """
+
+    def __init__(self, message, cause):
+        super().__init__(message)
+        self.cause = cause
+
+
+def create_match_plan(general_map, end_date_first_round, start_date_sec_round, consecutive_matches, shuffle_matches,
+                      all_teams, pairing="greedy", rng=random, stats=None):
     def _sort_teams_by_least_free_home_match_days():
         def __get_free_home_matches(elem):
             return elem.get_free_home_match_days_after_date(entry['datetime'])
@@ -68,8 +89,8 @@ def create_match_plan(general_map, end_date_first_round, start_date_sec_round, c
         shuffle_part_away = round(len(away_team_list) * shuffle_matches[1])
         copy_home_team_list = home_team_list[:shuffle_part_home]
         copy_away_team_list = away_team_list[:shuffle_part_away]
-        random.shuffle(copy_home_team_list)
-        random.shuffle(copy_away_team_list)
+        rng.shuffle(copy_home_team_list)
+        rng.shuffle(copy_away_team_list)
         entry['home_match'][:shuffle_part_home] = copy_home_team_list
         entry['away_match'][:shuffle_part_away] = copy_away_team_list
         # print(f"Shuffle Part Home: {shuffle_part_home}")
@@ -88,7 +109,7 @@ def create_match_plan(general_map, end_date_first_round, start_date_sec_round, c
     def _allow_consecutive_match():
         if consecutive_matches[0] == 0:
             return False
-        rand_number = random.randint(0, 100)
+        rand_number = rng.randint(0, 100)
         given_probability = consecutive_matches[1]
         if given_probability >= rand_number:
             # print(f"allow sunday match: True")
@@ -120,10 +141,10 @@ def create_match_plan(general_map, end_date_first_round, start_date_sec_round, c
 
         if data_home_team:
             print("")
-            print(pandas.DataFrame(data_home_team, columns=headers_data_home))
+            print(format_table(data_home_team, headers_data_home))
             print("")
         if data_away_team:
-            print(pandas.DataFrame(data_away_team, columns=headers_data_away))
+            print(format_table(data_away_team, headers_data_away))
             print("")
 
     def _match_two_opponents(first_round=True):
@@ -134,48 +155,149 @@ def create_match_plan(general_map, end_date_first_round, start_date_sec_round, c
             _shuffle_match_list()
             # _debug_sort_output("Shuffle Opponents")
         # print(f"----- Matching Opponents for {entry['datetime'].strftime('%d.%m.%Y')} -----")
+        if pairing == "matching":
+            _match_maximum_opponents(first_round)
+            return
 
         for curr_home_team in entry['home_match']:
-            home_team_already_matched = False
             if _is_next_match_consecutive(curr_home_team):
                 if not _allow_consecutive_match():
+                    if stats is not None:
+                        stats.reject('home_consecutive')
                     continue  # Skip if next match would be a consecutive match which is not allowed
+            if curr_home_team in matched_teams:
+                if stats is not None:
+                    stats.reject('home_already_matched')
+                continue  # Skip if this team already has a match in this round
             for curr_away_team in entry['away_match']:
-                if home_team_already_matched:
-                    continue  # Skip if current home team already has a matched partner in this round
-                if curr_home_team.team_name == curr_away_team.team_name:
+                if stats is not None:
+                    stats.count('pairs_examined')
+                if curr_home_team is curr_away_team:
                     continue  # Skip as home team can not play against itself
-                if any(curr_away_team in sublist for sublist in thisdict['matches']):
+                if curr_away_team in matched_teams:
+                    if stats is not None:
+                        stats.reject('away_already_matched')
                     continue  # Skip if other team already has a match in this round
-                if any(curr_home_team in sublist for sublist in thisdict['matches']):
-                    continue  # Skip if this team already has a match in this round
                 if _is_next_match_consecutive(curr_away_team):
                     if not _allow_consecutive_match():
+                        if stats is not None:
+                            stats.reject('away_consecutive')
                         continue  # Skip if next match would be a consecutive match which is not allowed
                 if first_round:
-                    already_scheduled_opponents = curr_away_team.get_list_of_opponents()
+                    already_scheduled = curr_away_team.has_match_against(curr_home_team.team_name)
                 else:
-                    already_scheduled_opponents = curr_away_team.get_list_of_opponents(home_or_away="A")
-                if curr_home_team.team_name in already_scheduled_opponents:
+                    already_scheduled = curr_away_team.has_match_against(curr_home_team.team_name, home_or_away="A")
+                if already_scheduled:
+                    if stats is not None:
+                        stats.reject('already_scheduled')
                     continue  # Skip if there is already a match planned between both teams
-                if not first_round:
-                    try:
-                        start_date_sec_round_date = convert_date_string_to_datetime(start_date_sec_round)
-                    except ValueError:
-                        # print(f"Second Round start date not given or invalid ({start_date_sec_round})")
-                        start_date_sec_round_date = datetime(1970, 1, 1)
-                    if entry['datetime'] < start_date_sec_round_date:
-                        continue  # Don't Start second round until a given start date
+                if not first_round and entry['datetime'] < start_date_sec_round_date:
+                    if stats is not None:
+                        stats.reject('second_round_not_started')
+                    continue  # Don't Start second round until a given start date
 
                 #  Modify team objects
                 curr_home_team.add_home_match_date(entry['datetime'], curr_away_team.team_name)
                 curr_away_team.add_away_match_date(entry['datetime'], curr_home_team.team_name)
 
                 thisdict['matches'].append([curr_home_team, curr_away_team])
-                home_team_already_matched = True
+                matched_teams.add(curr_home_team)
+                matched_teams.add(curr_away_team)
 
                 # print(f"-> {curr_home_team.team_name} -vs- {curr_away_team.team_name}")
                 # input("Press Enter to continue ...")
+                break  # Current home team has a matched partner in this round
+
+    def _match_maximum_opponents(first_round=True):
+        # Pairs as many teams as possible on this date. The greedy pairing in the order of the sorted lists is only
+        # extended by augmenting paths of a maximum matching, so the sort order still decides where possible.
+        if not first_round and entry['datetime'] < start_date_sec_round_date:
+            return  # Don't Start second round until a given start date
+        # Every team decides once per date if it may play a consecutive match
+        teams = [team for team in entry['away_match']
+                 if not _is_next_match_consecutive(team) or _allow_consecutive_match()]
+        positions = {team: position for position, team in enumerate(teams)}
+        home_ranks = {team: rank for rank, team in enumerate(entry['home_match'])}
+
+        def __can_host(home_team, away_team):
+            if home_team is away_team or home_team not in home_ranks:
+                return False
+            if first_round:
+                return not away_team.has_match_against(home_team.team_name)
+            return not away_team.has_match_against(home_team.team_name, home_or_away="A")
+
+        adjacency = [[positions[other] for other in teams if __can_host(team, other) or __can_host(other, team)]
+                     for team in teams]
+        partners = [-1] * len(teams)
+        for curr_home_team in entry['home_match']:
+            if curr_home_team not in positions or partners[positions[curr_home_team]] != -1:
+                continue
+            for curr_away_team in teams:
+                if partners[positions[curr_away_team]] == -1 and __can_host(curr_home_team, curr_away_team):
+                    partners[positions[curr_home_team]] = positions[curr_away_team]
+                    partners[positions[curr_away_team]] = positions[curr_home_team]
+                    break
+        partners = maximum_matching(adjacency, partners)
+
+        pairs = []
+        for team in teams:
+            partner = teams[partners[positions[team]]] if partners[positions[team]] != -1 else None
+            if partner is None or positions[partner] < positions[team]:
+                continue
+            if not __can_host(team, partner) or \
+                    (__can_host(partner, team) and home_ranks[partner] < home_ranks[team]):
+                team, partner = partner, team
+            pairs.append((home_ranks[team], team, partner))
+        for _, curr_home_team, curr_away_team in sorted(pairs, key=lambda pair: pair[0]):
+            curr_home_team.add_home_match_date(entry['datetime'], curr_away_team.team_name)
+            curr_away_team.add_away_match_date(entry['datetime'], curr_home_team.team_name)
+            thisdict['matches'].append([curr_home_team, curr_away_team])
+            matched_teams.add(curr_home_team)
+            matched_teams.add(curr_away_team)
+
+    def _count_remaining_dates():
+        # Per team the number of dates on or after date k on which it is able to play at all or at home, and an
+        # upper bound of the matches on these dates: each match needs a home team and two teams able to play
+        for k in range(len(general_map) - 1, -1, -1):
+            match_day = general_map[k]
+            for team_index in range(len(all_teams)):
+                remaining_play_dates[team_index][k] = remaining_play_dates[team_index][k + 1]
+                remaining_home_dates[team_index][k] = remaining_home_dates[team_index][k + 1]
+            for team in match_day['away_match']:
+                remaining_play_dates[team_indices[team]][k] += 1
+            for team in match_day['home_match']:
+                remaining_home_dates[team_indices[team]][k] += 1
+            remaining_capacity[k] = remaining_capacity[k + 1] + min(len(match_day['home_match']),
+                                                                    len(match_day['away_match']) // 2)
+
+    def _abort_if_infeasible(k, first_round=True):
+        # Necessary conditions for the dates from date k on, abort as soon as the plan can not be completed anymore
+        num_teams = len(all_teams)
+        sec_k = max(k, sec_round_index)
+        missing_matches = num_teams * (num_teams - 1)
+        for team_index, team in enumerate(all_teams):
+            total_matches = team.get_total_matches()
+            home_matches = team.get_total_home_matches()
+            missing_matches -= home_matches
+            if 2 * num_teams - 2 - total_matches > remaining_play_dates[team_index][k]:
+                raise MatchPlanError(f"{team.team_name} needs {2 * num_teams - 2 - total_matches} more matches but "
+                                     f"can only play on {remaining_play_dates[team_index][k]} remaining dates",
+                                     "remaining_dates")
+            if num_teams - 1 - home_matches > remaining_home_dates[team_index][k]:
+                raise MatchPlanError(f"{team.team_name} needs {num_teams - 1 - home_matches} more home matches but "
+                                     f"has only {remaining_home_dates[team_index][k]} remaining home dates",
+                                     "remaining_home_dates")
+            if first_round and num_teams - 1 - total_matches > \
+                    remaining_play_dates[team_index][k] - remaining_play_dates[team_index][first_round_end_index]:
+                raise MatchPlanError(f"{team.team_name} can not finish the first round until "
+                                     f"{end_date_first_round}", "first_round_deadline")
+            if first_round and total_matches - home_matches > remaining_home_dates[team_index][sec_k]:
+                raise MatchPlanError(f"{team.team_name} needs at least {total_matches - home_matches} home matches "
+                                     f"in the second round but has only {remaining_home_dates[team_index][sec_k]}",
+                                     "second_round_home_dates")
+        if missing_matches > remaining_capacity[k]:
+            raise MatchPlanError(f"{missing_matches} matches are missing but the remaining dates allow at most "
+                                 f"{remaining_capacity[k]}", "remaining_capacity")
 
     def _check_round_complete(first_round=True):
         if first_round:
@@ -207,33 +329,511 @@ def create_match_plan(general_map, end_date_first_round, start_date_sec_round, c
         #       f" which already has scheduled {team.get_total_home_matches()} matches")
         return True
 
+    try:
+        start_date_sec_round_date = convert_date_string_to_datetime(start_date_sec_round)
+    except ValueError:
+        # print(f"Second Round start date not given or invalid ({start_date_sec_round})")
+        start_date_sec_round_date = datetime(1970, 1, 1)
+
+    team_indices = {team: team_index for team_index, team in enumerate(all_teams)}
+    remaining_play_dates = [[0] * (len(general_map) + 1) for _ in all_teams]
+    remaining_home_dates = [[0] * (len(general_map) + 1) for _ in all_teams]
+    remaining_capacity = [0] * (len(general_map) + 1)
+    _count_remaining_dates()
+    sec_round_index = next((k for k, match_day in enumerate(general_map)
+                            if match_day['datetime'] >= start_date_sec_round_date), len(general_map))
+    try:
+        end_date_first_round_date = convert_date_string_to_datetime(end_date_first_round)
+        # All matches of the first round have to take place before this date index
+        first_round_end_index = next((k for k, match_day in enumerate(general_map)
+                                      if match_day['datetime'] > end_date_first_round_date), len(general_map))
+    except ValueError:
+        first_round_end_index = len(general_map)
+
     map_final = []
     # print("")
     # print("====== MATCHING PHASE ======")
     first_round_done = False
     second_round_done = False
-    for entry in general_map:
+    for date_index, entry in enumerate(general_map):
         thisdict = {'datetime': entry['datetime'],
                     'matches': []}
+        matched_teams = set()  # teams which already have a match on this date
+        if stats is not None:
+            phase_start = stats.start()
         if not first_round_done:
             if _check_round_complete(first_round=True):
                 first_round_done = True
-
-        if not first_round_done:
-            _match_two_opponents(first_round=True)
-            map_final.append(thisdict)
-        else:
-            if _check_round_complete(first_round=False):
-                second_round_done = True
-                break
-            _match_two_opponents(first_round=False)
-            map_final.append(thisdict)
+        _abort_if_infeasible(date_index, first_round=not first_round_done)
+        if first_round_done and _check_round_complete(first_round=False):
+            second_round_done = True
+        if stats is not None:
+            phase_start = stats.stop('round_checks', phase_start)
+        if second_round_done:
+            break
+
+        _match_two_opponents(first_round=not first_round_done)
+        map_final.append(thisdict)
+        if stats is not None:
+            stats.stop('pairing', phase_start)
     if not second_round_done:
-        raise Exception(f"Was not able to create a matching plan")
+        raise MatchPlanError(f"Was not able to create a matching plan", "incomplete")
     return map_final
 
 
+def get_attempt_seed(master_seed, iteration):
+    """
+    Derives the seed of a single attempt, independent of how the attempts are distributed over batches and workers
+    """
+    return random.Random(f"{master_seed}-{iteration}").getrandbits(63)
+
+
+def run_attempt(problem, attempt_seed, end_date_first_round, start_date_second_round, allow_consecutive_matches,
+                allow_shuffle_matches, pairing, stats=None):
+    """
+    Runs a single match plan attempt with its own random number generator, so that it can be replayed from its seed
+    :param stats: instrumentation.RunStats to record the attempt, None to disable the instrumentation
+    :return: match plan and all teams
+    :raises MatchPlanError: if the attempt was not able to create a match plan
+    """
+    if stats is not None:
+        phase_start = stats.start()
+    # Fresh team instances and map of match dates, all dates are already parsed by the problem
+    all_teams, map_all_combinations = problem.new_attempt()
+    if stats is not None:
+        stats.stop('setup', phase_start)
+
+    # Create a match plan
+    match_plan = create_match_plan(map_all_combinations, end_date_first_round, start_date_second_round,
+                                   allow_consecutive_matches, allow_shuffle_matches, all_teams, pairing,
+                                   random.Random(attempt_seed), stats)
+    return match_plan, all_teams
+
+
+def search_match_plans(first_iteration, attempts, master_seed, problem, end_date_first_round, start_date_second_round,
+                       allow_consecutive_matches, allow_shuffle_matches, pairing, weight, return_on_first_match_plan,
+                       instrumentation=None, deadline=None, target_score=None, archive_size=0, keep_front=False):
+    """
+    Runs a batch of randomized match plan attempts and keeps only the best plan found within this batch
+    :param first_iteration: global number of the first attempt within this batch
+    :param attempts: number of attempts to run
+    :param master_seed: seed of the search, every attempt uses the seed of get_attempt_seed
+    :param problem: league parsed once from teams.json, see problem.Problem
+    :param instrumentation: [allow, profile_attempts] from teams.json, None to disable the instrumentation
+    :param deadline: time.monotonic() after which no further attempt is started, None for no limit
+    :param target_score: the batch stops as soon as a plan with at most this score is found, None for no target
+    :param archive_size: number of the best distinct plans of this batch which are kept as archive.PlanArchive, 0 to
+                         keep only the best plan
+    :param keep_front: keep the plans which are not dominated in the metrics of the score as archive.ParetoFront
+    :return: number of attempts which were run, the best result as
+             [score, report, match plan, all teams, iteration, attempt seed] or None if no match plan was found, the
+             instrumentation.RunStats of this batch or None, the archive.PlanArchive of this batch or None and the
+             archive.ParetoFront of this batch or None
+    """
+    stats = None
+    if instrumentation is not None and instrumentation[0] == 1:
+        stats = RunStats(instrumentation[1])
+    archive = PlanArchive(archive_size) if archive_size > 0 else None
+    front = ParetoFront() if keep_front else None
+    best_result = None
+    attempts_done = 0
+    for i in range(first_iteration, first_iteration + attempts):
+        if deadline is not None and attempts_done > 0 and monotonic() >= deadline:
+            break
+        attempts_done += 1
+        attempt_seed = get_attempt_seed(master_seed, i)
+        profiler = None
+        if stats is not None:
+            stats.count('attempts')
+            profiler = stats.profiler(i)
+            if profiler is not None:
+                profiler.enable()
+        try:
+            curr_match_plan, all_teams = run_attempt(problem, attempt_seed, end_date_first_round,
+                                                     start_date_second_round, allow_consecutive_matches,
+                                                     allow_shuffle_matches, pairing, stats)
+
+            if stats is not None:
+                stats.count('successes')
+                phase_start = stats.start()
+            curr_score, curr_report = calculate_score(weight, all_teams, curr_match_plan)
+            if stats is not None:
+                stats.stop('scoring', phase_start)
+
+            if best_result is None or curr_score < best_result[0]:
+                best_result = [curr_score, curr_report, curr_match_plan, all_teams, i, attempt_seed]
+            if archive is not None and archive.accepts(curr_score):
+                archive.add(curr_score, problem.encode_match_plan(curr_match_plan), i, attempt_seed)
+            if front is not None:
+                curr_metrics = calculate_metrics(all_teams, curr_match_plan)
+                if front.accepts(curr_metrics):
+                    front.add(curr_metrics, problem.encode_match_plan(curr_match_plan), i, attempt_seed)
+
+            if return_on_first_match_plan:
+                break
+            if target_score is not None and curr_score <= target_score:
+                break
+        except Exception as e:
+            # print(f"Run {i}: Was not able to create a matching plan")
+            if stats is not None:
+                stats.fail(getattr(e, 'cause', type(e).__name__))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    if stats is not None:
+        stats.finish_profile()
+    return attempts_done, best_result, stats, archive, front
+
+
+DEFAULT_STOP_CRITERIA = {'time_limit': 0, 'target_score': None, 'plateau_attempts': 0, 'plateau_seconds': 0}
+
+
+def get_batch_size(iterations, workers):
+    # Roughly ten batches per worker, so that progress can be reported in steps of 10%
+    return min(max(iterations // (workers * 10), 1), 1000)
+
+
+def search_best_match_plan(iterations, workers, master_seed, search_args, return_on_first_match_plan, stats=None,
+                           stop_criteria=None, progress=None, archive=None, front=None, cancelled=None):
+    """
+    Distributes the randomized match plan attempts in batches over a pool of worker processes. Every attempt gets its
+    own seed derived from the master seed, every batch sends back only its best plan, the global best plan is kept here.
+    :param iterations: total number of attempts
+    :param workers: number of worker processes, 1 runs all attempts within this process
+    :param master_seed: seed of the search
+    :param search_args: arguments passed to search_match_plans after the batch parameters
+    :param stats: instrumentation.RunStats which collects the stats of all batches, None if disabled
+    :param stop_criteria: dict with time_limit, target_score, plateau_attempts and plateau_seconds from teams.json,
+                          0 or None disables a criterion
+    :param progress: callable which receives every progress step and improvement as dict, None if not needed
+    :param archive: archive.PlanArchive which collects the best distinct plans of all batches and is written whenever
+                    it changes, None to keep only the best plan
+    :param front: archive.ParetoFront which collects the non-dominated plans of all batches and is written whenever it
+                  changes, None if not needed
+    :param cancelled: callable which returns True if the search should stop, checked after every batch, None if the
+                      search can not be cancelled
+    :return: best result as [score, report, match plan, all teams, iteration, attempt seed] or None if no match plan
+             was found
+    """
+    stop_criteria = dict(DEFAULT_STOP_CRITERIA, **(stop_criteria or {}))
+    time_limit = stop_criteria['time_limit'] or None
+    target_score = stop_criteria['target_score']
+    plateau_attempts = stop_criteria['plateau_attempts'] or None
+    plateau_seconds = stop_criteria['plateau_seconds'] or None
+    start_time = monotonic()
+    deadline = start_time + time_limit if time_limit is not None else None
+    batch_size = get_batch_size(iterations, workers)
+    best_result = None
+    done_iterations = 0
+    next_iteration = 0
+    printed_percentage = 0
+    improvement_iteration = 0  # done iterations when the best result was found
+    improvement_time = start_time
+    stop_reason = None
+    print("RUN:0", flush=True)
+
+    def _next_batch_size():
+        size = min(batch_size, iterations - next_iteration)
+        if plateau_attempts is not None:
+            # The plateau is checked after every batch, so a batch must not be much longer than the plateau
+            size = min(size, max(plateau_attempts // workers, 1))
+        if time_limit is not None or plateau_seconds is not None:
+            # Batches of about one second, so that the time based criteria are checked regularly
+            elapsed = monotonic() - start_time
+            attempts_per_second = done_iterations / elapsed / workers if done_iterations and elapsed > 0 else 1
+            size = max(min(size, int(attempts_per_second)), 1)
+        return size
+
+    def _stops_search(result):
+        return return_on_first_match_plan or (target_score is not None and result[0] <= target_score)
+
+    def _result_key(result):
+        # Independent of the order in which the batches finish: of the plans which stop the search the earliest
+        # attempt wins as if all attempts ran one after another, otherwise the lowest score and then the earliest
+        # attempt
+        if _stops_search(result):
+            return 0, result[4], result[0]
+        return 1, result[0], result[4]
+
+    def _handle_batch_result(batch_result):
+        nonlocal best_result, done_iterations, printed_percentage, improvement_iteration, improvement_time
+        attempts_done, batch_best_result, batch_stats, batch_archive, batch_front = batch_result
+        if stats is not None and batch_stats is not None:
+            stats.merge(batch_stats)
+        if archive is not None and batch_archive is not None and archive.merge(batch_archive):
+            archive.write(search_args[0])
+        if front is not None and batch_front is not None and front.merge(batch_front):
+            front.write(search_args[0])
+        done_iterations += attempts_done
+        percentage = (done_iterations * 100) // iterations
+        if time_limit is not None:
+            percentage = max(percentage, int((monotonic() - start_time) * 100 / time_limit))
+        percentage = min(percentage, 90) // 10 * 10
+        for step in range(printed_percentage + 10, percentage + 1, 10):
+            print(f"RUN:{step}", flush=True)
+            if progress is not None:
+                progress({'event': 'progress', 'percent': step, 'attempts': done_iterations})
+        printed_percentage = max(printed_percentage, percentage)
+        if batch_best_result is not None and (best_result is None or
+                                              _result_key(batch_best_result) < _result_key(best_result)):
+            best_result = batch_best_result
+            improvement_iteration = done_iterations
+            improvement_time = monotonic()
+            print(f"Spielplan gefunden nach Iteration {best_result[4] + 1} mit score {best_result[0]} "
+                  f"(Seed {best_result[5]})", flush=True)
+            logging.info(f"Spielplan gefunden nach Iteration {best_result[4] + 1} mit score {best_result[0]} "
+                         f"(Seed {best_result[5]})")
+            if progress is not None:
+                progress({'event': 'best', 'score': best_result[0], 'iteration': best_result[4] + 1,
+                          'seed': best_result[5]})
+
+    def _get_stop_reason():
+        now = monotonic()
+        if cancelled is not None and cancelled():
+            return "abgebrochen"
+        if return_on_first_match_plan and best_result is not None:
+            return "erster Spielplan gefunden"
+        if target_score is not None and best_result is not None and best_result[0] <= target_score:
+            return f"Ziel-Score {target_score} erreicht"
+        if deadline is not None and now >= deadline:
+            return f"Zeitlimit von {time_limit} Sekunden erreicht"
+        if best_result is not None and plateau_attempts is not None and \
+                done_iterations - improvement_iteration >= plateau_attempts:
+            return f"keine Verbesserung seit {done_iterations - improvement_iteration} Versuchen"
+        if best_result is not None and plateau_seconds is not None and now - improvement_time >= plateau_seconds:
+            return f"keine Verbesserung seit {int(now - improvement_time)} Sekunden"
+        return None
+
+    batch_kwargs = {'deadline': deadline, 'target_score': target_score,
+                    'archive_size': archive.capacity if archive is not None else 0, 'keep_front': front is not None}
+    if workers <= 1:
+        while next_iteration < iterations:
+            attempts = _next_batch_size()
+            _handle_batch_result(search_match_plans(next_iteration, attempts, master_seed, *search_args,
+                                                    **batch_kwargs))
+            next_iteration += attempts
+            stop_reason = _get_stop_reason()
+            if stop_reason is not None:
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {}  # future of a batch and the iteration of its first attempt
+            while True:
+                while stop_reason is None and len(pending) < workers and next_iteration < iterations:
+                    attempts = _next_batch_size()
+                    pending[executor.submit(search_match_plans, next_iteration, attempts, master_seed, *search_args,
+                                            **batch_kwargs)] = next_iteration
+                    next_iteration += attempts
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del pending[future]
+                    _handle_batch_result(future.result())
+                if stop_reason is None:
+                    stop_reason = _get_stop_reason()
+                if stop_reason is not None:
+                    # Batches which started before the plan that stopped the search may still find an earlier one
+                    last_iteration = best_result[4] if best_result is not None and _stops_search(best_result) else -1
+                    for future, first_iteration in list(pending.items()):
+                        if first_iteration > last_iteration and future.cancel():
+                            del pending[future]
+
+    if stop_reason is None:
+        stop_reason = f"alle {done_iterations} Versuche durchgefuehrt"
+    print(f"Suche beendet: {stop_reason}", flush=True)
+    logging.info(f"Suche beendet: {stop_reason}")
+    return best_result
+
+
+def read_settings(parsed_json):
+    """
+    Reads the settings of a league from the parsed teams.json
+    :return: dict of settings, optional entries are filled with their defaults
+    :raises KeyError: if a required entry is missing
+    """
+    iterations = parsed_json['max_iterations']
+    if iterations == 0:
+        iterations = sys.maxsize
+    workers = parsed_json.get('workers', 1)
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    local_search = parsed_json.get('local_search', {'allow': 0, 'time_budget': 0})
+    instrumentation = parsed_json.get('instrumentation', {'allow': 0, 'profile_attempts': 0})
+    archive = parsed_json.get('archive', {'allow': 0, 'size': 10})
+    pareto = parsed_json.get('pareto', {'allow': 0})
+    cache = parsed_json.get('cache', {'allow': 0, 'max_size_mb': 100})
+    return {
+        'weight': parsed_json['weight'],
+        'start_date_first_round': parsed_json['start_date_first_round'],
+        'start_date_second_round': parsed_json['start_date_second_round'],
+        'end_date_first_round': parsed_json['end_date_first_round'],
+        'general_blocked_dates': parsed_json['general_blocked_dates'],
+        'consecutive_matches': [parsed_json['consecutive_matches']['allow'],
+                                parsed_json['consecutive_matches']['probability']],
+        'shuffle_matches': [parsed_json['shuffle_matches']['allow'],
+                            parsed_json['shuffle_matches']['shuffle_part']],
+        'iterations': iterations,
+        'return_on_first_match_plan': parsed_json['return_on_first_match_plan'],
+        'workers': workers,
+        'pairing': parsed_json.get('pairing', 'greedy'),
+        'solver': parsed_json.get('solver', 'greedy'),
+        'solver_time_limit': parsed_json.get('solver_time_limit', 0) or None,
+        'local_search': [local_search['allow'], local_search['time_budget'], local_search.get('max_steps', 0)],
+        'seed': parsed_json.get('seed'),
+        'replay_seed': parsed_json.get('replay_seed'),
+        'stop_criteria': dict(DEFAULT_STOP_CRITERIA, **parsed_json.get('stop_criteria', {})),
+        'instrumentation': [instrumentation['allow'], instrumentation['profile_attempts']],
+        'cache': [cache['allow'], cache['max_size_mb']],
+        'archive': [archive['allow'], archive['size']],
+        'pareto': pareto['allow'],
+    }
+
+
+def schedule_league(problem, settings, run_stats=None, progress=None, archive=None, front=None, cancelled=None):
+    """
+    Creates the best match plan of a league as configured in teams.json: replay of a single attempt, exact solver,
+    round robin template or randomized search, optionally improved by the local search
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param settings: settings of read_settings, the seed must be set
+    :param run_stats: instrumentation.RunStats which collects the stats of the run, None if disabled
+    :param progress: callable which receives the progress of the randomized search and every improvement as dict,
+                     see search_best_match_plan
+    :param archive: archive.PlanArchive which collects the best distinct plans, None to keep only the best plan
+    :param front: archive.ParetoFront which collects the non-dominated plans, None if not needed
+    :param cancelled: callable which returns True if the randomized search should stop, see search_best_match_plan
+    :return: best result as [score, report, match plan, all teams, iteration, attempt seed] or None if no match plan
+             was found
+    """
+    weight = settings['weight']
+    start_date_second_round = settings['start_date_second_round']
+    allow_consecutive_matches = settings['consecutive_matches']
+    master_seed = settings['seed']
+    replay_seed = settings['replay_seed']
+    best_result = None
+    if replay_seed is not None:
+        # Repeat a single attempt of an earlier run, e.g. to debug a match plan
+        try:
+            replay_match_plan, replay_teams = run_attempt(problem, replay_seed, settings['end_date_first_round'],
+                                                          start_date_second_round, allow_consecutive_matches,
+                                                          settings['shuffle_matches'], settings['pairing'], run_stats)
+            replay_score, replay_report = calculate_score(weight, replay_teams, replay_match_plan)
+            best_result = [replay_score, replay_report, replay_match_plan, replay_teams, 0, replay_seed]
+            print(f"Spielplan wiederholt mit Seed {replay_seed} mit score {replay_score}", flush=True)
+            logging.info(f"Spielplan wiederholt mit Seed {replay_seed} mit score {replay_score}")
+        except MatchPlanError as e:
+            print(f"Seed {replay_seed} erzeugt keinen Spielplan: {e}", flush=True)
+            logging.error(f"Seed {replay_seed} erzeugt keinen Spielplan: {e}")
+    elif settings['solver'] == 'exact':
+        try:
+            exact_match_plan, exact_teams, optimal = solve_match_plan(problem, start_date_second_round,
+                                                                      allow_consecutive_matches, weight,
+                                                                      time_limit=settings['solver_time_limit'])
+            exact_score, exact_report = calculate_score(weight, exact_teams, exact_match_plan)
+            best_result = [exact_score, exact_report, exact_match_plan, exact_teams, 0, None]
+            optimal_text = " (optimal)" if optimal else ""
+            print(f"Spielplan gefunden mit exaktem Solver mit score {exact_score}{optimal_text}", flush=True)
+            logging.info(f"Spielplan gefunden mit exaktem Solver mit score {exact_score}{optimal_text}")
+        except InfeasiblePlanError as e:
+            print("Es existiert kein gueltiger Spielplan:", flush=True)
+            for reason in e.reasons:
+                print(f"- {reason}", flush=True)
+            logging.error(f"Es existiert kein gueltiger Spielplan: {e}")
+        except SolverError as e:
+            print(f"Exakter Solver hat keinen Spielplan gefunden: {e}", flush=True)
+            logging.error(f"Exakter Solver hat keinen Spielplan gefunden: {e}")
+    elif settings['solver'] == 'template':
+        try:
+            template_match_plan, template_teams = solve_template_plan(
+                problem, start_date_second_round, allow_consecutive_matches, weight, settings['iterations'],
+                settings['solver_time_limit'], settings['return_on_first_match_plan'], random.Random(master_seed))
+            template_score, template_report = calculate_score(weight, template_teams, template_match_plan)
+            best_result = [template_score, template_report, template_match_plan, template_teams, 0, None]
+            print(f"Spielplan gefunden mit Spielplanvorlage mit score {template_score}", flush=True)
+            logging.info(f"Spielplan gefunden mit Spielplanvorlage mit score {template_score}")
+        except TemplateError as e:
+            print(f"Spielplanvorlage passt nicht auf die Spieltermine: {e}", flush=True)
+            logging.error(f"Spielplanvorlage passt nicht auf die Spieltermine: {e}")
+    else:
+        search_args = (problem, settings['end_date_first_round'], start_date_second_round,
+                       allow_consecutive_matches, settings['shuffle_matches'], settings['pairing'], weight,
+                       settings['return_on_first_match_plan'], settings['instrumentation'])
+        best_result = search_best_match_plan(settings['iterations'], settings['workers'], master_seed, search_args,
+                                             settings['return_on_first_match_plan'], run_stats,
+                                             settings['stop_criteria'], progress, archive, front, cancelled)
+
+    if best_result is not None and settings['local_search'][0] == 1:
+        improved_match_plan, improved_teams, improved_score = improve_match_plan(
+            problem, best_result[2], weight, start_date_second_round, allow_consecutive_matches,
+            settings['local_search'][1], random.Random(master_seed), settings['local_search'][2])
+        if improved_score < best_result[0]:
+            improved_score, improved_report = calculate_score(weight, improved_teams, improved_match_plan)
+            best_result = [improved_score, improved_report, improved_match_plan, improved_teams,
+                           best_result[4], best_result[5]]
+            print(f"Spielplan verbessert durch lokale Suche mit score {improved_score}", flush=True)
+            logging.info(f"Spielplan verbessert durch lokale Suche mit score {improved_score}")
+            if progress is not None:
+                progress({'event': 'best', 'score': improved_score, 'iteration': best_result[4] + 1,
+                          'seed': best_result[5]})
+    if archive is not None and best_result is not None:
+        # Plans of the exact solver, the template or the local search are not found by a batch
+        if archive.add(best_result[0], problem.encode_match_plan(best_result[2]), best_result[4], best_result[5]):
+            archive.write(problem)
+    if front is not None and best_result is not None:
+        if front.add(calculate_metrics(best_result[3], best_result[2]), problem.encode_match_plan(best_result[2]),
+                     best_result[4], best_result[5]):
+            front.write(problem)
+    return best_result
+
+
+def schedule_league_with_cache(parsed_json, problem, settings, run_stats=None, progress=None, archive=None,
+                               front=None, cancelled=None):
+    """
+    schedule_league with the plan cache of teams.json: a league which was already scheduled with the same teams,
+    dates and search settings is taken from the cache and only scored with the current weight. All plans of the
+    archive and the Pareto front are cached as candidates for another weight, on a cache hit they fill the archive
+    and the Pareto front again.
+    :param parsed_json: content of teams.json
+    :return: see schedule_league
+    """
+    if settings['cache'][0] != 1:
+        return schedule_league(problem, settings, run_stats, progress, archive, front, cancelled)
+    cache = PlanCache(os.path.join(get_executable_location(), "cache"), settings['cache'][1] * 1024 * 1024)
+    cached_results = cache.get_all(parsed_json, problem, settings['weight'])
+    if cached_results:
+        best_result = min(cached_results, key=lambda result: result[0])
+        if run_stats is not None:
+            run_stats.cache_hit = True
+        for score, _, match_plan, all_teams, iteration, attempt_seed in cached_results:
+            if archive is not None:
+                archive.add(score, problem.encode_match_plan(match_plan), iteration, attempt_seed)
+            if front is not None:
+                front.add(calculate_metrics(all_teams, match_plan), problem.encode_match_plan(match_plan), iteration,
+                          attempt_seed)
+        if archive is not None:
+            archive.write(problem)
+        if front is not None:
+            front.write(problem)
+        print(f"Spielplan aus dem Cache geladen mit score {best_result[0]}", flush=True)
+        logging.info(f"Spielplan aus dem Cache geladen mit score {best_result[0]}")
+        if progress is not None:
+            progress({'event': 'best', 'score': best_result[0], 'iteration': best_result[4] + 1,
+                      'seed': best_result[5]})
+        return best_result
+    best_result = schedule_league(problem, settings, run_stats, progress, archive, front, cancelled)
+    # The plan of a cancelled search is not the result of the settings, so it is not cached
+    if best_result is not None and (cancelled is None or not cancelled()):
+        candidates = [best_result]
+        plans = (archive.plans() if archive is not None else []) + (front.plans() if front is not None else [])
+        for _, fixtures, iteration, attempt_seed in plans:
+            match_plan, all_teams = problem.build_match_plan(fixtures)
+            candidates.append([None, None, match_plan, all_teams, iteration, attempt_seed])
+        cache.put(parsed_json, problem, candidates)
+    return best_result
+
+
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     print("=============== V0.5 ==================", flush=True)
     filename = ""
     try:
@@ -249,19 +849,7 @@ if __name__ == '__main__':
     try:
         parsed_json = json.loads(file_contents)
         teams_json = parsed_json['teams']
-        weight = parsed_json['weight']
-        start_date_first_round = parsed_json['start_date_first_round']
-        start_date_second_round = parsed_json['start_date_second_round']
-        end_date_first_round = parsed_json['end_date_first_round']
-        general_blocked_dates = parsed_json['general_blocked_dates']
-        allow_consecutive_matches = [parsed_json['consecutive_matches']['allow'],
-                                     parsed_json['consecutive_matches']['probability']]
-        allow_shuffle_matches = [parsed_json['shuffle_matches']['allow'],
-                                 parsed_json['shuffle_matches']['shuffle_part']]
-        iterations = parsed_json['max_iterations']
-        if iterations == 0:
-            iterations = sys.maxsize
-        return_on_first_match_plan = parsed_json['return_on_first_match_plan']
+        settings = read_settings(parsed_json)
     except Exception as e:
         print("Fehler beim Verarbeiten der teams.json Datei mit folgender Fehlermeldung:", flush=True)
         print("", flush=True)
@@ -269,65 +857,60 @@ if __name__ == '__main__':
         logging.error(f"Fehler beim Verarbeiten der teams.json Datei mit folgender Fehlermeldung: {e}")
         sys.exit(1)
 
-    tmp_team = [Team(team_line,
-                      convert_date_string_list_to_datetime(teams_json[team_line]['available_dates_home_matches']),
-                      convert_date_string_list_to_datetime(teams_json[team_line]['blocked_dates_matches']),
-                      convert_date_string_list_to_datetime(teams_json[team_line]['please_dont_play_dates'])
-                      )
-                 for team_line in teams_json]
+    try:
+        problem = Problem(teams_json, settings['start_date_first_round'], settings['general_blocked_dates'],
+                          settings['end_date_first_round'])
+    except Exception as e:
+        print("Fehler beim Verarbeiten der teams.json Datei mit folgender Fehlermeldung:", flush=True)
+        print("", flush=True)
+        print(e, flush=True)
+        logging.error(f"Fehler beim Verarbeiten der teams.json Datei mit folgender Fehlermeldung: {e}")
+        sys.exit(1)
 
-    print(f"{len(tmp_team)} Vereine gefunden. Versuche Spielplan zu erstellen:", flush=True)
-    logging.info(f"{len(tmp_team)} Vereine gefunden. Versuche Spielplan zu erstellen:")
+    print(f"{len(problem.team_names)} Vereine gefunden. Versuche Spielplan zu erstellen:", flush=True)
+    logging.info(f"{len(problem.team_names)} Vereine gefunden. Versuche Spielplan zu erstellen:")
+
+    if settings['seed'] is None:
+        settings['seed'] = random.SystemRandom().getrandbits(63)
+    print(f"Seed: {settings['seed']}", flush=True)
+    logging.info(f"Seed: {settings['seed']}")
+
+    allow_instrumentation = settings['instrumentation']
+    run_stats = RunStats(allow_instrumentation[1]) if allow_instrumentation[0] == 1 else None
+    allow_archive = settings['archive']
+    archive = None
+    if allow_archive[0] == 1:
+        archive = PlanArchive(allow_archive[1], os.path.join(get_executable_location(), "spielplaene_top.ndjson"))
+    front = None
+    if settings['pareto'] == 1:
+        front = ParetoFront(os.path.join(get_executable_location(), "pareto_front.ndjson"))
+    best_result = schedule_league_with_cache(parsed_json, problem, settings, run_stats, archive=archive, front=front)
+    if front is not None and len(front):
+        print(f"Pareto-Front mit {len(front)} Spielplaenen gespeichert unter {front.filename}", flush=True)
+        logging.info(f"Pareto-Front mit {len(front)} Spielplaenen gespeichert unter {front.filename}")
 
     match_plan = []
-    report_match_plan = pandas.DataFrame()
+    report_match_plan = []
     report = ""
     score = 999999
-
-    #for i in tqdm(range(iterations)):
-    for i in range(iterations):
-        percentage = (i * 100) / iterations
-        if percentage%10 == 0:
-            print(f"RUN:{int(percentage)}", flush=True)
-        try:
-            # Create an instance for every team within the json file
-            all_teams = [Team(team_line,
-                              convert_date_string_list_to_datetime(teams_json[team_line]['available_dates_home_matches']),
-                              convert_date_string_list_to_datetime(teams_json[team_line]['blocked_dates_matches']),
-                              convert_date_string_list_to_datetime(teams_json[team_line]['please_dont_play_dates'])
-                              )
-                         for team_line in teams_json]
-            # print(f"Created an instance for {len(all_teams)} Teams")
-
-            # Determine all possible match days
-            all_match_dates = get_all_match_dates(all_teams, start_date_first_round)
-
-            # Map match dates to all teams
-            map_all_combinations = map_general_match_dates_to_teams(all_teams, all_match_dates)
-
-            # Create a match plan
-            curr_match_plan = create_match_plan(map_all_combinations, end_date_first_round, start_date_second_round,
-                                           allow_consecutive_matches, allow_shuffle_matches)
-
-            curr_score, curr_report = calculate_score(weight, all_teams, curr_match_plan)
-
-            if curr_score < score:
-                score = curr_score
-                match_plan = curr_match_plan
-                report = curr_report
-                report_match_plan = match_plan_to_report(match_plan, all_teams)
-                # print(report_match_plan)
-                # print("=======================================")
-                print(f"Spielplan gefunden nach Iteration {i + 1} mit score {score}", flush=True)
-                logging.info(f"Spielplan gefunden nach Iteration {i + 1} mit score {score}")
-
-           # sleep(5)
-            if return_on_first_match_plan:
-                break
-        except Exception as e:
-            # sleep(1)
-            # print(f"Run {i}: Was not able to create a matching plan")
-            pass
+    if best_result is not None:
+        score, report, match_plan, all_teams, _, _ = best_result
+        if run_stats is not None:
+            phase_start = run_stats.start()
+        report_match_plan = match_plan_to_rows(match_plan, all_teams)
+        if run_stats is not None:
+            run_stats.stop('report', phase_start)
+
+    if run_stats is not None:
+        script_folder = get_executable_location()
+        stats_filename = os.path.join(script_folder, "instrumentation.json")
+        run_stats.write(stats_filename)
+        print(f"Laufzeitstatistik gespeichert unter {stats_filename}", flush=True)
+        logging.info(f"Laufzeitstatistik gespeichert unter {stats_filename}")
+        profile_filename = os.path.join(script_folder, "profile.prof")
+        if run_stats.write_profile(profile_filename):
+            print(f"Profil gespeichert unter {profile_filename}", flush=True)
+            logging.info(f"Profil gespeichert unter {profile_filename}")
 
     if match_plan:
         print("=======================================", flush=True)
@@ -341,7 +924,7 @@ if __name__ == '__main__':
         script_folder = get_executable_location()
         filename = os.path.join(script_folder, "spielplan.csv")
         logging.info(f"saving generated match plan as csv to {filename}")
-        report_match_plan.to_csv(filename, sep=';')
+        write_report_csv(filename, report_match_plan)
     else:
         # print("")
         print("=======================================", flush=True)
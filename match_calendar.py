@@ -0,0 +1,62 @@
+from bisect import bisect_right
+
+
+class MatchCalendar:
+    """
+    Eligibility of every team for every match date, built once per league. League wide blocked dates are no match
+    dates at all, every team has a bitmap over the match dates for hosting a match and for playing at all, which
+    combines its home dates and its own blocked dates.
+    """
+
+    def __init__(self, home_date_ordinals, blocked_date_ordinals, general_blocked_ordinals=(), start_ordinal=0,
+                 first_round_deadline=None):
+        """
+        :param home_date_ordinals: per team the day ordinals on which it is able to host a match
+        :param blocked_date_ordinals: per team the day ordinals on which it is not able to play
+        :param general_blocked_ordinals: day ordinals on which no match takes place
+        :param start_ordinal: first day of the season
+        :param first_round_deadline: last day ordinal of the first round, None for no deadline
+        """
+        general_blocked = frozenset(general_blocked_ordinals)
+        self.match_date_ordinals = tuple(sorted({ordinal for ordinals in home_date_ordinals for ordinal in ordinals
+                                                 if ordinal >= start_ordinal and ordinal not in general_blocked}))
+        self.date_index = {ordinal: index for index, ordinal in enumerate(self.match_date_ordinals)}
+        num_dates = len(self.match_date_ordinals)
+        self.home_masks = []
+        self.play_masks = []
+        for home_ordinals, blocked_ordinals in zip(home_date_ordinals, blocked_date_ordinals):
+            play_mask = bytearray(b'\x01') * num_dates
+            home_mask = bytearray(num_dates)
+            for ordinal in blocked_ordinals:
+                index = self.date_index.get(ordinal)
+                if index is not None:
+                    play_mask[index] = 0
+            for ordinal in home_ordinals:
+                index = self.date_index.get(ordinal)
+                if index is not None and play_mask[index]:
+                    home_mask[index] = 1
+            self.home_masks.append(bytes(home_mask))
+            self.play_masks.append(bytes(play_mask))
+        # Number of match dates on or before the deadline, all first round matches have lower date indices
+        if first_round_deadline is None:
+            self.first_round_end = num_dates
+        else:
+            self.first_round_end = bisect_right(self.match_date_ordinals, first_round_deadline)
+
+    def can_host(self, team, date_index):
+        return self.home_masks[team][date_index] == 1
+
+    def can_play(self, team, date_index):
+        return self.play_masks[team][date_index] == 1
+
+    def home_teams(self, date_index):
+        """
+        :return: indices of the teams which are able to host a match on a date
+        """
+        return tuple(team for team, mask in enumerate(self.home_masks) if mask[date_index])
+
+    def away_teams(self, date_index):
+        """
+        :return: indices of the teams which are able to play on a date
+        """
+        return tuple(team for team, mask in enumerate(self.play_masks) if mask[date_index])
@@ -0,0 +1,82 @@
+def maximum_matching(adjacency, matching=None):
+    """
+    Maximum cardinality matching of a general graph with Edmonds' blossom algorithm. Every team can be home or away
+    team, so the graph of possible pairings is not bipartite.
+    :param adjacency: list of neighbour lists for every vertex
+    :param matching: initial matching as list of the partner of every vertex or -1, which is only extended by augmenting
+                     paths, so that preferred pairings of a greedy start are kept as far as possible
+    :return: list with the partner of every vertex or -1 if it is not matched
+    """
+    num_vertices = len(adjacency)
+    match = list(matching) if matching is not None else [-1] * num_vertices
+    for root in range(num_vertices):
+        if match[root] != -1:
+            continue
+        vertex, parent = _find_augmenting_path(adjacency, match, root)
+        while vertex != -1:
+            # Flip the matched and unmatched edges along the path
+            next_vertex = match[parent[vertex]]
+            match[vertex] = parent[vertex]
+            match[parent[vertex]] = vertex
+            vertex = next_vertex
+    return match
+
+
+def _find_augmenting_path(adjacency, match, root):
+    """
+    :return: end of an augmenting path starting at root or -1 if there is none, and the parents along the path
+    """
+    num_vertices = len(adjacency)
+    used = [False] * num_vertices
+    parent = [-1] * num_vertices
+    base = list(range(num_vertices))
+    used[root] = True
+    queue = [root]
+
+    def _lowest_common_ancestor(first, second):
+        visited = [False] * num_vertices
+        while True:
+            first = base[first]
+            visited[first] = True
+            if match[first] == -1:
+                break
+            first = parent[match[first]]
+        while True:
+            second = base[second]
+            if visited[second]:
+                return second
+            second = parent[match[second]]
+
+    def _mark_path(vertex, blossom_base, child, blossom):
+        while base[vertex] != blossom_base:
+            blossom[base[vertex]] = blossom[base[match[vertex]]] = True
+            parent[vertex] = child
+            child = match[vertex]
+            vertex = parent[match[vertex]]
+
+    position = 0
+    while position < len(queue):
+        vertex = queue[position]
+        position += 1
+        for neighbour in adjacency[vertex]:
+            if base[vertex] == base[neighbour] or match[vertex] == neighbour:
+                continue
+            if neighbour == root or (match[neighbour] != -1 and parent[match[neighbour]] != -1):
+                # Odd cycle found, contract the blossom
+                blossom_base = _lowest_common_ancestor(vertex, neighbour)
+                blossom = [False] * num_vertices
+                _mark_path(vertex, blossom_base, neighbour, blossom)
+                _mark_path(neighbour, blossom_base, vertex, blossom)
+                for other in range(num_vertices):
+                    if blossom[base[other]]:
+                        base[other] = blossom_base
+                        if not used[other]:
+                            used[other] = True
+                            queue.append(other)
+            elif parent[neighbour] == -1:
+                parent[neighbour] = vertex
+                if match[neighbour] == -1:
+                    return neighbour, parent
+                used[match[neighbour]] = True
+                queue.append(match[neighbour])
+    return -1, parent
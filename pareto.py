@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import sys
+from main import read_settings
+from archive import METRIC_NAMES, fixtures_from_names, get_weighted_score, read_front
+from evaluate_plan import calculate_score, match_plan_to_rows, write_report_csv
+from problem import Problem
+from utils import format_table, get_executable_location
+
+FRONT_HEADERS = ["Doppelspiele", "Heim/Auswaerts", "Unerwuenschte Spiele", "Abweichung Spieltage", "Score"]
+
+
+def main():
+    script_folder = get_executable_location()
+    parser = argparse.ArgumentParser(description="Waehlt mit der Gewichtung aus teams.json den besten Spielplan der "
+                                                 "Pareto-Front eines frueheren Laufs")
+    parser.add_argument('--teams', default=os.path.join(script_folder, 'teams.json'), help="teams.json der Liga")
+    parser.add_argument('--front', default=os.path.join(script_folder, 'pareto_front.ndjson'),
+                        help="Pareto-Front eines frueheren Laufs")
+    parser.add_argument('--output', default=os.path.join(script_folder, 'spielplan.csv'),
+                        help="Datei fuer den gewaehlten Spielplan")
+    args = parser.parse_args()
+
+    try:
+        with open(args.teams) as file:
+            parsed_json = json.load(file)
+        settings = read_settings(parsed_json)
+        problem = Problem(parsed_json['teams'], settings['start_date_first_round'],
+                          settings['general_blocked_dates'], settings['end_date_first_round'])
+        front = read_front(args.front)
+        plans = [[plan['metrics'][name] for name in METRIC_NAMES] for plan in front]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Fehler beim Lesen der Eingabedateien: {e}", flush=True)
+        sys.exit(1)
+    if not front:
+        print("Die Pareto-Front enthaelt keinen Spielplan", flush=True)
+        sys.exit(1)
+
+    weight = settings['weight']
+    rows = [metrics + [get_weighted_score(weight, metrics)] for metrics in plans]
+    print(format_table(rows, FRONT_HEADERS), flush=True)
+    best = min(range(len(rows)), key=lambda index: rows[index][-1])
+    try:
+        fixtures = fixtures_from_names(problem, front[best]['fixtures'])
+    except KeyError as e:
+        print(f"Die Pareto-Front passt nicht zur teams.json: {e}", flush=True)
+        sys.exit(1)
+    match_plan, all_teams = problem.build_match_plan(fixtures)
+    score, report = calculate_score(weight, all_teams, match_plan)
+    print("=======================================", flush=True)
+    print(f"Spielplan {best} gewaehlt mit score {score}", flush=True)
+    print(report, flush=True)
+    write_report_csv(args.output, match_plan_to_rows(match_plan, all_teams))
+    print(f"Spielplan gespeichert unter {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
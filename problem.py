@@ -0,0 +1,131 @@
+from datetime import datetime
+from match_calendar import MatchCalendar
+from schedule_state import ScheduleState
+from team import Team
+from utils import convert_date_string_list_to_datetime, convert_date_string_to_datetime
+
+
+class Problem:
+    """
+    League from teams.json, parsed once and shared by all match plan attempts. All dates are kept as sorted tuples of
+    datetimes together with their integer day ordinals, the possible match dates are mapped to the indices of the teams
+    which are able to play a home or away match on that date.
+    """
+
+    def __init__(self, teams_json, start_date_first_round, general_blocked_dates=(), end_date_first_round=""):
+        """
+        :param teams_json: teams section of teams.json
+        :param start_date_first_round: first date of the season as string, empty or invalid for no restriction
+        :param general_blocked_dates: dates as string on which no match takes place
+        :param end_date_first_round: last date of the first round as string, empty or invalid for no deadline
+        """
+        self.team_names = tuple(teams_json)
+        self.available_dates_home_matches = tuple(
+            tuple(sorted(convert_date_string_list_to_datetime(teams_json[name]['available_dates_home_matches'])))
+            for name in self.team_names)
+        self.blocked_dates_matches = tuple(
+            tuple(sorted(convert_date_string_list_to_datetime(teams_json[name]['blocked_dates_matches'])))
+            for name in self.team_names)
+        self.please_dont_play_dates = tuple(
+            tuple(sorted(convert_date_string_list_to_datetime(teams_json[name]['please_dont_play_dates'])))
+            for name in self.team_names)
+        self.home_date_ordinals = tuple(tuple(date.toordinal() for date in dates)
+                                        for dates in self.available_dates_home_matches)
+        self.blocked_date_ordinals = tuple(tuple(date.toordinal() for date in dates)
+                                           for dates in self.blocked_dates_matches)
+        self.please_dont_play_ordinals = tuple(tuple(date.toordinal() for date in dates)
+                                               for dates in self.please_dont_play_dates)
+
+        try:
+            start_ordinal = convert_date_string_to_datetime(start_date_first_round).toordinal()
+        except ValueError:
+            start_ordinal = datetime(1970, 1, 1).toordinal()
+        try:
+            first_round_deadline = convert_date_string_to_datetime(end_date_first_round).toordinal()
+        except ValueError:
+            first_round_deadline = None
+        self.general_blocked_dates = tuple(sorted(convert_date_string_list_to_datetime(general_blocked_dates)))
+        self.calendar = MatchCalendar(self.home_date_ordinals, self.blocked_date_ordinals,
+                                      [date.toordinal() for date in self.general_blocked_dates], start_ordinal,
+                                      first_round_deadline)
+        self.match_date_ordinals = self.calendar.match_date_ordinals
+        self.first_round_end = self.calendar.first_round_end
+        self.match_dates = tuple(datetime.fromordinal(ordinal) for ordinal in self.match_date_ordinals)
+
+        all_home_ordinals = [ordinal for ordinals in self.home_date_ordinals for ordinal in ordinals] or [0]
+        self.first_day = min(all_home_ordinals)
+        general_blocked_ordinals = frozenset(date.toordinal() for date in self.general_blocked_dates)
+        self.free_home_days = ScheduleState.build_free_home_days(
+            [[ordinal for ordinal in ordinals if ordinal not in general_blocked_ordinals]
+             for ordinals in self.home_date_ordinals], self.first_day, max(all_home_ordinals))
+
+        # Indices of the teams which are able to play a home or away match for every match date
+        self.home_teams_per_date = tuple(self.calendar.home_teams(index) for index in range(len(self.match_dates)))
+        self.away_teams_per_date = tuple(self.calendar.away_teams(index) for index in range(len(self.match_dates)))
+
+    def create_teams(self):
+        """
+        Creates a fresh set of team instances without any scheduled matches, sharing one schedule state
+        :return: list of teams in the order of teams.json
+        """
+        schedule_state = ScheduleState(self.team_names, self.free_home_days, self.first_day)
+        return [Team(self.team_names[index],
+                     list(self.available_dates_home_matches[index]),
+                     list(self.blocked_dates_matches[index]),
+                     list(self.please_dont_play_dates[index]),
+                     schedule_state, index)
+                for index in range(len(self.team_names))]
+
+    def create_general_map(self, all_teams):
+        """
+        Creates the map of match dates to teams as done by map_general_match_dates_to_teams
+        :param all_teams: teams created by create_teams
+        :return: list of dicts with 'datetime', 'home_match' and 'away_match' for every match date
+        """
+        return [{'datetime': match_date,
+                 'home_match': [all_teams[index] for index in home_teams],
+                 'away_match': [all_teams[index] for index in away_teams]}
+                for match_date, home_teams, away_teams
+                in zip(self.match_dates, self.home_teams_per_date, self.away_teams_per_date)]
+
+    def new_attempt(self):
+        """
+        Creates the mutable state for a single match plan attempt. The state is built fresh instead of being reset,
+        since the teams of a kept result must not change with the next attempt, and the setup takes well below a
+        millisecond next to the parsing of teams.json which is shared through this problem.
+        :return: list of teams and the general map of match dates to these teams
+        """
+        all_teams = self.create_teams()
+        return all_teams, self.create_general_map(all_teams)
+
+    def build_match_plan(self, fixtures):
+        """
+        Creates a match plan in the format of create_match_plan from a list of fixtures
+        :param fixtures: list of [date index, home team index, away team index]
+        :return: match plan and the list of teams with all matches of the plan added
+        """
+        all_teams = self.create_teams()
+        matches_per_date = {}
+        for date_index, home, away in fixtures:
+            matches_per_date.setdefault(date_index, []).append([all_teams[home], all_teams[away]])
+        match_plan = []
+        for date_index in range(max(matches_per_date, default=-1) + 1):
+            match_date = self.match_dates[date_index]
+            thisdict = {'datetime': match_date,
+                        'matches': matches_per_date.get(date_index, [])}
+            for home_team, away_team in thisdict['matches']:
+                home_team.add_home_match_date(match_date, away_team.team_name)
+                away_team.add_away_match_date(match_date, home_team.team_name)
+            match_plan.append(thisdict)
+        return match_plan, all_teams
+
+    def encode_match_plan(self, match_plan):
+        """
+        Reverse of build_match_plan
+        :param match_plan: match plan as created by create_match_plan
+        :return: list of (date index, home team index, away team index) sorted by date
+        """
+        date_index = {ordinal: index for index, ordinal in enumerate(self.match_date_ordinals)}
+        team_index = {name: index for index, name in enumerate(self.team_names)}
+        return [(date_index[entry['datetime'].toordinal()], team_index[home.team_name], team_index[away.team_name])
+                for entry in match_plan for home, away in entry['matches']]
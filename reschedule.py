@@ -0,0 +1,255 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+from bisect import bisect_left
+from datetime import datetime
+from main import read_settings
+from evaluate_plan import match_plan_to_rows, write_report_csv
+from local_search import improve_fixtures
+from problem import Problem
+from utils import convert_date_string_to_datetime, convert_date_string_list_to_datetime, format_table, \
+    get_executable_location
+
+CHANGES_HEADERS = ["Heimmannschaft", "Gastmannschaft", "Alter Termin", "Neuer Termin", "Grund"]
+
+
+class RescheduleError(Exception):
+    pass
+
+
+def read_match_plan_csv(filename, problem):
+    """
+    Reads a match plan written by main.py. The csv only holds day and month, the year is the one which puts the date
+    on a match date of the league or else closest to one, so that dates which are no match dates anymore still get
+    the year of their season.
+    :param filename: spielplan.csv
+    :param problem: league parsed from teams.json, see problem.Problem
+    :return: list of (date, home team index, away team index) in the order of the csv
+    :raises RescheduleError: if the plan contains unknown teams or the league has no match dates
+    """
+    team_index = {name: index for index, name in enumerate(problem.team_names)}
+    days = problem.match_date_ordinals
+    if not days:
+        raise RescheduleError("The league has no match dates")
+    years = range(problem.match_dates[0].year - 1, problem.match_dates[-1].year + 2)
+
+    def _distance_to_match_date(date):
+        position = bisect_left(days, date.toordinal())
+        return min(abs(days[k] - date.toordinal()) for k in (position - 1, position) if 0 <= k < len(days))
+
+    matches = []
+    with open(filename, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, delimiter=';')
+        next(reader)  # header
+        for row in reader:
+            date_text, home_name, away_name = row[1], row[2], row[6]
+            if date_text == "--":
+                continue  # end of the first round
+            for team_name in (home_name, away_name):
+                if team_name not in team_index:
+                    raise RescheduleError(f"Unknown team in {filename}: {team_name}")
+            day, month = (int(part) for part in date_text.strip('.').split('.'))
+            candidates = []
+            for year in years:
+                try:
+                    candidates.append(datetime(year, month, day))
+                except ValueError:
+                    continue  # 29.02. of a year which is no leap year
+            if not candidates:
+                raise ValueError(f"Invalid date in {filename}: {date_text}")
+            match_date = min(candidates, key=lambda date: (_distance_to_match_date(date), date))
+            matches.append((match_date, team_index[home_name], team_index[away_name]))
+    return matches
+
+
+def keep_played_dates(parsed_json, problem, matches, played_until):
+    """
+    Keeps the dates of the played matches in the calendar of the updated teams.json, even if the home team removed
+    the date, a team blocked it or it became a general blocked date. Played matches can not be moved, so they keep
+    their date whatever teams.json says about the past.
+    :param parsed_json: content of the updated teams.json, modified in place
+    :param problem: league parsed from parsed_json, its teams are in the order of parsed_json
+    :param matches: published plan as list of (date, home team index, away team index), see read_match_plan_csv
+    :param played_until: matches on or before this date are played
+    """
+    played = [(match_date, home, away) for match_date, home, away in matches if match_date <= played_until]
+    played_dates = {match_date for match_date, _, _ in played}
+    for match_date, home, away in played:
+        home_team = parsed_json['teams'][problem.team_names[home]]
+        if match_date not in convert_date_string_list_to_datetime(home_team['available_dates_home_matches']):
+            home_team['available_dates_home_matches'] = home_team['available_dates_home_matches'] + \
+                [match_date.strftime('%Y-%m-%d')]
+        for team_index in (home, away):
+            team = parsed_json['teams'][problem.team_names[team_index]]
+            team['blocked_dates_matches'] = [date for date in team['blocked_dates_matches']
+                                             if convert_date_string_to_datetime(date) not in played_dates]
+    parsed_json['general_blocked_dates'] = [date for date in parsed_json['general_blocked_dates']
+                                            if convert_date_string_to_datetime(date) not in played_dates]
+    try:
+        start_date = convert_date_string_to_datetime(parsed_json['start_date_first_round'])
+    except ValueError:
+        return  # no start date
+    if played and min(played_dates) < start_date:
+        parsed_json['start_date_first_round'] = min(played_dates).strftime('%Y-%m-%d')
+
+
+def get_invalid_reason(problem, date_index, home, away):
+    """
+    :return: reason why a match can not take place on a date anymore or None if it still can
+    """
+    if date_index is None:
+        return "Termin entfaellt"
+    if home not in problem.home_teams_per_date[date_index]:
+        return "Heimtermin nicht mehr verfuegbar"
+    if away not in problem.away_teams_per_date[date_index]:
+        return "Gastmannschaft gesperrt"
+    return None
+
+
+def reschedule(problem, matches, weight, start_date_sec_round, consecutive_matches, played_until=None,
+               time_budget=2, rng=random, max_steps=0):
+    """
+    Repairs a published match plan after changes of teams.json with as few changes as possible. Matches which are
+    already played or are still possible keep their date, only the other matches get a new date: first the free date
+    closest to the old one, then a local search over the moved matches improves the score.
+    :param problem: league parsed from the updated teams.json, see problem.Problem
+    :param matches: published plan as list of (date, home team index, away team index), see read_match_plan_csv
+    :param weight: weights of the score from teams.json
+    :param start_date_sec_round: first date of the second round as string, empty or invalid for no restriction
+    :param consecutive_matches: [allow, probability] from teams.json, consecutive matches are forbidden if allow is 0
+    :param played_until: matches on or before this date are played and never moved, None if none are played
+    :param time_budget: seconds of the local search, 0 for no time limit
+    :param rng: random number generator
+    :param max_steps: number of moves of the local search, 0 for no limit, see local_search.improve_match_plan
+    :return: new fixtures as list of (date index, home team index, away team index) in the order of matches, their
+             score and the moved matches as [home team index, away team index, old date, new date, reason]
+    :raises RescheduleError: if a match has no free date left or a played match is not on a match date, see
+                             keep_played_dates
+    """
+    date_index = {match_date: index for index, match_date in enumerate(problem.match_dates)}
+    days = problem.match_date_ordinals
+    allow_consecutive = consecutive_matches[0] != 0
+    try:
+        sec_round_day = convert_date_string_to_datetime(start_date_sec_round).toordinal()
+    except ValueError:
+        sec_round_day = datetime(1970, 1, 1).toordinal()
+
+    # The earlier match of a pairing belongs to the first round
+    first_leg = set()
+    seen_pairings = set()
+    for index, (match_date, home, away) in enumerate(matches):
+        if frozenset((home, away)) not in seen_pairings:
+            seen_pairings.add(frozenset((home, away)))
+            first_leg.add(index)
+
+    fixtures = [None] * len(matches)
+    busy = [set() for _ in days]
+    changes = []
+    for index, (match_date, home, away) in enumerate(matches):
+        played = played_until is not None and match_date <= played_until
+        reason = None if played else get_invalid_reason(problem, date_index.get(match_date), home, away)
+        if reason is None and match_date in date_index:
+            fixtures[index] = (date_index[match_date], home, away)
+            busy[date_index[match_date]].update((home, away))
+        elif played:
+            raise RescheduleError(f"Played match on {match_date.strftime('%d.%m.%Y')} is not a possible match date")
+        else:
+            changes.append([index, match_date, None, reason])
+
+    def _has_consecutive_match(k, team):
+        return any(0 <= other < len(days) and abs(days[other] - days[k]) <= 1 and team in busy[other]
+                   for other in (k - 1, k + 1))
+
+    for change in changes:
+        index, old_date, _, _ = change
+        _, home, away = matches[index]
+        # Keep the order of the rounds: first leg before every second leg and the other way round
+        if index in first_leg:
+            latest = min((fixture[0] for other, fixture in enumerate(fixtures)
+                          if fixture is not None and other not in first_leg), default=len(days))
+            latest = min(latest, problem.first_round_end)
+            candidates = [k for k in range(latest)]
+        else:
+            earliest = max((fixture[0] for other, fixture in enumerate(fixtures)
+                            if fixture is not None and other in first_leg), default=-1)
+            candidates = [k for k in range(earliest + 1, len(days)) if days[k] >= sec_round_day]
+        if played_until is not None:
+            candidates = [k for k in candidates if problem.match_dates[k] > played_until]
+        candidates = [k for k in candidates
+                      if home in problem.home_teams_per_date[k] and away in problem.away_teams_per_date[k] and
+                      home not in busy[k] and away not in busy[k] and
+                      (allow_consecutive or not (_has_consecutive_match(k, home) or _has_consecutive_match(k, away)))]
+        if not candidates:
+            raise RescheduleError(f"No free date left for {problem.team_names[home]} - {problem.team_names[away]}")
+        new_index = min(candidates, key=lambda k: (abs(days[k] - old_date.toordinal()), k))
+        fixtures[index] = (new_index, home, away)
+        busy[new_index].update((home, away))
+
+    # First date after the played matches, the local search must not move a match before it
+    first_date_index = 0
+    if played_until is not None:
+        first_date_index = next((k for k, match_date in enumerate(problem.match_dates) if match_date > played_until),
+                                len(days))
+    improved_fixtures, score = improve_fixtures(problem, fixtures, weight, start_date_sec_round, consecutive_matches,
+                                                time_budget, rng, [change[0] for change in changes], max_steps,
+                                                first_date_index)
+    changes = [[improved_fixtures[index][1], improved_fixtures[index][2], old_date,
+                problem.match_dates[improved_fixtures[index][0]], reason]
+               for index, old_date, _, reason in changes]
+    return improved_fixtures, score, changes
+
+
+def main():
+    script_folder = get_executable_location()
+    parser = argparse.ArgumentParser(description="Passt einen bestehenden Spielplan an eine geaenderte teams.json an")
+    parser.add_argument('--teams', default=os.path.join(script_folder, 'teams.json'), help="geaenderte teams.json")
+    parser.add_argument('--plan', default=os.path.join(script_folder, 'spielplan.csv'), help="bestehender Spielplan")
+    parser.add_argument('--output', default=os.path.join(script_folder, 'spielplan_neu.csv'),
+                        help="Datei fuer den angepassten Spielplan")
+    parser.add_argument('--played-until', help="Spiele bis einschliesslich diesem Datum (JJJJ-MM-TT) sind gespielt")
+    parser.add_argument('--time-budget', type=float, default=2.0, help="Sekunden fuer die lokale Suche")
+    parser.add_argument('--max-steps', type=int, default=0, help="Schritte der lokalen Suche, 0 fuer unbegrenzt")
+    args = parser.parse_args()
+
+    try:
+        with open(args.teams) as file:
+            parsed_json = json.load(file)
+        settings = read_settings(parsed_json)
+        problem = Problem(parsed_json['teams'], settings['start_date_first_round'],
+                          settings['general_blocked_dates'], settings['end_date_first_round'])
+        played_until = convert_date_string_to_datetime(args.played_until) if args.played_until else None
+        matches = read_match_plan_csv(args.plan, problem)
+        if played_until is not None:
+            keep_played_dates(parsed_json, problem, matches, played_until)
+            problem = Problem(parsed_json['teams'], parsed_json['start_date_first_round'],
+                              parsed_json['general_blocked_dates'], settings['end_date_first_round'])
+    except (OSError, ValueError, KeyError, RescheduleError) as e:
+        print(f"Fehler beim Lesen der Eingabedateien: {e}", flush=True)
+        sys.exit(1)
+
+    rng = random.Random(settings['seed'])
+    try:
+        fixtures, score, changes = reschedule(problem, matches, settings['weight'],
+                                              settings['start_date_second_round'], settings['consecutive_matches'],
+                                              played_until, args.time_budget, rng, args.max_steps)
+    except RescheduleError as e:
+        print(f"Spielplan konnte nicht angepasst werden: {e}", flush=True)
+        sys.exit(1)
+
+    match_plan, all_teams = problem.build_match_plan(fixtures)
+    write_report_csv(args.output, match_plan_to_rows(match_plan, all_teams))
+    rows = [[problem.team_names[home], problem.team_names[away], old_date.strftime('%d.%m.%Y'),
+             new_date.strftime('%d.%m.%Y'), reason] for home, away, old_date, new_date, reason in changes]
+    changes_filename = os.path.splitext(args.output)[0] + "_aenderungen.csv"
+    write_report_csv(changes_filename, rows, CHANGES_HEADERS)
+    print(f"{len(changes)} von {len(matches)} Spielen verlegt, score {score}", flush=True)
+    if rows:
+        print(format_table(rows, CHANGES_HEADERS), flush=True)
+    print(f"Spielplan gespeichert unter {args.output}, Aenderungen unter {changes_filename}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from bisect import bisect_right, insort
+
+
+class ScheduleState:
+    """
+    Bookkeeping of the scheduled matches of all teams within one match plan attempt. Teams are addressed by their index
+    and dates by their day ordinal, so that all queries made while pairing opponents are answered without rescanning
+    the match history of a team.
+    """
+    __slots__ = ('team_index', 'num_teams', 'first_day', 'home_matches', 'away_matches', 'last_match_day',
+                 'consecutive_matches', 'please_dont_play_hits', 'outlier', 'max_outlier',
+                 '_free_home_days', '_played', '_home_days', '_away_days')
+
+    def __init__(self, team_names, free_home_days, first_day):
+        """
+        :param team_names: names of all teams, the position within this list is the team index
+        :param free_home_days: per team the number of available home match dates on or after first_day + i,
+                               see build_free_home_days
+        :param first_day: day ordinal of the first entry of free_home_days
+        """
+        num_teams = len(team_names)
+        self.team_index = {name: index for index, name in enumerate(team_names)}
+        self.num_teams = num_teams
+        self.first_day = first_day
+        self.home_matches = [0] * num_teams
+        self.away_matches = [0] * num_teams
+        self.last_match_day = [None] * num_teams
+        self.consecutive_matches = [0] * num_teams  # matches both on Saturday and Sunday
+        self.please_dont_play_hits = [0] * num_teams
+        self.outlier = [0] * num_teams  # home matches minus away matches so far
+        self.max_outlier = [0] * num_teams  # most uneven distribution of home and away matches so far
+        self._free_home_days = free_home_days
+        self._played = bytearray(num_teams * num_teams)  # [home * num_teams + away] is set if home already hosted away
+        self._home_days = [[] for _ in range(num_teams)]
+        self._away_days = [[] for _ in range(num_teams)]
+
+    @staticmethod
+    def build_free_home_days(home_date_ordinals, first_day, last_day):
+        """
+        Builds the table of remaining available home match dates for every day between first_day and last_day
+        :param home_date_ordinals: per team the day ordinals of the available home match dates
+        :return: per team a tuple with the number of home match dates on or after first_day + i
+        """
+        tables = []
+        for ordinals in home_date_ordinals:
+            table = [0] * (last_day - first_day + 2)
+            for ordinal in ordinals:
+                table[ordinal - first_day] += 1
+            for i in range(len(table) - 2, -1, -1):
+                table[i] += table[i + 1]
+            tables.append(tuple(table))
+        return tuple(tables)
+
+    def set_home_days(self, team, home_date_ordinals):
+        """
+        Replaces the available home match dates of a team, the tables of all teams are extended to cover the new dates
+        :param team: index of the team
+        :param home_date_ordinals: day ordinals of the new available home match dates
+        """
+        tables = self._free_home_days
+        old_last_day = self.first_day + len(tables[0]) - 2
+        bounds = list(home_date_ordinals)
+        if any(table[0] for table in tables):
+            bounds += [self.first_day, old_last_day]
+        first_day, last_day = min(bounds or [self.first_day]), max(bounds or [self.first_day])
+        tables = [tuple(self.get_free_home_days(index, day) for day in range(first_day, last_day + 2))
+                  for index in range(self.num_teams)]
+        tables[team] = self.build_free_home_days([home_date_ordinals], first_day, last_day)[0]
+        self._free_home_days = tuple(tables)
+        self.first_day = first_day
+
+    def add_match(self, team, day, opponent, home):
+        """
+        Adds a match for a team
+        :param team: index of the team
+        :param day: day ordinal of the match
+        :param opponent: index of the opponent or None if the opponent is not part of this state
+        :param home: True for a home match, False for an away match
+        """
+        last_match_day = self.last_match_day[team]
+        if last_match_day is not None and day - last_match_day <= 1:
+            self.consecutive_matches[team] += 1
+        self.last_match_day[team] = day
+        if home:
+            if opponent is not None:
+                self._played[team * self.num_teams + opponent] = 1
+            self.home_matches[team] += 1
+            self.outlier[team] += 1
+            insort(self._home_days[team], day)
+        else:
+            if opponent is not None:
+                self._played[opponent * self.num_teams + team] = 1
+            self.away_matches[team] += 1
+            self.outlier[team] -= 1
+            insort(self._away_days[team], day)
+        if abs(self.outlier[team]) > self.max_outlier[team]:
+            self.max_outlier[team] = abs(self.outlier[team])
+
+    def has_hosted(self, home, away):
+        return self._played[home * self.num_teams + away] == 1
+
+    def get_matches_until_day(self, team, day):
+        return [bisect_right(self._home_days[team], day), bisect_right(self._away_days[team], day)]
+
+    def get_free_home_days(self, team, day):
+        table = self._free_home_days[team]
+        return table[min(max(day - self.first_day, 0), len(table) - 1)]
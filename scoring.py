@@ -0,0 +1,190 @@
+from bisect import bisect_left
+
+
+class ScoreEngine:
+    """
+    Keeps the metrics of calculate_score as running aggregates of a plan given as fixtures, so that the score change of
+    inserting, removing or moving a single match is calculated without evaluating the whole plan again. Only the
+    tallies of the teams and dates touched by a change are updated: moving a match costs O(matches of both teams +
+    dates between the old and the new date + teams), the score costs O(teams). The totals are the same as the ones of
+    calculate_score for every plan with at most one match per team and date.
+    """
+
+    def __init__(self, problem, weight, fixtures=()):
+        """
+        :param problem: league parsed from teams.json, see problem.Problem
+        :param weight: weights of the score from teams.json
+        :param fixtures: initial fixtures as (date index, home team index, away team index)
+        """
+        num_teams = len(problem.team_names)
+        num_dates = len(problem.match_date_ordinals)
+        self.days = problem.match_date_ordinals
+        self.weight = (weight['amount_consecutive_matches'], weight['distribution_home_away_matches'],
+                       weight['amount_please_dont_play_dates'], weight['distribution_game_days'])
+        self.please_dont_play = [frozenset(ordinals) for ordinals in problem.please_dont_play_ordinals]
+        self.num_teams = num_teams
+        self.match_dates = [[] for _ in range(num_teams)]  # sorted date indices of the matches per team
+        self.match_signs = [[] for _ in range(num_teams)]  # +1 for a home match, -1 for an away match
+        self.consecutive_matches = [0] * num_teams
+        self.max_outlier = [0] * num_teams
+        self.please_dont_play_hits = 0
+        # Per date: number of matches of every team until this date and how many teams have a certain number
+        self.matches_until = [[0] * num_dates for _ in range(num_teams)]
+        self.teams_with_matches = [{0: num_teams} for _ in range(num_dates)]
+        self.most_matches = [0] * num_dates
+        self.least_matches = [0] * num_dates
+        self.date_usage = [0] * num_dates  # number of matches per date, to find the last date of the plan
+        self.last_date = -1
+        self.spread_count = {}  # number of dates up to the last date per difference of the most and least matches
+        self.replace([], fixtures)
+
+    def metrics(self):
+        """
+        :return: total consecutive matches, most uneven distribution of home and away matches, total please don't
+                 play dates and maximum distribution of game days
+        """
+        return sum(self.consecutive_matches), max(self.max_outlier, default=0), self.please_dont_play_hits, \
+            max(self.spread_count, default=0)
+
+    def score(self):
+        return sum(metric * weight for metric, weight in zip(self.metrics(), self.weight))
+
+    def insert(self, date_index, home, away):
+        """
+        Adds a match
+        :return: change of the score
+        """
+        return self.replace([], [(date_index, home, away)])
+
+    def remove(self, date_index, home, away):
+        """
+        Removes a match
+        :return: change of the score
+        """
+        return self.replace([(date_index, home, away)], [])
+
+    def move(self, old_fixture, new_fixture):
+        """
+        Replaces a match, e.g. with another date or swapped home and away team
+        :return: change of the score
+        """
+        return self.replace([old_fixture], [new_fixture])
+
+    def replace(self, old_fixtures, new_fixtures):
+        """
+        Removes and adds several matches at once, e.g. to swap the dates of two matches
+        :return: change of the score
+        """
+        score = self.score()
+        # Net change of the matches per team and date, a match moved by a few dates only changes these dates
+        changes = {}
+        for fixtures, change in ((old_fixtures, -1), (new_fixtures, 1)):
+            for date_index, home, away in fixtures:
+                for team in (home, away):
+                    team_changes = changes.setdefault(team, {})
+                    team_changes[date_index] = team_changes.get(date_index, 0) + change
+                self.date_usage[date_index] += change
+        for date_index, home, away in old_fixtures:
+            self._remove_team_match(home, date_index)
+            self._remove_team_match(away, date_index)
+        for date_index, home, away in new_fixtures:
+            self._add_team_match(home, date_index, 1)
+            self._add_team_match(away, date_index, -1)
+        for team, team_changes in changes.items():
+            self._update_matches_until(team, team_changes)
+        self._update_last_date(max([self.last_date] + [date_index for date_index, _, _ in new_fixtures]))
+        return self.score() - score
+
+    def _is_consecutive(self, first_date, second_date):
+        return self.days[second_date] - self.days[first_date] <= 1
+
+    def _add_team_match(self, team, date_index, sign):
+        dates = self.match_dates[team]
+        position = bisect_left(dates, date_index)
+        if 0 < position < len(dates) and self._is_consecutive(dates[position - 1], dates[position]):
+            self.consecutive_matches[team] -= 1
+        if position > 0 and self._is_consecutive(dates[position - 1], date_index):
+            self.consecutive_matches[team] += 1
+        if position < len(dates) and self._is_consecutive(date_index, dates[position]):
+            self.consecutive_matches[team] += 1
+        dates.insert(position, date_index)
+        self.match_signs[team].insert(position, sign)
+        self._update_outlier(team)
+        if self.days[date_index] in self.please_dont_play[team]:
+            self.please_dont_play_hits += 1
+
+    def _remove_team_match(self, team, date_index):
+        dates = self.match_dates[team]
+        position = bisect_left(dates, date_index)
+        if position > 0 and self._is_consecutive(dates[position - 1], date_index):
+            self.consecutive_matches[team] -= 1
+        if position + 1 < len(dates) and self._is_consecutive(date_index, dates[position + 1]):
+            self.consecutive_matches[team] -= 1
+        if 0 < position < len(dates) - 1 and self._is_consecutive(dates[position - 1], dates[position + 1]):
+            self.consecutive_matches[team] += 1
+        del dates[position]
+        del self.match_signs[team][position]
+        self._update_outlier(team)
+        if self.days[date_index] in self.please_dont_play[team]:
+            self.please_dont_play_hits -= 1
+
+    def _update_outlier(self, team):
+        outlier = 0
+        max_outlier = 0
+        for sign in self.match_signs[team]:
+            outlier += sign
+            if abs(outlier) > max_outlier:
+                max_outlier = abs(outlier)
+        self.max_outlier[team] = max_outlier
+
+    def _count_spread(self, spread, change):
+        count = self.spread_count.get(spread, 0) + change
+        if count:
+            self.spread_count[spread] = count
+        else:
+            del self.spread_count[spread]
+
+    def _update_last_date(self, last_date):
+        while last_date >= 0 and not self.date_usage[last_date]:
+            last_date -= 1
+        for k in range(self.last_date + 1, last_date + 1):
+            self._count_spread(self.most_matches[k] - self.least_matches[k], 1)
+        for k in range(last_date + 1, self.last_date + 1):
+            self._count_spread(self.most_matches[k] - self.least_matches[k], -1)
+        self.last_date = last_date
+
+    def _update_matches_until(self, team, team_changes):
+        """
+        :param team_changes: change of the matches of the team per date index
+        """
+        dates = sorted(team_changes)
+        running = 0
+        for position, date_index in enumerate(dates):
+            running += team_changes[date_index]
+            stop = dates[position + 1] if position + 1 < len(dates) else len(self.days)
+            for _ in range(abs(running)):
+                self._shift_matches_until(team, date_index, stop, 1 if running > 0 else -1)
+
+    def _shift_matches_until(self, team, start, stop, change):
+        matches_until = self.matches_until[team]
+        for k in range(start, stop):
+            spread = self.most_matches[k] - self.least_matches[k]
+            old = matches_until[k]
+            new = old + change
+            matches_until[k] = new
+            teams_with_matches = self.teams_with_matches[k]
+            teams_with_matches[old] -= 1
+            teams_with_matches[new] = teams_with_matches.get(new, 0) + 1
+            if change > 0:
+                if new > self.most_matches[k]:
+                    self.most_matches[k] = new
+                if old == self.least_matches[k] and not teams_with_matches[old]:
+                    self.least_matches[k] = new
+            else:
+                if new < self.least_matches[k]:
+                    self.least_matches[k] = new
+                if old == self.most_matches[k] and not teams_with_matches[old]:
+                    self.most_matches[k] = new
+            if k <= self.last_date and self.most_matches[k] - self.least_matches[k] != spread:
+                self._count_spread(spread, -1)
+                self._count_spread(self.most_matches[k] - self.least_matches[k], 1)
@@ -0,0 +1,380 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from main import read_settings, schedule_league_with_cache
+from evaluate_plan import match_plan_to_rows, write_report_rows
+from problem import Problem
+
+_event_queue = None  # queue of (job id, event) of a worker process, set by _init_worker
+
+
+class ServiceBusyError(Exception):
+    pass
+
+
+def _init_worker(event_queue):
+    global _event_queue
+    _event_queue = event_queue
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def limit_run_time(parsed_json, max_time_limit):
+    """
+    Limits the time of the randomized search and of the exact solver, so that no job blocks a worker process for good
+    :param parsed_json: content of teams.json, not modified
+    :param max_time_limit: maximum seconds of the search, also applied if teams.json sets no limit
+    :return: content of teams.json with the limited stop_criteria and solver_time_limit
+    """
+    stop_criteria = dict(parsed_json.get('stop_criteria', {}))
+    stop_criteria['time_limit'] = min(stop_criteria.get('time_limit') or max_time_limit, max_time_limit)
+    solver_time_limit = min(parsed_json.get('solver_time_limit') or max_time_limit, max_time_limit)
+    return dict(parsed_json, stop_criteria=stop_criteria, solver_time_limit=solver_time_limit)
+
+
+def run_job(job_id, parsed_json, cancel_event=None):
+    """
+    Schedules a single league within a worker process. Progress and improvements are sent as events, the last event
+    is either done with the result, cancelled with the best result found until then or failed with the error.
+    :param job_id: id of the job, sent with every event
+    :param parsed_json: content of teams.json
+    :param cancel_event: event which is set to cancel the job, the search stops after its current batch
+    """
+    def _send(event):
+        _event_queue.put((job_id, event))
+
+    if cancel_event is not None and cancel_event.is_set():
+        _send({'event': 'cancelled'})  # Cancelled after the job was already handed to this worker process
+        return
+    _send({'event': 'started'})
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            settings = read_settings(parsed_json)
+            problem = Problem(parsed_json['teams'], settings['start_date_first_round'],
+                              settings['general_blocked_dates'], settings['end_date_first_round'])
+            settings['workers'] = 1  # The jobs are already spread over the worker processes
+            if settings['seed'] is None:
+                settings['seed'] = random.SystemRandom().getrandbits(63)
+            print(f"Seed: {settings['seed']}", flush=True)
+            cancelled = cancel_event.is_set if cancel_event is not None else None
+            best_result = schedule_league_with_cache(parsed_json, problem, settings, progress=_send,
+                                                     cancelled=cancelled)
+    except Exception as e:
+        _send({'event': 'failed', 'error': f"{type(e).__name__}: {e}"})
+        return
+
+    # score is None if no match plan was found
+    result = {'score': None, 'report': "", 'seed': settings['seed'], 'matches': [], 'csv': "", 'log': log.getvalue()}
+    if best_result is not None:
+        score, report, match_plan, all_teams, _, _ = best_result
+        csv_file = io.StringIO(newline='')
+        write_report_rows(csv_file, match_plan_to_rows(match_plan, all_teams))
+        result.update(score=score, report=report, csv=csv_file.getvalue(),
+                      matches=[{'date': match_day['datetime'].strftime('%Y-%m-%d'), 'home': home_team.team_name,
+                                'away': away_team.team_name}
+                               for match_day in match_plan for home_team, away_team in match_day['matches']])
+    finished = 'cancelled' if cancel_event is not None and cancel_event.is_set() else 'done'
+    _send({'event': finished, 'score': result['score'], 'result': result})
+
+
+class Job:
+    """
+    Scheduling request of a single league. All events of the job are kept, so that a client which connects late still
+    gets the whole progress.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'  # queued, running, done, cancelled or failed
+        self.best_score = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.condition = threading.Condition()
+        self.cancel_event = None  # set by SchedulingService to cancel the job within its worker process
+        self.future = None
+        self.add_event({'event': 'queued'})
+
+    def add_event(self, event):
+        """
+        :param event: dict with the type of the event as 'event', a done event holds the result of the job as 'result',
+                      a cancelled event the result found until then if the job was already running
+        """
+        with self.condition:
+            event = dict(event, job=self.id, time=time.time())
+            if event['event'] == 'started':
+                self.status = 'running'
+            elif event['event'] == 'best':
+                self.best_score = event['score']
+            elif event['event'] == 'done':
+                self.result = event.pop('result')
+                self.status = 'done'
+            elif event['event'] == 'cancelled':
+                self.result = event.pop('result', None)
+                self.status = 'cancelled'
+            elif event['event'] == 'failed':
+                self.error = event['error']
+                self.status = 'failed'
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def iter_events(self, timeout=15):
+        """
+        Yields all events of the job, waits for new ones until the job is finished
+        :param timeout: seconds after which None is yielded if there is no new event, e.g. to keep a connection alive
+        """
+        position = 0
+        while True:
+            with self.condition:
+                if position == len(self.events) and not self.finished():
+                    self.condition.wait(timeout)
+                new_events = self.events[position:]
+                finished = self.finished()
+            position += len(new_events)
+            if not new_events and not finished:
+                yield None
+            yield from new_events
+            if finished and position == len(self.events):
+                return
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status, 'best_score': self.best_score, 'error': self.error}
+
+
+class SchedulingService:
+    """
+    Resident pool of worker processes which schedule leagues one job per process. The processes are started once and
+    stay warm, jobs are only accepted while the number of waiting jobs is below max_queue. The search of every job is
+    limited to max_time_limit seconds and can be cancelled.
+    """
+
+    def __init__(self, workers, max_queue, max_finished_jobs=100, max_time_limit=600):
+        """
+        :param workers: number of worker processes, the number of jobs which run at the same time
+        :param max_queue: number of jobs which may wait for a free worker
+        :param max_finished_jobs: number of finished jobs whose results are kept
+        :param max_time_limit: maximum seconds of the search of a job, see limit_run_time
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_finished_jobs = max_finished_jobs
+        self.max_time_limit = max_time_limit
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        self.event_queue = multiprocessing.Queue()
+        self.manager = multiprocessing.Manager()  # events to cancel a job within a worker process
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(self.event_queue,))
+        for future in [self.executor.submit(_warm_up) for _ in range(workers)]:
+            future.result()
+        self.event_thread = threading.Thread(target=self._forward_events, daemon=True)
+        self.event_thread.start()
+
+    def submit(self, parsed_json):
+        """
+        :param parsed_json: content of teams.json
+        :return: queued job
+        :raises KeyError: if a required entry of teams.json is missing
+        :raises ServiceBusyError: if too many jobs are waiting
+        """
+        if not isinstance(parsed_json, dict) or not isinstance(parsed_json.get('teams'), dict):
+            raise KeyError('teams')
+        read_settings(parsed_json)
+        with self.lock:
+            unfinished = sum(not job.finished() for job in self.jobs.values())
+            if unfinished >= self.workers + self.max_queue:
+                raise ServiceBusyError(f"{unfinished} jobs are queued or running")
+            job = Job(str(next(self.job_ids)))
+            job.cancel_event = self.manager.Event()
+            self.jobs[job.id] = job
+            self._remove_old_jobs()
+        job.future = self.executor.submit(run_job, job.id, limit_run_time(parsed_json, self.max_time_limit),
+                                          job.cancel_event)
+        job.future.add_done_callback(lambda done_future: self._finish(job, done_future))
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job):
+        """
+        Cancels a job: a queued job does not start anymore, a running job stops its search after the current batch and
+        keeps the best result found until then
+        :param job: unfinished job of this service
+        """
+        job.cancel_event.set()
+        if job.future is not None:
+            job.future.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.event_queue.put(None)
+        self.event_thread.join()
+        self.manager.shutdown()
+
+    def _forward_events(self):
+        while True:
+            item = self.event_queue.get()
+            if item is None:
+                return
+            job = self.get(item[0])
+            if job is not None:
+                job.add_event(item[1])
+
+    def _finish(self, job, future):
+        if future.cancelled():
+            job.add_event({'event': 'cancelled'})
+            return
+        # Errors of the league are sent by run_job, this only catches a worker process which died
+        error = future.exception()
+        if error is not None and not job.finished():
+            job.add_event({'event': 'failed', 'error': f"{type(error).__name__}: {error}"})
+
+    def _remove_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished()]
+        for job_id in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self.jobs[job_id]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs                  teams.json as body, returns the id of the job
+    GET  /jobs/<id>             status and best score of the job
+    GET  /jobs/<id>/events      events of the job as NDJSON, or as server-sent events with Accept: text/event-stream
+    GET  /jobs/<id>/result      score, report and matches as JSON
+    GET  /jobs/<id>/spielplan.csv  match plan in the format of spielplan.csv
+    DELETE /jobs/<id>           cancels the job
+    """
+    service = None  # SchedulingService, set by create_server
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error': "not found"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = self.service.submit(json.loads(self.rfile.read(length)))
+        except ServiceBusyError as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': f"invalid teams.json: {type(e).__name__}: {e}"})
+            return
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        job = self.service.get(parts[1]) if len(parts) in (2, 3) and parts[0] == 'jobs' else None
+        if job is None:
+            self._send_json(404, {'error': "not found"})
+        elif len(parts) == 2:
+            self._send_json(200, job.to_dict())
+        elif parts[2] == 'events':
+            self._send_events(job)
+        elif parts[2] in ('result', 'spielplan.csv'):
+            if not job.finished():
+                self._send_json(409, job.to_dict())
+            elif job.result is None:
+                self._send_json(409 if job.status == 'cancelled' else 500, job.to_dict())
+            elif parts[2] == 'result':
+                self._send_json(200, dict(job.to_dict(), **{key: value for key, value in job.result.items()
+                                                            if key != 'csv'}))
+            elif job.result['score'] is None:
+                self._send_json(404, {'error': "no match plan found"})
+            else:
+                self._send(200, 'text/csv; charset=utf-8', job.result['csv'].encode('utf-8'))
+        else:
+            self._send_json(404, {'error': "not found"})
+
+    def do_DELETE(self):
+        parts = self.path.strip('/').split('/')
+        job = self.service.get(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' else None
+        if job is None:
+            self._send_json(404, {'error': "not found"})
+        elif job.finished():
+            self._send_json(409, job.to_dict())
+        else:
+            self.service.cancel(job)
+            self._send_json(202, job.to_dict())
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, 'application/json', json.dumps(data).encode('utf-8'))
+
+    def _send_events(self, job):
+        server_sent = 'text/event-stream' in self.headers.get('Accept', '')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if server_sent else 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            for event in job.iter_events():
+                if event is None:
+                    self.wfile.write(b": keep-alive\n\n" if server_sent else b"\n")
+                elif server_sent:
+                    self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                else:
+                    self.wfile.write(json.dumps(event).encode('utf-8') + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client disconnected, the job keeps running
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service, host, port):
+    handler = type('Handler', (ServiceRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dienst, der Spielplaene ueber eine HTTP Schnittstelle erstellt")
+    parser.add_argument('--host', default="127.0.0.1", help="Adresse des Dienstes")
+    parser.add_argument('--port', type=int, default=8080, help="Port des Dienstes")
+    parser.add_argument('--workers', type=int, default=0, help="Anzahl der Prozesse, 0 fuer alle Prozessoren")
+    parser.add_argument('--max-queue', type=int, default=16, help="Anzahl der Auftraege, die warten duerfen")
+    parser.add_argument('--max-time-limit', type=float, default=600,
+                        help="Maximale Suchzeit eines Auftrags in Sekunden")
+    args = parser.parse_args()
+
+    service = SchedulingService(args.workers or os.cpu_count() or 1, args.max_queue,
+                                max_time_limit=args.max_time_limit)
+    server = create_server(service, args.host, args.port)
+    print(f"Dienst laeuft unter http://{args.host}:{args.port} mit {service.workers} Prozessen", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,315 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from utils import convert_date_string_to_datetime
+
+
+class SolverError(Exception):
+    pass
+
+
+class InfeasiblePlanError(SolverError):
+    """
+    Raised if it is proven that no valid match plan exists for a league. reasons holds the violated conditions.
+    """
+
+    def __init__(self, reasons):
+        super().__init__("No valid match plan exists: " + "; ".join(reasons))
+        self.reasons = reasons
+
+
+class _SearchLimitReached(Exception):
+    pass
+
+
+# Memory of the table of already searched states of the branch and bound search, the least recently used states are
+# dropped beyond it
+VISITED_MAX_BYTES = 64 * 1024 * 1024
+
+
+def solve_match_plan(problem, start_date_sec_round, consecutive_matches, weight, time_limit=None, node_limit=None,
+                     visited_max_bytes=VISITED_MAX_BYTES):
+    """
+    Exact alternative to the randomized create_match_plan. Searches all match plans date by date with a branch and
+    bound search over the pairings of every date and minimizes the score of calculate_score.
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param start_date_sec_round: first date of the second round as string, empty or invalid for no restriction
+    :param consecutive_matches: [allow, probability] from teams.json, consecutive matches are forbidden if allow is 0
+    :param weight: weights of the score from teams.json
+    :param time_limit: seconds after which the best plan found so far is returned, None for no limit
+    :param node_limit: number of search nodes after which the best plan found so far is returned, None for no limit
+    :param visited_max_bytes: approximate memory of the table of searched states which prunes dominated states, a
+                              smaller table only prunes less, e.g. 64 MB hold about 100000 states of a league with 12
+                              teams
+    :return: match plan, all teams and True if the match plan is proven to be optimal
+    :raises InfeasiblePlanError: if no valid match plan exists
+    :raises SolverError: if no match plan was found within the given limits
+    """
+    search = _BranchAndBound(problem, start_date_sec_round, consecutive_matches, weight, time_limit, node_limit,
+                             visited_max_bytes)
+    fixtures, optimal = search.solve()
+    match_plan, all_teams = problem.build_match_plan(fixtures)
+    return match_plan, all_teams, optimal
+
+
+class _BranchAndBound:
+
+    def __init__(self, problem, start_date_sec_round, consecutive_matches, weight, time_limit, node_limit,
+                 visited_max_bytes=VISITED_MAX_BYTES):
+        self.problem = problem
+        self.num_teams = len(problem.team_names)
+        self.days = problem.match_date_ordinals
+        self.allow_consecutive = consecutive_matches[0] != 0
+        self.weight = (weight['amount_consecutive_matches'], weight['distribution_home_away_matches'],
+                       weight['amount_please_dont_play_dates'], weight['distribution_game_days'])
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.node_limit = node_limit
+
+        try:
+            sec_round_day = convert_date_string_to_datetime(start_date_sec_round).toordinal()
+        except ValueError:
+            sec_round_day = datetime(1970, 1, 1).toordinal()
+        self.sec_round_day = sec_round_day
+        self.sec_round_index = next((k for k, day in enumerate(self.days) if day >= sec_round_day), len(self.days))
+        self.first_round_end = problem.first_round_end  # first date index after the deadline of the first round
+
+        num_dates = len(self.days)
+        self.home_ok = [frozenset(teams) for teams in problem.home_teams_per_date]
+        self.play_ok = [frozenset(teams) for teams in problem.away_teams_per_date]
+        self.please_dont_play = [frozenset(ordinals) for ordinals in problem.please_dont_play_ordinals]
+        # Number of dates on or after date k on which a team can play at all or at home
+        self.play_suffix = [[0] * (num_dates + 1) for _ in range(self.num_teams)]
+        self.home_suffix = [[0] * (num_dates + 1) for _ in range(self.num_teams)]
+        # Upper bound for the number of matches on all dates on or after date k
+        self.capacity_suffix = [0] * (num_dates + 1)
+        for k in range(num_dates - 1, -1, -1):
+            for team in range(self.num_teams):
+                self.play_suffix[team][k] = self.play_suffix[team][k + 1] + (team in self.play_ok[k])
+                self.home_suffix[team][k] = self.home_suffix[team][k + 1] + (team in self.home_ok[k])
+            self.capacity_suffix[k] = self.capacity_suffix[k + 1] + min(len(self.home_ok[k]),
+                                                                        len(self.play_ok[k]) // 2)
+
+        n = self.num_teams
+        self.hosted = bytearray(n * n)  # [home * n + away] is set if home already hosted away
+        self.matches = [0] * n
+        self.home_matches = [0] * n
+        self.last_day = [None] * n
+        self.outlier = [0] * n
+        self.max_outlier = [0] * n
+        self.total_matches = 0
+        self.consecutive = 0
+        self.please_dont_play_hits = 0
+        self.max_spread = 0
+        self.fixtures = []  # [date index, home, away]
+        self.undo_stack = []
+
+        self.best_score = None
+        self.best_fixtures = None
+        self.nodes = 0
+        self.visited = OrderedDict()  # least recently used state first
+        # Rough size of a state: the bytes of hosted, two tuples of n entries, the score vector and the dict entry
+        self.visited_max_entries = max(visited_max_bytes // (n * n + 16 * n + 300), 1)
+
+    def solve(self):
+        reasons = self._check_bounds(0)
+        if reasons:
+            raise InfeasiblePlanError(reasons)
+        try:
+            self._search(0)
+            exhausted = True
+        except _SearchLimitReached:
+            exhausted = False
+        if self.best_fixtures is None:
+            if exhausted:
+                raise InfeasiblePlanError([f"exhaustive search over {self.nodes} nodes found no valid match plan"])
+            raise SolverError(f"No match plan found within the search limits ({self.nodes} nodes)")
+        return self.best_fixtures, exhausted
+
+    def _score(self):
+        return self.consecutive * self.weight[0] + max(self.max_outlier) * self.weight[1] + \
+            self.please_dont_play_hits * self.weight[2] + self.max_spread * self.weight[3]
+
+    def _first_round_done(self):
+        return all(matches >= self.num_teams - 1 for matches in self.matches)
+
+    def _check_bounds(self, k):
+        """
+        Necessary conditions for the remaining dates starting with date k
+        :return: list of violated conditions, empty if a valid plan may still exist
+        """
+        n = self.num_teams
+        names = self.problem.team_names
+        reasons = []
+        first_round = not self._first_round_done()
+        sec_k = max(k, self.sec_round_index)
+        for team in range(n):
+            missing = 2 * n - 2 - self.matches[team]
+            if missing > self.play_suffix[team][k]:
+                reasons.append(f"{names[team]} needs {missing} more matches but can only play on "
+                               f"{self.play_suffix[team][k]} remaining dates")
+            missing_home = n - 1 - self.home_matches[team]
+            if missing_home > self.home_suffix[team][k]:
+                reasons.append(f"{names[team]} needs {missing_home} more home matches but has only "
+                               f"{self.home_suffix[team][k]} remaining home dates")
+            if first_round:
+                first_round_dates = self.play_suffix[team][k] - self.play_suffix[team][max(k, self.first_round_end)]
+                if n - 1 - self.matches[team] > first_round_dates:
+                    reasons.append(f"{names[team]} needs {n - 1 - self.matches[team]} more matches in the first round "
+                                   f"but can only play on {first_round_dates} dates until its deadline")
+                # The second round needs n - 1 matches and a home match for every away match of the first round
+                if n - 1 > self.play_suffix[team][sec_k]:
+                    reasons.append(f"{names[team]} can only play on {self.play_suffix[team][sec_k]} dates "
+                                   f"of the second round but needs {n - 1}")
+                away_matches = self.matches[team] - self.home_matches[team]
+                if away_matches > self.home_suffix[team][sec_k]:
+                    reasons.append(f"{names[team]} has only {self.home_suffix[team][sec_k]} home dates in the "
+                                   f"second round but needs at least {away_matches}")
+            elif missing > self.play_suffix[team][sec_k] or missing_home > self.home_suffix[team][sec_k]:
+                reasons.append(f"{names[team]} has not enough dates left in the second round")
+        missing_matches = n * (n - 1) - self.total_matches
+        if missing_matches > self.capacity_suffix[k]:
+            reasons.append(f"{missing_matches} matches are missing but the remaining dates allow at most "
+                           f"{self.capacity_suffix[k]}")
+        if first_round and n * (n - 1) // 2 > self.capacity_suffix[sec_k]:
+            reasons.append(f"the dates of the second round allow at most {self.capacity_suffix[sec_k]} "
+                           f"of {n * (n - 1) // 2} matches")
+        return reasons
+
+    def _search(self, k):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise _SearchLimitReached()
+        if self.deadline is not None and self.nodes % 1000 == 0 and time.monotonic() > self.deadline:
+            raise _SearchLimitReached()
+
+        if self.total_matches == self.num_teams * (self.num_teams - 1):
+            score = self._score()
+            if self.best_score is None or score < self.best_score:
+                self.best_score = score
+                self.best_fixtures = [tuple(fixture) for fixture in self.fixtures]
+            return
+        if k == len(self.days):
+            return
+        if self.best_score is not None and self._score() >= self.best_score:
+            return
+        if self._check_bounds(k):
+            return
+        if self._is_dominated(k):
+            return
+
+        for matching in self._matchings(k):
+            self._apply(k, matching)
+            self._search(k + 1)
+            self._undo(matching)
+
+    def _is_dominated(self, k):
+        """
+        Checks if the same remaining problem was already searched with a score vector at least as good
+        """
+        day = self.days[k]
+        key = (k, bytes(self.hosted), tuple(self.outlier),
+               tuple(last_day is not None and last_day >= day - 1 for last_day in self.last_day))
+        vector = (self.consecutive, max(self.max_outlier), self.please_dont_play_hits, self.max_spread)
+        seen = self.visited.get(key)
+        if seen is not None:
+            self.visited.move_to_end(key)
+            if all(old <= new for old, new in zip(seen, vector)):
+                return True
+        self.visited[key] = vector
+        if len(self.visited) > self.visited_max_entries:
+            self.visited.popitem(last=False)
+        return False
+
+    def _matchings(self, k):
+        """
+        Generates all sets of matches which can be played on date k, the ones with the most matches first
+        """
+        n = self.num_teams
+        day = self.days[k]
+        first_round = not self._first_round_done()
+        if not first_round and day < self.sec_round_day:
+            yield []  # Don't start second round until a given start date
+            return
+        target = n - 1 if first_round else 2 * n - 2
+        candidates = [team for team in self.play_ok[k] if self.matches[team] < target and
+                      (self.allow_consecutive or self.last_day[team] is None or day - self.last_day[team] > 1)]
+        # Teams with the least spare dates first
+        candidates.sort(key=lambda team: (self.play_suffix[team][k] - (2 * n - 2 - self.matches[team]), team))
+        home_ok = self.home_ok[k]
+        hosted = self.hosted
+        chosen = []
+        used = set()
+
+        def _orientations(team, opponent):
+            if first_round:
+                if hosted[team * n + opponent] or hosted[opponent * n + team]:
+                    return []
+                pairs = [(team, opponent), (opponent, team)]
+                # Prefer the team with the least spare home dates as home team
+                pairs.sort(key=lambda pair: self.home_suffix[pair[0]][k] - (n - 1 - self.home_matches[pair[0]]))
+                return [pair for pair in pairs if pair[0] in home_ok]
+            if hosted[team * n + opponent] and not hosted[opponent * n + team] and opponent in home_ok:
+                return [(opponent, team)]
+            if hosted[opponent * n + team] and not hosted[team * n + opponent] and team in home_ok:
+                return [(team, opponent)]
+            return []
+
+        def _next(i):
+            while i < len(candidates) and candidates[i] in used:
+                i += 1
+            if i == len(candidates):
+                yield chosen
+                return
+            team = candidates[i]
+            used.add(team)
+            for opponent in candidates[i + 1:]:
+                if opponent in used:
+                    continue
+                for pair in _orientations(team, opponent):
+                    used.add(opponent)
+                    chosen.append(pair)
+                    yield from _next(i + 1)
+                    chosen.pop()
+                    used.discard(opponent)
+            used.discard(team)
+            yield from _next(i + 1)  # team does not play on this date
+
+        yield from _next(0)
+
+    def _apply(self, k, matching):
+        n = self.num_teams
+        day = self.days[k]
+        self.undo_stack.append((self.max_spread, self.consecutive, self.please_dont_play_hits,
+                                [(team, self.last_day[team], self.max_outlier[team])
+                                 for pair in matching for team in pair]))
+        for home, away in matching:
+            self.hosted[home * n + away] = 1
+            self.home_matches[home] += 1
+            self.fixtures.append((k, home, away))
+            self.total_matches += 1
+            for team, delta in ((home, 1), (away, -1)):
+                if self.last_day[team] is not None and day - self.last_day[team] <= 1:
+                    self.consecutive += 1
+                if day in self.please_dont_play[team]:
+                    self.please_dont_play_hits += 1
+                self.last_day[team] = day
+                self.matches[team] += 1
+                self.outlier[team] += delta
+                if abs(self.outlier[team]) > self.max_outlier[team]:
+                    self.max_outlier[team] = abs(self.outlier[team])
+        self.max_spread = max(self.max_spread, max(self.matches) - min(self.matches))
+
+    def _undo(self, matching):
+        n = self.num_teams
+        self.max_spread, self.consecutive, self.please_dont_play_hits, saved_teams = self.undo_stack.pop()
+        for home, away in matching:
+            self.hosted[home * n + away] = 0
+            self.home_matches[home] -= 1
+            self.fixtures.pop()
+            self.total_matches -= 1
+            for team, delta in ((home, 1), (away, -1)):
+                self.matches[team] -= 1
+                self.outlier[team] -= delta
+        for team, last_day, max_outlier in saved_teams:
+            self.last_day[team] = last_day
+            self.max_outlier[team] = max_outlier
@@ -1,21 +1,25 @@
 from datetime import datetime
+from schedule_state import ScheduleState
 
 
 class Team:
 
-    def __init__(self, team_name, available_dates_home_matches, blocked_dates_matches, please_dont_play_dates):
+    def __init__(self, team_name, available_dates_home_matches, blocked_dates_matches, please_dont_play_dates,
+                 schedule_state=None, team_index=0):
+        self._schedule_state = None
+        self._team_index = team_index
         self.team_name = team_name
         self.available_dates_home_matches = available_dates_home_matches  # provided by team
         self.blocked_dates_matches = blocked_dates_matches  # provided by team
         self.please_dont_play_dates = please_dont_play_dates  # provided by team
-        self._dates_home_matches = []
-        self._dates_away_matches = []
         self._dates_matches = []  # home and away matches combined [H/A, DATE, OPPONENT]
-        self._total_matches = 0
-        self._total_home_matches = 0
-        self._total_away_matches = 0
-        self._total_consecutive_matches = 0  # matches both on Saturday and Sunday
-        self._scheduled_please_dont_play_dates = 0  # if a game is scheduled on a day which is asked to be blcoked
+        if schedule_state is None:
+            # Team on its own, all counters are kept in a state containing only this team
+            home_date_ordinals = [date.toordinal() for date in self._available_dates_home_matches]
+            first_day, last_day = min(home_date_ordinals, default=0), max(home_date_ordinals, default=0)
+            free_home_days = ScheduleState.build_free_home_days([home_date_ordinals], first_day, last_day)
+            schedule_state = ScheduleState([team_name], free_home_days, first_day)
+        self._schedule_state = schedule_state  # shared with all other teams of the same match plan
 
     @property
     def team_name(self):
@@ -33,6 +37,10 @@ class Team:
     def available_dates_home_matches(self, value):
         # TODO: Proper error handling and sorting
         self._available_dates_home_matches = sorted(value)
+        self._available_dates_home_matches_set = frozenset(self._available_dates_home_matches)
+        if self._schedule_state is not None:
+            self._schedule_state.set_home_days(self._team_index,
+                                               [date.toordinal() for date in self._available_dates_home_matches])
 
     @property
     def blocked_dates_matches(self):
@@ -42,6 +50,7 @@ class Team:
     def blocked_dates_matches(self, value):
         # TODO: Proper error handling and sorting
         self._blocked_dates_matches = sorted(value)
+        self._blocked_dates_matches_set = frozenset(self._blocked_dates_matches)
 
     @property
     def please_dont_play_dates(self):
@@ -51,48 +60,44 @@ class Team:
     def please_dont_play_dates(self, value):
         # TODO: Proper error handling and sorting
         self._please_dont_play_dates = sorted(value)
+        self._please_dont_play_dates_set = frozenset(self._please_dont_play_dates)
+
+    def is_home_match_date(self, date):
+        return date in self._available_dates_home_matches_set
+
+    def is_blocked_date(self, date):
+        return date in self._blocked_dates_matches_set
+
+    def is_please_dont_play_date(self, date):
+        return date in self._please_dont_play_dates_set
 
     def add_home_match_date(self, date, opponent):
-        self._check_for_consecutive_match(date)
-        if date in self._please_dont_play_dates:
-            self._scheduled_please_dont_play_dates += 1
-        self._dates_matches.append(["H", date, opponent])
-        self._dates_home_matches.append([date, opponent])
-        self._total_home_matches += 1
-        self._total_matches += 1
+        self._add_match_date(date, opponent, "H")
 
     def add_away_match_date(self, date, opponent):
-        self._check_for_consecutive_match(date)
-        if date in self._please_dont_play_dates:
-            self._scheduled_please_dont_play_dates += 1
-        self._dates_matches.append(["A", date, opponent])
-        self._dates_away_matches.append([date, opponent])
-        self._total_away_matches += 1
-        self._total_matches += 1
-
-    def _check_for_consecutive_match(self, date_new):
-        try:
-            last_match = self._dates_matches[-1][1]
-            diff = date_new - last_match
-            if diff.days <= 1:
-                self._total_consecutive_matches += 1
-        except IndexError:
-            pass
+        self._add_match_date(date, opponent, "A")
+
+    def _add_match_date(self, date, opponent, home_or_away):
+        state = self._schedule_state
+        if date in self._please_dont_play_dates_set:
+            state.please_dont_play_hits[self._team_index] += 1
+        state.add_match(self._team_index, date.toordinal(), state.team_index.get(opponent), home_or_away == "H")
+        self._dates_matches.append([home_or_away, date, opponent])
 
     def get_total_consecutive_matches(self):
-        return self._total_consecutive_matches
+        return self._schedule_state.consecutive_matches[self._team_index]
 
     def get_total_home_matches(self):
-        return self._total_home_matches
+        return self._schedule_state.home_matches[self._team_index]
 
     def get_total_away_matches(self):
-        return self._total_away_matches
+        return self._schedule_state.away_matches[self._team_index]
 
     def get_total_matches(self):
-        return self._total_matches
+        return len(self._dates_matches)
 
     def get_total_scheduled_please_dont_play_dates(self):
-        return self._scheduled_please_dont_play_dates
+        return self._schedule_state.please_dont_play_hits[self._team_index]
 
     def get_last_match_date(self):
         try:
@@ -106,22 +111,10 @@ class Team:
         :param current_date: date to compare with
         :return: number of free home match dates after or equal to a given date
         """
-        free_match_days = 0
-        for date in self.available_dates_home_matches:
-            if (date - current_date).days >= 0:
-                free_match_days += 1
-        # print(f"{self.team_name} hat noch {free_match_days} freie Heimspiele")
-        return free_match_days
+        return self._schedule_state.get_free_home_days(self._team_index, current_date.toordinal())
 
     def get_amount_of_matches_until_date(self, date):
-        total_matches = [0, 0]  # H / A
-        for match in self._dates_matches:
-            if match[1] <= date:
-                if match[0] == "H":
-                    total_matches[0] += 1
-                else:
-                    total_matches[1] += 1
-        return total_matches
+        return self._schedule_state.get_matches_until_day(self._team_index, date.toordinal())  # H / A
 
     def get_list_of_opponents(self, home_or_away="all"):
         """
@@ -137,8 +130,25 @@ class Team:
                 opponents.append(match[2])
         return opponents
 
+    def has_match_against(self, opponent, home_or_away="all"):
+        """
+        Checks if a match against an opponent is already scheduled, same as opponent in get_list_of_opponents()
+        :param opponent: name of the opponent
+        :param home_or_away: checks all, only home matches or only away matches: 'all', 'H', or 'A'
+        :return: True if there is a matching scheduled match
+        """
+        state = self._schedule_state
+        opponent_index = state.team_index.get(opponent)
+        if opponent_index is None:
+            return opponent in self.get_list_of_opponents(home_or_away)
+        if home_or_away == "H":
+            return state.has_hosted(self._team_index, opponent_index)
+        if home_or_away == "A":
+            return state.has_hosted(opponent_index, self._team_index)
+        return state.has_hosted(self._team_index, opponent_index) or state.has_hosted(opponent_index, self._team_index)
+
     def get_date_of_match_nr(self, match_nr):
-        if match_nr >= self._total_matches or match_nr < 0:  # Starting at 0 ?!
+        if match_nr >= len(self._dates_matches) or match_nr < 0:  # Starting at 0 ?!
             return None
         return self._dates_matches[match_nr][1]
 
@@ -147,16 +157,4 @@ class Team:
         get the distribution of home and away matches. The return value represents the most uneven distribution
         :return: distribution factor of home and away matches
         """
-        max_outlier = 0
-        curr_outlier = 0
-        for match in self._dates_matches:
-            if match[0] == "H":
-                curr_outlier += 1
-                if abs(curr_outlier) > max_outlier:
-                    max_outlier = abs(curr_outlier)
-            if match[0] == "A":
-                curr_outlier -= 1
-                if abs(curr_outlier) > max_outlier:
-                    max_outlier = abs(curr_outlier)
-        return max_outlier
-
+        return self._schedule_state.max_outlier[self._team_index]
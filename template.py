@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import datetime
+from matching import maximum_matching
+from scoring import ScoreEngine
+from utils import convert_date_string_to_datetime
+
+# Numbers of template rounds which may be played at the same time, tried one after the other
+ROUND_WINDOWS = (2, 4, None)
+
+
+class TemplateError(Exception):
+    pass
+
+
+def circle_method_rounds(num_teams):
+    """
+    Rounds of a single round robin with the circle method as in the Berger tables. The last team stays fixed while the
+    others rotate, home and away alternate from round to round, so that every team has at most one break (two home or
+    two away matches in a row).
+    :param num_teams: number of teams, for an odd number every team has a round without match
+    :return: list of rounds, each a list of (home, away) team indices
+    """
+    num_slots = num_teams + num_teams % 2  # the slot num_teams of an odd league is the team without match
+    fixed = num_slots - 1
+    rounds = []
+    for round_index in range(num_slots - 1):
+        pairs = []
+        opponent = round_index
+        if round_index % 2 == 0:
+            pairs.append((opponent, fixed))
+        else:
+            pairs.append((fixed, opponent))
+        for offset in range(1, num_slots // 2):
+            first = (round_index + offset) % (num_slots - 1)
+            second = (round_index - offset) % (num_slots - 1)
+            pairs.append((first, second) if offset % 2 == 1 else (second, first))
+        rounds.append([(home, away) for home, away in pairs if home < num_teams and away < num_teams])
+    return rounds
+
+
+def solve_template_plan(problem, start_date_sec_round, consecutive_matches, weight, attempts, time_limit=None,
+                        return_on_first=False, rng=random):
+    """
+    Alternative to the randomized create_match_plan which starts with a canonical double round robin: the rounds of
+    circle_method_rounds for a random order of the teams, followed by the same rounds with home and away swapped. The
+    rounds are placed on the match dates in this order, so the balance of home and away matches of the template is
+    kept.
+    :param problem: league parsed from teams.json, see problem.Problem
+    :param start_date_sec_round: first date of the second round as string, empty or invalid for no restriction
+    :param consecutive_matches: [allow, probability] from teams.json, consecutive matches are forbidden if allow is 0
+    :param weight: weights of the score from teams.json
+    :param attempts: number of random team orders to try
+    :param time_limit: seconds after which the best plan found so far is returned, None for no limit
+    :param return_on_first: return the first valid plan
+    :param rng: random number generator
+    :return: match plan and all teams of the best plan
+    :raises TemplateError: if no team order could be placed on the match dates
+    """
+    placement = _TemplatePlacement(problem, start_date_sec_round, consecutive_matches)
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    best_score = None
+    best_fixtures = None
+    for _ in range(attempts):
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        order = list(range(len(problem.team_names)))
+        rng.shuffle(order)
+        fixtures = placement.place(order)
+        if fixtures is None:
+            continue
+        score = ScoreEngine(problem, weight, fixtures).score()
+        if best_score is None or score < best_score:
+            best_score = score
+            best_fixtures = fixtures
+        if return_on_first:
+            break
+    if best_fixtures is None:
+        raise TemplateError("The round robin template does not fit on the match dates")
+    return problem.build_match_plan(best_fixtures)
+
+
+class _TemplatePlacement:
+
+    def __init__(self, problem, start_date_sec_round, consecutive_matches):
+        self.calendar = problem.calendar
+        self.num_teams = len(problem.team_names)
+        self.days = problem.match_date_ordinals
+        self.first_round_end = problem.first_round_end
+        self.allow_consecutive = consecutive_matches[0] != 0
+        try:
+            sec_round_day = convert_date_string_to_datetime(start_date_sec_round).toordinal()
+        except ValueError:
+            sec_round_day = datetime(1970, 1, 1).toordinal()
+        self.sec_round_index = next((k for k, day in enumerate(self.days) if day >= sec_round_day), len(self.days))
+        self.rounds = circle_method_rounds(self.num_teams)
+
+    def place(self, order):
+        """
+        Places the template for a team order on the match dates, see _place_matches. A small window of rounds keeps
+        the order of the template and its balance of home and away matches, larger windows are only tried if the
+        template does not fit otherwise.
+        :param order: team index for every slot of the template
+        :return: list of (date index, home team index, away team index) or None if a match has no date left
+        """
+        for window in ROUND_WINDOWS:
+            fixtures = self._place_template(order, window)
+            if fixtures is not None:
+                return fixtures
+        return None
+
+    def _place_template(self, order, window):
+        open_matches = [(round_index, order[home], order[away])
+                        for round_index, pairs in enumerate(self.rounds) for home, away in pairs]
+        fixtures = []
+        last_date = [None] * self.num_teams  # date index of the last match per team
+        first_round_fixtures = self._place_matches(open_matches, 0, self.first_round_end, True, window, fixtures,
+                                                   last_date)
+        if first_round_fixtures is None:
+            return None
+        start = max(max((fixture[0] for fixture in fixtures), default=-1) + 1, self.sec_round_index)
+        second_round_matches = [(round_index, away, home) for (round_index, _, _), (_, home, away)
+                                in zip(open_matches, first_round_fixtures)]
+        if self._place_matches(second_round_matches, start, len(self.days), False, window, fixtures,
+                               last_date) is None:
+            return None
+        return fixtures
+
+    def _place_matches(self, open_matches, start, end, allow_swap, window, fixtures, last_date):
+        """
+        Places matches date by date. The matches of every date are a matching of the teams: first the open matches in
+        the order of the template rounds, then extended to a maximum matching over all open matches of the window
+        which fit on the date, so that no date is wasted if a round does not fit as a whole. A match of the first
+        round is played with swapped home and away team only if it does not fit otherwise.
+        :param open_matches: (round index, home, away) in the order of the rounds
+        :param start: first date index for the matches
+        :param end: first date index after the last possible date of the matches
+        :param allow_swap: a match may be played with swapped home and away team
+        :param window: number of rounds, starting with the first one with an open match, whose matches may be played,
+                       None for no limit
+        :param fixtures: list of (date index, home team index, away team index), extended by the placed matches
+        :param last_date: date index of the last match per team, updated for the placed matches
+        :return: placed fixtures in the order of open_matches or None if not all matches fit
+        """
+        placed = [None] * len(open_matches)
+        open_indices = list(range(len(open_matches)))
+        for date_index in range(start, end):
+            if not open_indices:
+                break
+            available = [self.calendar.can_play(team, date_index) and
+                         (self.allow_consecutive or last_date[team] is None or
+                          self.days[date_index] - self.days[last_date[team]] > 1)
+                         for team in range(self.num_teams)]
+            last_round = None if window is None else open_matches[open_indices[0]][0] + window
+            # Orientation of every open match which fits on this date
+            fitting = {}
+            for index in open_indices:
+                round_index, home, away = open_matches[index]
+                if last_round is not None and round_index >= last_round:
+                    break
+                if not (available[home] and available[away]):
+                    continue
+                if self.calendar.can_host(home, date_index):
+                    fitting[index] = (home, away)
+                elif allow_swap and self.calendar.can_host(away, date_index):
+                    fitting[index] = (away, home)
+            if not fitting:
+                continue
+
+            match_of_pairing = {}
+            partner = [-1] * self.num_teams
+            adjacency = [[] for _ in range(self.num_teams)]
+            for index, (home, away) in fitting.items():
+                match_of_pairing[frozenset((home, away))] = index
+                adjacency[home].append(away)
+                adjacency[away].append(home)
+                if partner[home] == -1 and partner[away] == -1:
+                    partner[home], partner[away] = away, home
+            partner = maximum_matching(adjacency, partner)
+
+            for team, opponent in enumerate(partner):
+                if opponent > team:
+                    index = match_of_pairing[frozenset((team, opponent))]
+                    home, away = fitting[index]
+                    placed[index] = (date_index, home, away)
+                    fixtures.append(placed[index])
+                    last_date[home] = last_date[away] = date_index
+            open_indices = [index for index in open_indices if placed[index] is None]
+        if open_indices:
+            return None
+        return placed
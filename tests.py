@@ -1,6 +1,56 @@
+import importlib.util
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
 import unittest
+from unittest import mock
 from datetime import datetime
 from utils import convert_date_string_to_datetime, check_for_consecutive_dates
+from problem import Problem
+from team import Team
+from solver import solve_match_plan, InfeasiblePlanError
+from scoring import ScoreEngine
+from evaluate_plan import calculate_score, calculate_scores_batch, match_plan_to_rows, match_plan_to_report, \
+    write_report_csv
+from matching import maximum_matching
+import main
+from main import search_match_plans, search_best_match_plan, run_attempt, MatchPlanError
+from benchmark import generate_league
+from batch import group_leagues_by_venue, remove_booked_venue_dates, schedule_leagues
+from reschedule import read_match_plan_csv, reschedule, keep_played_dates, RescheduleError
+from local_search import improve_match_plan
+from template import circle_method_rounds, solve_template_plan
+import service
+from cache import PlanCache, get_cache_key
+from archive import PlanArchive, ParetoFront, dominates, get_weighted_score
+from instrumentation import RunStats
+
+TEAMS_JSON = {
+    "Team A": {"available_dates_home_matches": ["2023-09-09", "2023-09-02"],
+               "blocked_dates_matches": ["2023-09-16"],
+               "please_dont_play_dates": []},
+    "Team B": {"available_dates_home_matches": ["2023-09-16"],
+               "blocked_dates_matches": ["2023-09-02"],
+               "please_dont_play_dates": []},
+}
+
+# Four teams which are able to host a match on every date
+LEAGUE_DATES = [f"2023-{month:02d}-{day:02d}" for month in (9, 10, 11, 12) for day in (2, 9, 16, 23)]
+LEAGUE_JSON = {f"Team {name}": {"available_dates_home_matches": LEAGUE_DATES,
+                                "blocked_dates_matches": [],
+                                "please_dont_play_dates": []} for name in "ABCD"}
+
+
+# Settings of teams.json for LEAGUE_JSON
+LEAGUE_SETTINGS_JSON = {"teams": LEAGUE_JSON, "max_iterations": 20, "return_on_first_match_plan": False, "seed": 1,
+                        "start_date_first_round": "", "end_date_first_round": "", "start_date_second_round": "",
+                        "general_blocked_dates": [], "consecutive_matches": {"allow": 1, "probability": 50},
+                        "shuffle_matches": {"allow": 0, "shuffle_part": 0},
+                        "weight": {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+                                   "amount_please_dont_play_dates": 1, "distribution_game_days": 1}}
 
 
 class TestDateTime(unittest.TestCase):
@@ -19,5 +69,676 @@ class TestDateTime(unittest.TestCase):
         self.assertFalse(check_for_consecutive_dates(date3, date1))
 
 
+class TestTeam(unittest.TestCase):
+    def test_match_bookkeeping(self):
+        team = Team("Team A", [datetime(2023, 9, 16), datetime(2023, 9, 2), datetime(2023, 9, 9)], [], [])
+        team.add_home_match_date(datetime(2023, 9, 2), "Team B")
+        team.add_away_match_date(datetime(2023, 9, 3), "Team C")
+        team.add_home_match_date(datetime(2023, 9, 9), "Team C")
+        team.add_home_match_date(datetime(2023, 9, 16), "Team D")
+        self.assertEqual(team.get_total_matches(), 4)
+        self.assertEqual(team.get_total_consecutive_matches(), 1)
+        self.assertEqual(team.get_amount_of_matches_until_date(datetime(2023, 9, 9)), [2, 1])
+        self.assertEqual(team.get_free_home_match_days_after_date(datetime(2023, 9, 3)), 2)
+        self.assertEqual(team.get_free_home_match_days_after_date(datetime(2023, 9, 17)), 0)
+        self.assertEqual(team.get_distribution_home_away_matches(), 2)
+        self.assertTrue(team.has_match_against("Team C", home_or_away="A"))
+        self.assertFalse(team.has_match_against("Team B", home_or_away="A"))
+
+    def test_date_membership(self):
+        team = Team("Team A", [datetime(2023, 9, 9), datetime(2023, 9, 2)], [datetime(2023, 9, 16)],
+                    [datetime(2023, 9, 9)])
+        self.assertTrue(team.is_home_match_date(datetime(2023, 9, 2)))
+        self.assertFalse(team.is_home_match_date(datetime(2023, 9, 16)))
+        self.assertTrue(team.is_blocked_date(datetime(2023, 9, 16)))
+        team.add_home_match_date(datetime(2023, 9, 9), "Team B")
+        self.assertEqual(team.get_total_scheduled_please_dont_play_dates(), 1)
+        team.blocked_dates_matches = []
+        self.assertFalse(team.is_blocked_date(datetime(2023, 9, 16)))
+
+    def test_shared_schedule_state(self):
+        all_teams, general_map = Problem(TEAMS_JSON, "").new_attempt()
+        all_teams[0].add_home_match_date(datetime(2023, 9, 9), "Team B")
+        all_teams[1].add_away_match_date(datetime(2023, 9, 9), "Team A")
+        self.assertTrue(all_teams[0].has_match_against("Team B", home_or_away="H"))
+        self.assertTrue(all_teams[1].has_match_against("Team A"))
+        self.assertFalse(all_teams[1].has_match_against("Team A", home_or_away="H"))
+        self.assertEqual(all_teams[1].get_free_home_match_days_after_date(datetime(2023, 9, 9)), 1)
+
+    def test_reassign_home_dates(self):
+        team = Team("Team A", [], [], [])
+        team.available_dates_home_matches = [datetime(2023, 9, 16), datetime(2023, 9, 2)]
+        self.assertEqual(team.get_free_home_match_days_after_date(datetime(2023, 9, 3)), 1)
+        team.available_dates_home_matches = [datetime(2023, 8, 26)]
+        self.assertEqual(team.get_free_home_match_days_after_date(datetime(2023, 8, 1)), 1)
+        self.assertEqual(team.get_free_home_match_days_after_date(datetime(2023, 9, 3)), 0)
+        all_teams, general_map = Problem(TEAMS_JSON, "").new_attempt()
+        all_teams[0].available_dates_home_matches = [datetime(2023, 9, 30)]
+        self.assertTrue(all_teams[0].is_home_match_date(datetime(2023, 9, 30)))
+        self.assertEqual(all_teams[0].get_free_home_match_days_after_date(datetime(2023, 9, 17)), 1)
+        self.assertEqual(all_teams[0].get_free_home_match_days_after_date(datetime(2023, 9, 9)), 1)
+        self.assertEqual(all_teams[1].get_free_home_match_days_after_date(datetime(2023, 9, 1)), 1)
+        self.assertEqual(all_teams[1].get_free_home_match_days_after_date(datetime(2023, 9, 17)), 0)
+
+
+class TestMatching(unittest.TestCase):
+    def test_augments_greedy_matching(self):
+        adjacency = [[1], [0, 2], [1, 3], [2]]
+        self.assertEqual(maximum_matching(adjacency, [-1, 2, 1, -1]), [1, 0, 3, 2])
+
+    def test_odd_cycle(self):
+        # The augmenting path 0-2-1-3-4-5 runs through the triangle 1-2-3
+        adjacency = [[2], [2, 3], [0, 1, 3], [1, 2, 4], [3, 5], [4]]
+        match = maximum_matching(adjacency, [-1, 2, 1, 4, 3, -1])
+        self.assertEqual(match, [2, 3, 0, 1, 5, 4])
+
+    def test_matching_pairing(self):
+        def brute_force_size(adjacency, free):
+            # Number of teams paired by a maximum matching among the free teams
+            if not free:
+                return 0
+            team, others = free[0], free[1:]
+            return max([brute_force_size(adjacency, others)] +
+                       [2 + brute_force_size(adjacency, [other for other in others if other != partner])
+                        for partner in adjacency[team] if partner in others])
+
+        def record(adjacency, partners):
+            match = maximum_matching(adjacency, partners)
+            dates.append((sum(partner != -1 for partner in partners), sum(partner != -1 for partner in match),
+                          brute_force_size(adjacency, list(range(len(adjacency))))))
+            return match
+
+        # Match days on saturday and sunday, consecutive matches are not allowed
+        problem = Problem(generate_league(6, 14, 0.5, 0.05, 0.1, 2), "")
+        plans = []
+        for _ in range(2):
+            dates = []
+            with mock.patch.object(main, 'maximum_matching', side_effect=record):
+                match_plan, all_teams = run_attempt(problem, 0, "", "2023-10-28", [0, 50], [0, 0], "matching")
+            plans.append(problem.encode_match_plan(match_plan))
+        self.assertEqual(plans[0], plans[1])
+        self.assertEqual(get_plan_violations(problem, plans[0], False), [])
+        second_legs = {}
+        for date_index, home, away in plans[0]:
+            second_legs[frozenset((home, away))] = date_index
+        self.assertGreaterEqual(min(problem.match_dates[date_index] for date_index in second_legs.values()),
+                                datetime(2023, 10, 28))
+        # Every date is paired at the size of a maximum matching, also where the greedy pairing left teams unpaired
+        self.assertEqual([paired for _, paired, _ in dates], [maximum for _, _, maximum in dates])
+        self.assertTrue(any(greedy < paired for greedy, paired, _ in dates))
+        self.assertEqual(sum(paired for _, paired, _ in dates), 2 * len(plans[0]))
+
+
+class TestProblem(unittest.TestCase):
+    def test_match_dates(self):
+        problem = Problem(TEAMS_JSON, "2023-09-03")
+        self.assertEqual(problem.match_dates, (datetime(2023, 9, 9), datetime(2023, 9, 16)))
+
+    def test_calendar(self):
+        problem = Problem(TEAMS_JSON, "", ["2023-09-09"], "2023-09-10")
+        self.assertEqual(problem.match_dates, (datetime(2023, 9, 2), datetime(2023, 9, 16)))
+        self.assertEqual(problem.first_round_end, 1)
+        self.assertEqual(problem.home_teams_per_date, ((0,), (1,)))
+        self.assertEqual(problem.away_teams_per_date, ((0,), (1,)))
+        self.assertTrue(problem.calendar.can_host(1, 1))
+        self.assertFalse(problem.calendar.can_play(0, 1))
+
+    def test_general_map(self):
+        problem = Problem(TEAMS_JSON, "")
+        all_teams, general_map = problem.new_attempt()
+        self.assertEqual([entry['datetime'] for entry in general_map],
+                         [datetime(2023, 9, 2), datetime(2023, 9, 9), datetime(2023, 9, 16)])
+        self.assertEqual([team.team_name for team in general_map[0]['home_match']], ["Team A"])
+        self.assertEqual([team.team_name for team in general_map[0]['away_match']], ["Team A"])
+        self.assertEqual([team.team_name for team in general_map[2]['home_match']], ["Team B"])
+        self.assertEqual(all_teams[0].available_dates_home_matches, [datetime(2023, 9, 2), datetime(2023, 9, 9)])
+
+
+class TestSolver(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_infeasible(self):
+        problem = Problem(TEAMS_JSON, "")
+        with self.assertRaises(InfeasiblePlanError):
+            solve_match_plan(problem, "", [1, 50], self.weight)
+
+    def test_optimal_plan(self):
+        teams_json = dict(TEAMS_JSON)
+        teams_json["Team A"] = dict(TEAMS_JSON["Team A"], blocked_dates_matches=[])
+        match_plan, all_teams, optimal = solve_match_plan(Problem(teams_json, ""), "", [1, 50], self.weight)
+        self.assertTrue(optimal)
+        matches = [(entry['datetime'], home.team_name, away.team_name)
+                   for entry in match_plan for home, away in entry['matches']]
+        self.assertEqual(matches, [(datetime(2023, 9, 9), "Team A", "Team B"),
+                                   (datetime(2023, 9, 16), "Team B", "Team A")])
+
+    def test_bounded_visited_states(self):
+        problem = Problem(LEAGUE_JSON, "")
+        match_plan, all_teams, optimal = solve_match_plan(problem, "", [1, 50], self.weight)
+        small_plan, small_teams, small_optimal = solve_match_plan(problem, "", [1, 50], self.weight,
+                                                                  visited_max_bytes=2000)
+        self.assertTrue(optimal and small_optimal)
+        self.assertEqual(calculate_score(self.weight, small_teams, small_plan)[0],
+                         calculate_score(self.weight, all_teams, match_plan)[0])
+
+
+class TestTemplate(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_circle_method(self):
+        for num_teams in (4, 5):
+            rounds = circle_method_rounds(num_teams)
+            pairings = {frozenset(pair) for pairs in rounds for pair in pairs}
+            self.assertEqual(len(pairings), num_teams * (num_teams - 1) // 2)
+            for pairs in rounds:
+                teams = [team for pair in pairs for team in pair]
+                self.assertEqual(len(teams), len(set(teams)))
+
+    def test_one_round_per_date(self):
+        match_plan, all_teams = solve_template_plan(Problem(LEAGUE_JSON, ""), "", [1, 50], self.weight, 10)
+        self.assertEqual([len(entry['matches']) for entry in match_plan], [2] * 6)
+        score, _ = calculate_score(self.weight, all_teams, match_plan)
+        self.assertLessEqual(score, 2)
+
+
+class TestScoreEngine(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 10,
+              "amount_please_dont_play_dates": 100, "distribution_game_days": 1000}
+
+    def test_score_matches_calculate_score(self):
+        teams_json = dict(TEAMS_JSON)
+        teams_json["Team A"] = dict(TEAMS_JSON["Team A"], blocked_dates_matches=[],
+                                    please_dont_play_dates=["2023-09-16"])
+        problem = Problem(teams_json, "")
+        fixtures = [(1, 0, 1), (2, 1, 0)]
+        score_engine = ScoreEngine(problem, self.weight, fixtures)
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        self.assertEqual(score_engine.score(), calculate_score(self.weight, all_teams, match_plan)[0])
+        self.assertEqual(score_engine.score(), 110)
+
+        delta = score_engine.move((2, 1, 0), (2, 0, 1))
+        self.assertEqual(score_engine.metrics(), (0, 2, 1, 0))
+        self.assertEqual(delta, 10)
+
+    def test_random_replaces_match_calculate_score(self):
+        # Match days on saturday and sunday with please don't play dates
+        problem = Problem(generate_league(6, 8, 0.7, 0.1, 0.2, 5), "")
+        num_dates = len(problem.match_dates)
+        rng = random.Random(1)
+        fixtures = []
+        for home in range(6):
+            for away in range(6):
+                if home != away:
+                    fixtures.append((rng.randrange(num_dates), home, away))
+        fixtures = [fixture for index, fixture in enumerate(fixtures)
+                    if not any(other[0] == fixture[0] and set(other[1:]) & set(fixture[1:])
+                               for other in fixtures[:index])]
+        score_engine = ScoreEngine(problem, self.weight, fixtures)
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        score = calculate_score(self.weight, all_teams, match_plan)[0]
+        self.assertEqual(score_engine.score(), score)
+        for step in range(300):
+            busy = {(date_index, team) for date_index, home, away in fixtures for team in (home, away)}
+            index = rng.randrange(len(fixtures))
+            date_index, home, away = fixtures[index]
+            move = rng.randrange(4)
+            if move == 0:
+                new_date_index = rng.randrange(num_dates)
+                if (new_date_index, home) in busy or (new_date_index, away) in busy:
+                    continue
+                old_fixtures, new_fixtures = [fixtures[index]], [(new_date_index, home, away)]
+            elif move == 1:
+                other = rng.randrange(len(fixtures))
+                other_date_index = fixtures[other][0]
+                if other_date_index == date_index or \
+                        any((other_date_index, team) in busy for team in (home, away)) or \
+                        any((date_index, team) in busy for team in fixtures[other][1:]):
+                    continue
+                old_fixtures = [fixtures[index], fixtures[other]]
+                new_fixtures = [(other_date_index, home, away), (date_index,) + fixtures[other][1:]]
+            elif move == 2:
+                old_fixtures, new_fixtures = [fixtures[index]], [(date_index, away, home)]
+            elif rng.random() < 0.5 and len(fixtures) > 1:
+                old_fixtures, new_fixtures = [fixtures[index]], []
+            else:
+                new_fixture = (rng.randrange(num_dates),) + tuple(rng.sample(range(6), 2))
+                if any((new_fixture[0], team) in busy for team in new_fixture[1:]):
+                    continue
+                old_fixtures, new_fixtures = [], [new_fixture]
+            delta = score_engine.replace(old_fixtures, new_fixtures)
+            fixtures = [fixture for fixture in fixtures if fixture not in old_fixtures] + new_fixtures
+            match_plan, all_teams = problem.build_match_plan(fixtures)
+            old_score, score = score, calculate_score(self.weight, all_teams, match_plan)[0]
+            self.assertEqual(score_engine.score(), score, f"step {step}")
+            self.assertEqual(delta, score - old_score, f"step {step}")
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_batch_scores_match_calculate_score(self):
+        teams_json = dict(TEAMS_JSON)
+        teams_json["Team A"] = dict(TEAMS_JSON["Team A"], blocked_dates_matches=[],
+                                    please_dont_play_dates=["2023-09-16"])
+        problem = Problem(teams_json, "")
+        plans = [[(1, 0, 1), (2, 1, 0)], [(0, 0, 1), (2, 1, 0)], [(0, 0, 1), (1, 0, 1)]]
+        expected = []
+        for fixtures in plans:
+            match_plan, all_teams = problem.build_match_plan(fixtures)
+            expected.append(calculate_score(self.weight, all_teams, match_plan)[0])
+        self.assertEqual(list(calculate_scores_batch(self.weight, problem, plans)), expected)
+
+
+class TestSearch(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_replay_attempt_seed(self):
+        problem = Problem(LEAGUE_JSON, "")
+        attempts, best_result, stats, _, _ = search_match_plans(0, 20, 42, problem, "", "", [1, 50], [1, 0.4],
+                                                                "greedy", self.weight, False)
+        self.assertEqual(attempts, 20)
+        self.assertIsNone(stats)
+        match_plan, all_teams = run_attempt(problem, best_result[5], "", "", [1, 50], [1, 0.4], "greedy")
+        self.assertEqual(problem.encode_match_plan(match_plan), problem.encode_match_plan(best_result[2]))
+
+    def test_abort_infeasible_attempt(self):
+        # Team A hosts on 02.09. and 16.09., Team B only on 09.09., the first round has to end on 02.09.
+        teams_json = {"Team A": {"available_dates_home_matches": ["2023-09-02", "2023-09-16"],
+                                 "blocked_dates_matches": [], "please_dont_play_dates": []},
+                      "Team B": {"available_dates_home_matches": ["2023-09-09"],
+                                 "blocked_dates_matches": [], "please_dont_play_dates": []}}
+        match_plan, all_teams = run_attempt(Problem(teams_json, ""), 0, "2023-09-02", "", [1, 50], [1, 0.4], "greedy")
+        self.assertEqual([len(entry['matches']) for entry in match_plan], [1, 1])
+        with self.assertRaises(MatchPlanError) as context:
+            run_attempt(Problem(teams_json, ""), 0, "2023-09-01", "", [1, 50], [1, 0.4], "greedy")
+        self.assertEqual(context.exception.cause, "first_round_deadline")
+        teams_json["Team B"] = dict(teams_json["Team B"], available_dates_home_matches=[])
+        with self.assertRaises(MatchPlanError) as context:
+            run_attempt(Problem(teams_json, ""), 0, "", "", [1, 50], [1, 0.4], "greedy")
+        self.assertEqual(context.exception.cause, "remaining_home_dates")
+
+    def test_stop_on_target_score(self):
+        search_args = (Problem(LEAGUE_JSON, ""), "", "", [1, 50], [1, 0.4], "greedy", self.weight, False)
+        best_result = search_best_match_plan(1000, 1, 7, search_args, False,
+                                             stop_criteria={'target_score': 1000000})
+        self.assertEqual(best_result[4], 0)
+
+    def test_process_pool(self):
+        search_args = (Problem(LEAGUE_JSON, ""), "", "", [1, 50], [1, 0.4], "greedy", self.weight, False)
+        single, pooled = [search_best_match_plan(30, workers, 3, search_args, False) for workers in (1, 2)]
+        self.assertEqual(pooled[0], single[0])
+        self.assertEqual(pooled[4:], single[4:])
+        self.assertEqual(search_args[0].encode_match_plan(pooled[2]), search_args[0].encode_match_plan(single[2]))
+
+    def test_first_plan_independent_of_workers(self):
+        # Most attempts of this league fail, the first plan of seed 5 is found by attempt 11
+        search_args = (Problem(generate_league(6, 12, 0.5, 0.15, 0.1, 2), ""), "", "", [1, 50], [1, 0.4], "greedy",
+                       self.weight, True)
+        results = [search_best_match_plan(40, workers, 5, search_args, True) for workers in (1, 3)]
+        self.assertEqual(results[0][4], 11)
+        self.assertEqual([result[4:] for result in results[1:]], [results[0][4:]])
+        self.assertEqual(search_args[0].encode_match_plan(results[1][2]),
+                         search_args[0].encode_match_plan(results[0][2]))
+
+    def test_instrumentation(self):
+        problem = Problem(TEAMS_JSON, "")
+        attempts, best_result, stats, _, _ = search_match_plans(0, 3, 1, problem, "", "", [1, 50], [1, 0.4],
+                                                                "greedy", self.weight, False, [1, 1])
+        self.assertIsNone(best_result)
+        self.assertEqual(stats.counters['attempts'], 3)
+        self.assertEqual(sum(stats.failures.values()), 3)
+        self.assertEqual(len(stats.profiles), 1)
+
+    def test_archive(self):
+        problem = Problem(LEAGUE_JSON, "")
+        _, best_result, _, batch_archive, _ = search_match_plans(0, 50, 3, problem, "", "", [1, 50], [1, 0.4],
+                                                                 "greedy", self.weight, False, archive_size=5)
+        plans = batch_archive.plans()
+        self.assertEqual(len(plans), 5)
+        self.assertEqual(plans[0][0], best_result[0])
+        self.assertEqual(len({tuple(fixtures) for _, fixtures, _, _ in plans}), 5)
+        self.assertEqual([score for score, _, _, _ in plans], sorted(score for score, _, _, _ in plans))
+        match_plan, all_teams = run_attempt(problem, plans[-1][3], "", "", [1, 50], [1, 0.4], "greedy")
+        self.assertEqual(sorted(problem.encode_match_plan(match_plan)), plans[-1][1])
+
+        merged = PlanArchive(3)
+        for first_iteration in (0, 25):
+            merged.merge(search_match_plans(first_iteration, 25, 3, problem, "", "", [1, 50], [1, 0.4], "greedy",
+                                            self.weight, False, archive_size=5)[3])
+        self.assertEqual(merged.plans(), plans[:3])
+
+    def test_pareto_front(self):
+        problem = Problem(LEAGUE_JSON, "")
+        weight = {"amount_consecutive_matches": 3, "distribution_home_away_matches": 1,
+                  "amount_please_dont_play_dates": 1, "distribution_game_days": 2}
+        _, best_result, _, _, front = search_match_plans(0, 50, 5, problem, "", "", [1, 50], [1, 0.4], "greedy",
+                                                         weight, False, keep_front=True)
+        metrics = [plan_metrics for plan_metrics, _, _, _ in front.plans()]
+        self.assertFalse(any(dominates(first, second) for first in metrics for second in metrics))
+        # The best plan of any weight is part of the front
+        self.assertEqual(min(get_weighted_score(weight, plan_metrics) for plan_metrics in metrics), best_result[0])
+
+        merged = ParetoFront()
+        for first_iteration in (25, 0):
+            merged.merge(search_match_plans(first_iteration, 25, 5, problem, "", "", [1, 50], [1, 0.4], "greedy",
+                                            weight, False, keep_front=True)[4])
+        self.assertEqual([plan[:2] for plan in merged.plans()], [plan[:2] for plan in front.plans()])
+
+    def test_generate_league(self):
+        teams_json = generate_league(6, 10, 0.5, 0.1, 0.1, 3)
+        self.assertEqual(teams_json, generate_league(6, 10, 0.5, 0.1, 0.1, 3))
+        self.assertEqual(len(teams_json), 6)
+        self.assertLessEqual(len(Problem(teams_json, "").match_dates), 20)
+
+
+def get_plan_violations(problem, fixtures, allow_consecutive=True):
+    """
+    :return: rules of a valid match plan which the fixtures break
+    """
+    n = len(problem.team_names)
+    days = problem.match_date_ordinals
+    violations = []
+    busy = [set() for _ in days]
+    legs = {}
+    for date_index, home, away in sorted(fixtures):
+        if home not in problem.home_teams_per_date[date_index]:
+            violations.append(f"{home} has no home date on {date_index}")
+        if away not in problem.away_teams_per_date[date_index]:
+            violations.append(f"{away} is blocked on {date_index}")
+        if home in busy[date_index] or away in busy[date_index]:
+            violations.append(f"second match of {home} or {away} on {date_index}")
+        busy[date_index].update((home, away))
+        legs.setdefault(frozenset((home, away)), []).append((date_index, home))
+    if len(fixtures) != n * (n - 1) or any(len(pairing) != 2 or pairing[0][1] == pairing[1][1]
+                                           for pairing in legs.values()):
+        violations.append("not every team hosts every other team once")
+    else:
+        first_legs = [min(pairing)[0] for pairing in legs.values()]
+        second_legs = [max(pairing)[0] for pairing in legs.values()]
+        if max(first_legs) >= min(second_legs) or max(first_legs) >= problem.first_round_end:
+            violations.append("first and second round overlap")
+    if not allow_consecutive:
+        for k in range(1, len(days)):
+            if days[k] - days[k - 1] <= 1 and busy[k] & busy[k - 1]:
+                violations.append(f"consecutive matches on {k - 1} and {k}")
+    return violations
+
+
+class TestLocalSearch(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_improved_plan_stays_valid(self):
+        # Match days on saturday and sunday, consecutive matches are not allowed
+        problem = Problem(generate_league(6, 14, 0.7, 0.05, 0.1, 1), "")
+        _, best_result, _, _, _ = search_match_plans(0, 50, 1, problem, "", "", [0, 50], [1, 0.4], "greedy",
+                                                     self.weight, False)
+        self.assertEqual(get_plan_violations(problem, problem.encode_match_plan(best_result[2]), False), [])
+        fixtures = []
+        for seed in (1, 1, 2):
+            match_plan, all_teams, score = improve_match_plan(problem, best_result[2], self.weight, "", [0, 50], 0,
+                                                              random.Random(seed), max_steps=2000)
+            fixtures.append(problem.encode_match_plan(match_plan))
+            self.assertEqual(get_plan_violations(problem, fixtures[-1], False), [])
+            self.assertEqual(score, calculate_score(self.weight, all_teams, match_plan)[0])
+            self.assertLessEqual(score, best_result[0])
+        # The same seed and number of steps give the same plan
+        self.assertEqual(fixtures[0], fixtures[1])
+
+
+class TestReport(unittest.TestCase):
+    @unittest.skipUnless(importlib.util.find_spec("pandas"), "pandas is not installed")
+    def test_csv_matches_pandas(self):
+        problem = Problem(LEAGUE_JSON, "")
+        rounds = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+        fixtures = [(k, home, away) for k, pairs in enumerate(rounds) for home, away in pairs] + \
+                   [(k + 3, away, home) for k, pairs in enumerate(rounds) for home, away in pairs]
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "spielplan.csv")
+            write_report_csv(filename, match_plan_to_rows(match_plan, all_teams))
+            pandas_filename = os.path.join(folder, "pandas.csv")
+            match_plan_to_report(match_plan, all_teams).to_csv(pandas_filename, sep=';')
+            with open(filename, 'rb') as file, open(pandas_filename, 'rb') as pandas_file:
+                self.assertEqual(file.read(), pandas_file.read())
+
+
+class TestReschedule(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_only_blocked_match_is_moved(self):
+        problem = Problem(LEAGUE_JSON, "")
+        rounds = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+        fixtures = [(k, home, away) for k, pairs in enumerate(rounds) for home, away in pairs] + \
+                   [(k + 3, away, home) for k, pairs in enumerate(rounds) for home, away in pairs]
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        teams_json = dict(LEAGUE_JSON)
+        teams_json["Team D"] = dict(LEAGUE_JSON["Team D"], blocked_dates_matches=["2023-10-09"])
+        new_problem = Problem(teams_json, "")
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "spielplan.csv")
+            write_report_csv(filename, match_plan_to_rows(match_plan, all_teams))
+            matches = read_match_plan_csv(filename, new_problem)
+        self.assertEqual(matches[0], (datetime(2023, 9, 2), 0, 1))
+        new_fixtures, score, changes = reschedule(new_problem, matches, self.weight, "", [1, 50], time_budget=0.1)
+        self.assertEqual([change[:3] for change in changes], [[3, 0, datetime(2023, 10, 9)]])
+        moved = [index for index, (old, new) in enumerate(zip(fixtures, new_fixtures)) if old != new]
+        self.assertEqual(moved, [10])
+        self.assertGreater(new_fixtures[10][0], 5)
+
+    def test_played_dates_stay_free(self):
+        rounds = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+        fixtures = [(k, home, away) for k, pairs in enumerate(rounds) for home, away in pairs] + \
+                   [(k + 8, away, home) for k, pairs in enumerate(rounds) for home, away in pairs]
+        # Team D is blocked on 02.11., Team C prefers not to play after 16.11., so the free dates up to 23.10.
+        # would give a better score
+        teams_json = dict(LEAGUE_JSON)
+        teams_json["Team D"] = dict(LEAGUE_JSON["Team D"], blocked_dates_matches=["2023-11-02"])
+        teams_json["Team C"] = dict(LEAGUE_JSON["Team C"], please_dont_play_dates=LEAGUE_DATES[11:])
+        problem = Problem(teams_json, "")
+        matches = [(problem.match_dates[date_index], home, away) for date_index, home, away in fixtures]
+        played_until = datetime(2023, 10, 23)
+        for seed in range(5):
+            new_fixtures, _, changes = reschedule(problem, matches, self.weight, "", [1, 50], played_until, 0,
+                                                  random.Random(seed), max_steps=500)
+            self.assertEqual(len(changes), 1)
+            for (date_index, _, _), (new_date_index, _, _) in zip(fixtures, new_fixtures):
+                if problem.match_dates[date_index] > played_until:
+                    self.assertGreater(problem.match_dates[new_date_index], played_until)
+
+    def test_played_date_removed(self):
+        problem = Problem(LEAGUE_JSON, "")
+        rounds = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+        fixtures = [(k, home, away) for k, pairs in enumerate(rounds) for home, away in pairs] + \
+                   [(k + 3, away, home) for k, pairs in enumerate(rounds) for home, away in pairs]
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        # Team A removed its played home date 02.09., 09.09. became a general blocked date and Team B blocked 16.09.
+        parsed_json = dict(LEAGUE_SETTINGS_JSON, start_date_first_round="2023-09-10",
+                           general_blocked_dates=["2023-09-09"], teams=dict(LEAGUE_JSON))
+        parsed_json["teams"]["Team A"] = dict(LEAGUE_JSON["Team A"], available_dates_home_matches=LEAGUE_DATES[1:])
+        parsed_json["teams"]["Team B"] = dict(LEAGUE_JSON["Team B"], blocked_dates_matches=["2023-09-16"])
+        new_problem = Problem(parsed_json["teams"], parsed_json["start_date_first_round"],
+                              parsed_json["general_blocked_dates"])
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "spielplan.csv")
+            write_report_csv(filename, match_plan_to_rows(match_plan, all_teams))
+            matches = read_match_plan_csv(filename, new_problem)
+        self.assertEqual(matches, [(problem.match_dates[k], home, away) for k, home, away in fixtures])
+        played_until = datetime(2023, 9, 16)
+        with self.assertRaises(RescheduleError):
+            reschedule(new_problem, matches, self.weight, "", [1, 50], played_until, 0, max_steps=100)
+        keep_played_dates(parsed_json, new_problem, matches, played_until)
+        self.assertEqual(parsed_json["general_blocked_dates"], [])
+        self.assertEqual(LEAGUE_JSON["Team A"]["available_dates_home_matches"], LEAGUE_DATES)
+        new_problem = Problem(parsed_json["teams"], parsed_json["start_date_first_round"],
+                              parsed_json["general_blocked_dates"])
+        new_fixtures, _, changes = reschedule(new_problem, matches, self.weight, "", [1, 50], played_until, 0,
+                                              max_steps=100)
+        self.assertEqual(changes, [])
+        self.assertEqual([new_problem.match_dates[k] for k, _, _ in new_fixtures[:6]],
+                         [match_date for match_date, _, _ in matches[:6]])
+
+    def test_match_plan_year(self):
+        # Season from December to March, the December home dates were removed from the updated teams.json
+        dates = [f"{year}-{month:02d}-{day:02d}" for year, month in ((2023, 12), (2024, 1), (2024, 2), (2024, 3))
+                 for day in (2, 9, 16)]
+        teams_json = {f"Team {name}": {"available_dates_home_matches": dates, "blocked_dates_matches": [],
+                                       "please_dont_play_dates": []} for name in "ABCD"}
+        problem = Problem(teams_json, "")
+        rounds = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+        fixtures = [(k, home, away) for k, pairs in enumerate(rounds) for home, away in pairs] + \
+                   [(k + 3, away, home) for k, pairs in enumerate(rounds) for home, away in pairs]
+        match_plan, all_teams = problem.build_match_plan(fixtures)
+        new_problem = Problem({name: dict(team, available_dates_home_matches=dates[3:])
+                               for name, team in teams_json.items()}, "")
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "spielplan.csv")
+            write_report_csv(filename, match_plan_to_rows(match_plan, all_teams))
+            matches = read_match_plan_csv(filename, new_problem)
+        self.assertEqual([match_date for match_date, _, _ in matches],
+                         [problem.match_dates[k] for k, _, _ in fixtures])
+
+
+class TestCache(unittest.TestCase):
+    weight = {"amount_consecutive_matches": 1, "distribution_home_away_matches": 1,
+              "amount_please_dont_play_dates": 1, "distribution_game_days": 1}
+
+    def test_cache_key(self):
+        parsed_json = {"teams": TEAMS_JSON, "weight": self.weight, "start_date_second_round": ""}
+        reordered = {"start_date_second_round": "", "weight": dict(self.weight, distribution_game_days=5),
+                     "teams": {name: dict(team, available_dates_home_matches=team["available_dates_home_matches"][::-1])
+                               for name, team in TEAMS_JSON.items()}}
+        self.assertEqual(get_cache_key(parsed_json), get_cache_key(reordered))
+        self.assertNotEqual(get_cache_key(parsed_json), get_cache_key(dict(parsed_json, start_date_second_round="x")))
+        key = get_cache_key(parsed_json)
+        with mock.patch('cache.CACHE_VERSION', 0):
+            self.assertNotEqual(get_cache_key(parsed_json), key)
+
+    def test_rescore_and_evict(self):
+        problem = Problem(LEAGUE_JSON, "")
+        match_plan, all_teams = solve_template_plan(problem, "", [1, 50], self.weight, 1)
+        score, report = calculate_score(self.weight, all_teams, match_plan)
+        parsed_json = {"teams": LEAGUE_JSON, "weight": self.weight}
+        with tempfile.TemporaryDirectory() as folder:
+            cache = PlanCache(folder, 10 ** 6)
+            self.assertIsNone(cache.get(parsed_json, problem, self.weight))
+            cache.put(parsed_json, problem, [[score, report, match_plan, all_teams, 0, 1]])
+            heavy_weight = dict(self.weight, distribution_home_away_matches=100)
+            cached = cache.get(parsed_json, problem, heavy_weight)
+            self.assertEqual(sorted(problem.encode_match_plan(cached[2])),
+                             sorted(problem.encode_match_plan(match_plan)))
+            self.assertEqual(cached[0], calculate_score(heavy_weight, all_teams, match_plan)[0])
+            PlanCache(folder, 0).put(dict(parsed_json, seed=1), problem, [[score, report, match_plan, all_teams, 0, 1]])
+            self.assertEqual(os.listdir(folder), [])
+
+    def test_hit_fills_archive_and_front(self):
+        parsed_json = dict(LEAGUE_SETTINGS_JSON, cache={"allow": 1, "max_size_mb": 1})
+        problem = Problem(LEAGUE_JSON, "")
+        settings = main.read_settings(parsed_json)
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(main, 'get_executable_location',
+                                                                        return_value=folder):
+            plans = []
+            for run in range(2):
+                run_stats = RunStats()
+                archive = PlanArchive(3, os.path.join(folder, f"spielplaene_top_{run}.ndjson"))
+                front = ParetoFront(os.path.join(folder, f"pareto_front_{run}.ndjson"))
+                # The second run is a cache hit and must not search again
+                with mock.patch.object(main, 'schedule_league', wraps=main.schedule_league) as schedule_league:
+                    best_result = main.schedule_league_with_cache(parsed_json, problem, settings, run_stats,
+                                                                  archive=archive, front=front)
+                self.assertEqual(schedule_league.call_count, 1 - run)
+                self.assertEqual(run_stats.to_dict()['cache_hit'], run == 1)
+                self.assertTrue(os.path.exists(archive.filename) and os.path.exists(front.filename))
+                plans.append((best_result[0], archive.plans(), front.plans()))
+        self.assertEqual(plans[1], plans[0])
+
+
+class TestService(unittest.TestCase):
+    def test_run_job(self):
+        parsed_json = LEAGUE_SETTINGS_JSON
+        service._event_queue = queue.Queue()
+        self.addCleanup(setattr, service, "_event_queue", None)
+        service.run_job("1", parsed_json)
+        job = service.Job("1")
+        while not service._event_queue.empty():
+            job.add_event(service._event_queue.get()[1])
+        events = [event['event'] for event in job.iter_events()]
+        self.assertEqual(events[:2], ["queued", "started"])
+        self.assertEqual(events[-1], "done")
+        self.assertIn("best", events)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(len(job.result['matches']), 12)
+        self.assertEqual(job.result['csv'].count("-vs-"), 12)
+
+    def test_limit_run_time(self):
+        limited = service.limit_run_time(dict(LEAGUE_SETTINGS_JSON, max_iterations=0), 60)
+        self.assertEqual((limited['stop_criteria']['time_limit'], limited['solver_time_limit']), (60, 60))
+        limited = service.limit_run_time(dict(LEAGUE_SETTINGS_JSON, stop_criteria={"time_limit": 5}), 60)
+        self.assertEqual(limited['stop_criteria'], {"time_limit": 5})
+        self.assertNotIn("stop_criteria", LEAGUE_SETTINGS_JSON)
+
+    def test_cancel_job(self):
+        # Without the cancellation the search of the job would run for an hour
+        parsed_json = service.limit_run_time(dict(LEAGUE_SETTINGS_JSON, max_iterations=0), 3600)
+        service._event_queue = queue.Queue()
+        self.addCleanup(setattr, service, "_event_queue", None)
+        cancel_event = threading.Event()
+        timer = threading.Timer(0.5, cancel_event.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        service.run_job("1", parsed_json, cancel_event)
+        service.run_job("2", parsed_json, cancel_event)
+        jobs = {"1": service.Job("1"), "2": service.Job("2")}
+        while not service._event_queue.empty():
+            job_id, event = service._event_queue.get()
+            jobs[job_id].add_event(event)
+        self.assertEqual([event['event'] for event in jobs["1"].iter_events()][-1], "cancelled")
+        self.assertEqual(len(jobs["1"].result['matches']), 12)
+        # A job which is cancelled before it starts does not search at all
+        self.assertEqual([event['event'] for event in jobs["2"].iter_events()], ["queued", "cancelled"])
+        self.assertIsNone(jobs["2"].result)
+
+
+class TestBatch(unittest.TestCase):
+    def test_group_leagues_by_venue(self):
+        leagues = {"a": {"Team A": {}, "Team B": {"venue": "Halle 1"}},
+                   "b": {"Team C": {"venue": "Halle 1"}},
+                   "c": {"Team D": {}},
+                   "d": {"Team A": {}}}
+        with tempfile.TemporaryDirectory() as folder:
+            league_files = []
+            for name, teams in leagues.items():
+                league_files.append(os.path.join(folder, f"{name}.json"))
+                with open(league_files[-1], 'w') as file:
+                    json.dump({"teams": teams}, file)
+            groups = group_leagues_by_venue(league_files)
+        self.assertEqual([[os.path.basename(path) for path in group] for group in groups],
+                         [["a.json", "b.json", "d.json"], ["c.json"]])
+
+    def test_failed_leagues(self):
+        with tempfile.TemporaryDirectory() as folder:
+            league_files = [os.path.join(folder, f"{name}.json") for name in ("missing", "broken", "exact", "no_teams")]
+            with open(league_files[1], 'w') as file:
+                file.write("{")
+            # The exact solver fails on the incomplete weight, after teams.json was read successfully
+            with open(league_files[2], 'w') as file:
+                json.dump(dict(LEAGUE_SETTINGS_JSON, solver="exact", weight={"amount_consecutive_matches": 1}), file)
+            with open(league_files[3], 'w') as file:
+                json.dump({"max_iterations": 1}, file)
+            self.assertEqual(group_leagues_by_venue(league_files), [[path] for path in league_files])
+            rows = schedule_leagues(league_files, os.path.join(folder, "spielplaene"), 1)
+        self.assertEqual([row[:3] for row in rows], [["missing", 0, "Fehler"], ["broken", 0, "Fehler"],
+                                                     ["exact", 4, "Fehler"], ["no_teams", 0, "Fehler"]])
+
+    def test_remove_booked_venue_dates(self):
+        parsed_json = {"teams": {"Team A": {"available_dates_home_matches": ["2023-09-02", "2023-09-09"]},
+                                 "Team B": {"venue": "Halle 1",
+                                            "available_dates_home_matches": ["2023-09-02", "2023-09-09"]}}}
+        remove_booked_venue_dates(parsed_json, {"Halle 1": {"2023-09-09"}})
+        self.assertEqual(parsed_json["teams"]["Team A"]["available_dates_home_matches"], ["2023-09-02", "2023-09-09"])
+        self.assertEqual(parsed_json["teams"]["Team B"]["available_dates_home_matches"], ["2023-09-02"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -56,3 +56,12 @@ def get_executable_location():
         logging.info("matchmaker_core is running native Python")
         application_path = os.path.dirname(__file__)
     return application_path
+
+
+def format_table(rows, headers):
+    """
+    Formats rows as text table with an index column, similar to printing a pandas DataFrame
+    """
+    table = [[""] + list(headers)] + [[str(index)] + [str(value) for value in row] for index, row in enumerate(rows)]
+    widths = [max(len(line[column]) for line in table) for column in range(len(table[0]))]
+    return "\n".join("  ".join(value.rjust(width) for value, width in zip(line, widths)).rstrip() for line in table)